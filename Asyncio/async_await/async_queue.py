@@ -14,22 +14,63 @@ def switch():
 
 
 class AsyncQueue:
-    def __init__(self):
+    def __init__(self, maxsize=0):
         self.items = deque()
-        self.waiting = deque()
+        self.maxsize = maxsize      # 0 - no limit
+        self.waiting = deque()      # Getters waiting for data
+        self.putters = deque()      # Putters waiting for free space
+
+    def full(self):
+        return 0 < self.maxsize <= len(self.items)
 
     async def put(self, item):
+        while self.full():
+            self.putters.append(sched.current)   # Wait for free space
+            sched.current = None
+            await switch()
+
         self.items.append(item)
         if self.waiting:
             sched.ready.append(self.waiting.popleft())
 
     async def get(self):
-        if not self.items:
+        while not self.items:
             self.waiting.append(sched.current)   # Put myself to sleep
             sched.current = None        # "Disappear"
             await switch()              # Switch to another task
 
-        return self.items.popleft()
+        item = self.items.popleft()
+        if self.putters:
+            sched.ready.append(self.putters.popleft())
+        return item
+
+    async def put_many(self, items):
+        items = list(items)
+        start = 0
+        while start < len(items):
+            while self.full():
+                self.putters.append(sched.current)
+                sched.current = None
+                await switch()
+
+            end = len(items) if not self.maxsize else start + self.maxsize - len(self.items)
+            batch = items[start:end]
+            self.items.extend(batch)
+            start += len(batch)
+            # One wakeup per waiting getter, a getter with get_many() takes the whole batch
+            for _ in range(min(len(batch), len(self.waiting))):
+                sched.ready.append(self.waiting.popleft())
+
+    async def get_many(self, n):
+        while not self.items:
+            self.waiting.append(sched.current)
+            sched.current = None
+            await switch()
+
+        batch = [self.items.popleft() for _ in range(min(n, len(self.items)))]
+        for _ in range(min(len(batch), len(self.putters))):
+            sched.ready.append(self.putters.popleft())
+        return batch
 
 
 aq = AsyncQueue()
@@ -55,9 +96,10 @@ async def consumer(q):
     print('Consumer done')
 
 
-sched.new_task(producer(aq, 10))
-sched.new_task(consumer(aq))
-sched.run()
+if __name__ == '__main__':
+    sched.new_task(producer(aq, 10))
+    sched.new_task(consumer(aq))
+    sched.run()
 
 
 """
@@ -88,4 +130,13 @@ sched.run()
 
     Идея заключается в том, что при отсутствии данных, вызов потребителя откладывается на более поздний
     момент, когда производитель положит данные в очередь.
+
+    maxsize - Ограничение размера очереди. Если очередь заполнена, то производитель в put() не кладет элемент, а
+    засыпает в очереди ожидающих производителей(putters), так же как потребитель засыпает в get() при пустой очереди.
+    Потребитель, забрав элемент, будит одного ожидающего производителя. Так быстрый производитель не может
+    заполнить всю память, а вынужден ждать, пока потребитель освободит место(backpressure). Производитель и потребитель
+    после пробуждения еще раз проверяют очередь в цикле while, так как место или элемент мог забрать кто то другой.
+
+    put_many(items) - Кладет сразу пачку элементов, а get_many(n) - забирает до n элементов за раз. Вместо того чтобы
+    будить потребителя на каждый элемент, на всю пачку приходится одно пробуждение и одно переключение задач.
 """
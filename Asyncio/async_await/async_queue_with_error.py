@@ -25,8 +25,10 @@ class AsyncQueue:
 
     def close(self):
         self._closed = True
-        if self.waiting and not self.items:
-            sched.ready.append(self.waiting.popleft())  # Reschedule waiting tasks
+        # Wake every waiting getter at once: those that find an item take it,
+        # the rest see an empty closed queue and raise QueueClosed
+        sched.ready.extend(self.waiting)
+        self.waiting.clear()
 
     async def put(self, item):
         if self._closed:
@@ -69,9 +71,10 @@ async def consumer(q):
         print('Consumer done')
 
 
-sched.new_task(producer(aq, 10))
-sched.new_task(consumer(aq))
-sched.run()
+if __name__ == '__main__':
+    sched.new_task(producer(aq, 10))
+    sched.new_task(consumer(aq))
+    sched.run()
 
 
 """
@@ -89,4 +92,12 @@ sched.run()
     работает в случае пустой очереди, не доходя до строки возвращения результата(return self.items.popleft()). В этой
     новой итерации он проверят не закрыта ли очередь, если закрыта, то выбрасывает исключение QueueClosed, которое
     перехватывает потребитель.
-"""
\ No newline at end of file
+
+    close() будит сразу всех ожидающих геттеров, а не одного. Раньше будился только первый, а остальные потребители
+    навсегда оставались в self.waiting: их корутины никогда не завершались и не освобождали память. Все ожидающие
+    переносятся в очередь планировщика одним вызовом sched.ready.extend(), без цикла по одному.
+
+    Если к моменту закрытия в очереди еще есть элементы, то они не теряются: разбуженный геттер сначала проверяет
+    self.items и забирает элемент, и только если очередь пуста, выбрасывает QueueClosed. Так потребители сначала
+    разбирают оставшиеся элементы, а затем все завершаются.
+"""
@@ -0,0 +1,60 @@
+import time
+
+from async_queue import AsyncQueue, sched
+
+
+ITEMS = 200000
+MAXSIZE = 1000
+BATCH = 100
+
+
+async def producer(q, batched):
+    if batched:
+        for start in range(0, ITEMS, BATCH):
+            await q.put_many(range(start, start + BATCH))
+    else:
+        for n in range(ITEMS):
+            await q.put(n)
+    await q.put(None)
+
+
+async def consumer(q, batched, received):
+    while True:
+        items = await q.get_many(BATCH) if batched else [await q.get()]
+        for item in items:
+            if item is None:
+                return
+            received.append(item)
+
+
+def measure(batched):
+    q = AsyncQueue(maxsize=MAXSIZE)
+    received = []
+    sched.new_task(producer(q, batched))
+    sched.new_task(consumer(q, batched, received))
+    start = time.perf_counter()
+    sched.run()
+    elapsed = time.perf_counter() - start
+    assert received == list(range(ITEMS))
+    return ITEMS / elapsed
+
+
+def main():
+    print(f'{ITEMS} items through a queue of maxsize={MAXSIZE}')
+    per_item = measure(batched=False)
+    batched = measure(batched=True)
+    print(f'{"put/get":>20} {per_item:>12.0f} items/s')
+    print(f'{"put_many/get_many":>20} {batched:>12.0f} items/s  (batch {BATCH}, x{batched / per_item:.1f})')
+
+
+if __name__ == '__main__':
+    main()
+
+
+"""
+    Бенчмарк пропускной способности ограниченной очереди AsyncQueue: производитель и потребитель передают ITEMS
+    элементов через очередь размером MAXSIZE.
+
+    put/get - по одному элементу, на каждый элемент приходится переключение задач и пробуждение ожидающей стороны.
+    put_many/get_many - пачками по BATCH элементов, одно пробуждение на пачку.
+"""
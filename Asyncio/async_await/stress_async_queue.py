@@ -0,0 +1,58 @@
+import time
+from collections import Counter
+
+from async_queue_with_error import AsyncQueue, QueueClosed, sched
+
+
+CONSUMERS = 10000
+ITEMS = 5000        # Left in the queue at close(), must be drained before consumers stop
+
+
+async def consumer(q, received, done):
+    try:
+        while True:
+            received.append(await q.get())
+            await sched.sleep(0)
+    except QueueClosed:
+        done.append(True)
+
+
+async def producer(q):
+    await sched.sleep(0)    # Let every consumer park in get() first
+    for n in range(ITEMS):
+        await q.put(n)
+    q.close()
+
+
+def main():
+    q = AsyncQueue()
+    received = []
+    done = []
+    for _ in range(CONSUMERS):
+        sched.new_task(consumer(q, received, done))
+    sched.new_task(producer(q))
+
+    start = time.perf_counter()
+    sched.run()
+    elapsed = time.perf_counter() - start
+
+    assert len(done) == CONSUMERS, f'{CONSUMERS - len(done)} consumers still waiting'
+    assert not q.waiting
+    assert Counter(received) == Counter(range(ITEMS)), 'items lost or delivered twice'
+    print(f'{CONSUMERS} consumers, {ITEMS} items drained, all consumers done in {elapsed:.3f}s')
+
+
+if __name__ == '__main__':
+    main()
+
+
+"""
+    Нагрузочная проверка close() в AsyncQueue из async_queue_with_error.py.
+
+    CONSUMERS потребителей ждут данных на пустой очереди. Производитель кладет ITEMS элементов и сразу закрывает
+    очередь, так что в момент close() часть элементов еще лежит в очереди, а потребители ждут в self.waiting.
+
+    Проверяется, что:
+    все потребители завершились через QueueClosed и никто не остался висеть в self.waiting
+    каждый элемент получен ровно один раз, то есть оставшиеся элементы были разобраны до завершения потребителей
+"""
@@ -0,0 +1,138 @@
+import multiprocessing
+import resource
+import socket
+import time
+
+import io_scheduler
+from io_scheduler import Scheduler, accept_queue
+
+
+CONNECTIONS = 10000
+TIMEOUT = 30.0      # Give up on a run after this many seconds
+
+
+def raise_nofile():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted = CONNECTIONS + 256
+    if soft < wanted:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (min(wanted, hard), hard))
+
+
+def listen_overflows():
+    # Connections the kernel dropped because an accept queue was full, Linux only
+    try:
+        with open('/proc/net/netstat') as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return None
+    for names, values in zip(lines[::2], lines[1::2]):
+        if names.startswith('TcpExt:'):
+            return dict(zip(names.split()[1:], map(int, values.split()[1:]))).get('ListenOverflows')
+    return None
+
+
+def client(addr, done):
+    # Opens every connection at once, without waiting for any of them to finish
+    raise_nofile()
+    socks = []
+    for _ in range(CONNECTIONS):
+        sock = socket.socket()
+        sock.setblocking(False)
+        sock.connect_ex(addr)
+        socks.append(sock)
+    done.wait(TIMEOUT + 5)
+    for sock in socks:
+        sock.close()
+
+
+async def one_by_one(sched, sock, count):
+    while count[0] < CONNECTIONS:
+        client, _ = await sched.accept(sock)
+        count.append(client)
+        count[0] += 1
+
+
+async def batched(sched, sock, count):
+    while count[0] < CONNECTIONS:
+        for client, _ in await sched.accept_many(sock, 64):
+            count.append(client)
+            count[0] += 1
+
+
+def measure(name, server, backlog):
+    sched = io_scheduler.sched = Scheduler()
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    sock.listen(backlog)
+    sock.setblocking(False)
+
+    count = [0]
+    depth = [0]
+
+    def sample():
+        queue = accept_queue(sock)
+        if queue is not None and queue[0] > depth[0]:
+            depth[0] = queue[0]
+        if count[0] < CONNECTIONS:
+            sched.call_later(0.001, sample)
+
+    def give_up():
+        count[0] = CONNECTIONS      # Ends the server loop on its next wakeup
+        sched.poller.discard(sock)
+
+    overflows = listen_overflows()
+    done = multiprocessing.Event()
+    process = multiprocessing.Process(target=client, args=(sock.getsockname(), done))
+    task = sched.new_task(server(sched, sock, count))
+    sched.call_soon(sample)
+    timer = sched.call_later(TIMEOUT, give_up)
+    task.add_done_callback(lambda task: timer.cancel())
+
+    start = time.perf_counter()
+    process.start()
+    sched.run()
+    elapsed = time.perf_counter() - start
+
+    accepted = len(count) - 1
+    done.set()
+    process.join()
+    for conn in count[1:]:
+        conn.close()
+    sock.close()
+    dropped = listen_overflows()
+    dropped = '-' if overflows is None else dropped - overflows
+    print(f'{name:>12} {backlog:>8} {accepted:>9} {elapsed:>8.2f} {depth[0]:>10} '
+          f'{sched.stats["max_accept_batch"]:>10} {dropped:>10}')
+
+
+def main():
+    raise_nofile()
+    print(f'{CONNECTIONS} connections opened at once')
+    print(f'{"":>12} {"backlog":>8} {"accepted":>9} {"seconds":>8} {"max queue":>10} '
+          f'{"max batch":>10} {"overflows":>10}')
+    measure('one by one', one_by_one, 1)
+    measure('one by one', one_by_one, 4096)
+    measure('batched', batched, 4096)
+
+
+if __name__ == '__main__':
+    main()
+
+
+"""
+    Бенчмарк приема всплеска подключений.
+
+    Клиент в отдельном процессе открывает CONNECTIONS соединений разом, не дожидаясь завершения ни одного из них, а
+    сервер принимает их и выводит:
+    accepted - Сколько соединений принято за TIMEOUT секунд
+    seconds - За сколько они приняты
+    max queue - Наибольшая глубина очереди подключений(accept_queue()), замеренная раз в миллисекунду
+    max batch - Наибольшее количество соединений, принятых за одно пробуждение(sched.stats['max_accept_batch'])
+    overflows - Сколько раз ядро отбросило соединение из за переполненной очереди(ListenOverflows из
+    /proc/net/netstat, счетчик общий для всей системы)
+
+    one by one, backlog 1 - Как было в tcp_server: очередь длиной 1 и один accept() на пробуждение. Почти все
+    соединения отбрасываются ядром и клиент повторяет попытку только через секунду и больше
+    one by one, backlog 4096 - Очередь вмещает всплеск, но на каждое соединение уходит полный круг цикла
+    batched - sched.accept_many(): до 64 соединений за одно пробуждение
+"""
@@ -0,0 +1,98 @@
+import json
+import time
+
+import io_scheduler
+from compression import Compressor
+from http_parser import RequestParser
+from http_server import Response
+from io_scheduler import Scheduler, gather
+
+
+def users(count):
+    # What JSONRenderer().render from DRF/1_encode_decode.py produces for a list of users
+    return json.dumps([{'id': n, 'first_name': f'User {n}', 'last_name': 'Ivanov', 'email': f'user{n}@example.com',
+                        'is_active': n % 7 != 0} for n in range(count)]).encode()
+
+
+def request(accept_encoding):
+    head = b'GET /users/ HTTP/1.1\r\nAccept-Encoding: %s\r\n\r\n' % accept_encoding.encode()
+    return RequestParser().parse(bytearray(head))
+
+
+def cpu_per_request(compressor, req, body, seconds=0.5):
+    sched = io_scheduler.sched = Scheduler()
+    result = []
+
+    async def run():
+        count = 0
+        start = time.process_time()
+        while time.process_time() - start < seconds:
+            response = await compressor.compress(req, Response(body, content_type='application/json'))
+            count += 1
+        result.append(((time.process_time() - start) / count * 1e6, len(response.body)))
+
+    sched.new_task(run())
+    sched.run()
+    return result[0]
+
+
+def loop_lag(offload_size, body, requests=20):
+    # How long the loop could not serve anything else while requests big bodies were compressed at once
+    sched = io_scheduler.sched = Scheduler()
+    compressor = Compressor(None, offload_size=offload_size)
+    req = request('gzip')
+    lag = [0.0]
+    done = []
+
+    async def ticker():
+        while not done:
+            start = time.perf_counter()
+            await sched.sleep(0.001)
+            lag[0] = max(lag[0], time.perf_counter() - start - 0.001)
+
+    async def compress_all():
+        await gather(*[compressor.compress(req, Response(body, content_type='application/json'))
+                       for _ in range(requests)])
+        done.append(True)
+
+    sched.new_task(ticker())
+    task = sched.new_task(compress_all())
+    start = time.perf_counter()
+    sched.run()
+    task.result()
+    return lag[0] * 1000, time.perf_counter() - start
+
+
+def main():
+    print(f'{"body":>8} {"encoding":>10} {"bytes":>9} {"ratio":>6} {"cpu, us":>9}')
+    for rows in (5, 100, 1000, 10000):
+        body = users(rows)
+        for label, accept, level in [('identity', 'identity', 6), ('gzip -1', 'gzip', 1), ('gzip -6', 'gzip', 6),
+                                     ('gzip -9', 'gzip', 9), ('deflate -6', 'deflate', 6)]:
+            cpu, size = cpu_per_request(Compressor(None, level=level), request(accept), body)
+            print(f'{len(body):>8} {label:>10} {size:>9} {len(body) / size:>6.1f} {cpu:>9.1f}')
+
+    body = users(10000)
+    print(f'\n20 bodies of {len(body) // 1024} KB compressed at once, the loop has a 1 ms timer running')
+    print(f'{"":>10} {"max loop lag, ms":>17} {"total, s":>9}')
+    for label, offload_size in [('inline', None), ('offloaded', 65536)]:
+        lag, total = loop_lag(offload_size, body)
+        print(f'{label:>10} {lag:>17.1f} {total:>9.2f}')
+
+
+if __name__ == '__main__':
+    main()
+
+
+"""
+    Сравнение размера ответа и процессорного времени на сжатие.
+
+    Тела - JSON списки пользователей разного размера, как их отдает JSONRenderer. Для каждого выводится размер
+    тела после сжатия(bytes), во сколько раз оно меньше(ratio) и процессорное время на один ответ(cpu, us).
+    identity - без сжатия. Тело меньше minimum_size(1 КБ) не сжимается ни при каком Accept-Encoding.
+    gzip -N - Уровень сжатия N. Уровень 1 сжимает чуть хуже, но в несколько раз быстрее 9.
+
+    Вторая часть - задержка цикла событий. 20 больших тел сжимаются одновременно, а таймер раз в миллисекунду
+    замеряет, насколько позже срока он проснулся. inline - тела сжимаются прямо в цикле, и пока сжимается одно тело,
+    цикл стоит. offloaded - тела от 64 КБ сжимаются в пуле потоков, цикл продолжает работать.
+"""
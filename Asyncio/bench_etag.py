@@ -0,0 +1,85 @@
+import json
+import time
+
+import io_scheduler
+from etag import BodyETag, conditional, versions
+from http_parser import RequestParser
+from http_server import HTTPServer, Response
+from io_scheduler import Scheduler
+
+
+USERS = {n: {'id': n, 'first_name': f'User {n}', 'last_name': 'Ivanov', 'email': f'user{n}@example.com'}
+         for n in range(1000)}
+POLLS = 2000
+WRITE_EVERY = 100   # One write to the users between this many polls
+
+
+async def user_list(request):
+    # Like the list action of UserViewSet: query and serialize every user on each GET
+    return Response(json.dumps(list(USERS.values())), content_type='application/json')
+
+
+def update_user(n):
+    USERS[n]['first_name'] += '!'
+    versions.bump('users')
+
+
+def poll(handler):
+    sched = io_scheduler.sched = Scheduler()
+    server = HTTPServer(handler)
+    result = {'bytes': 0, '200': 0, '304': 0}
+
+    async def run():
+        etag = None
+        for n in range(POLLS):
+            if n and n % WRITE_EVERY == 0:
+                update_user(n % len(USERS))
+            head = b'GET /users/ HTTP/1.1\r\nHost: localhost\r\n'
+            if etag is not None:
+                head += b'If-None-Match: %s\r\n' % etag.encode()
+            request = RequestParser().parse(bytearray(head + b'\r\n'))
+
+            response = await server.handler(request)
+            out = bytearray()
+            server._write_head(out, response, request, True)
+            result['bytes'] += len(out) + (0 if response.status == 304 else len(response.body))
+            result[str(response.status)] += 1
+            etag = response.headers.get('ETag', etag)
+
+    sched.new_task(run())
+    start = time.process_time()
+    sched.run()
+    result['cpu'] = (time.process_time() - start) / POLLS * 1e6
+    return result
+
+
+def main():
+    print(f'{POLLS} polls of a 1000 user list, a write every {WRITE_EVERY} polls')
+    print(f'{"":>22} {"200":>5} {"304":>5} {"KB sent":>9} {"cpu per poll, us":>17}')
+    for label, handler in [('no ETag', user_list),
+                           ('hash of the body', BodyETag(user_list)),
+                           ('version counter', conditional('users')(user_list))]:
+        result = poll(handler)
+        print(f'{label:>22} {result["200"]:>5} {result["304"]:>5} {result["bytes"] / 1024:>9.0f} '
+              f'{result["cpu"]:>17.1f}')
+
+
+if __name__ == '__main__':
+    main()
+
+
+"""
+    Сравнение повторного опроса(polling) списка пользователей без ETag, с ETag по хешу тела и с ETag по счетчику
+    версий модели.
+
+    Клиент POLLS раз запрашивает список из 1000 пользователей и присылает в If-None-Match метку из последнего ответа.
+    Раз в WRITE_EVERY запросов один пользователь меняется, и версия модели users увеличивается.
+
+    no ETag - Каждый запрос - это выборка, сериализация и полное тело.
+    hash of the body - Выборка и сериализация на каждый запрос, плюс хеш тела, но если метка совпала, то тело не
+    отправляется(304). Экономятся байты, но не процессор.
+    version counter - Метка проверяется по счетчику версий до вызова обработчика, поэтому на 304 нет ни выборки, ни
+    сериализации. Обработчик выполняется только после записи.
+
+    KB sent - Заголовки и тела всех ответов. cpu per poll - Процессорное время на один запрос без разбора запроса.
+"""
@@ -0,0 +1,81 @@
+import hashlib
+import time
+
+import io_scheduler
+from io_scheduler import Scheduler
+
+
+INTERVAL = 0.01     # The ticker wants to run every 10 ms
+TICKS = 200
+JOBS = 200
+
+
+def blocking_io():
+    time.sleep(0.05)     # DNS lookup, file read...
+
+
+def hash_password():
+    return hashlib.pbkdf2_hmac('sha256', b'password', b'salt', 20000)
+
+
+async def ticker(sched, lateness):
+    for _ in range(TICKS):
+        start = time.monotonic()
+        await sched.sleep(INTERVAL)
+        lateness.append(time.monotonic() - start - INTERVAL)
+
+
+async def inline_jobs(sched):
+    for _ in range(JOBS // 10):
+        blocking_io()           # Blocks the whole loop
+        await sched.sleep(0)
+
+
+async def thread_job(sched):
+    await sched.run_in_executor(blocking_io)
+
+
+async def process_job(sched):
+    await sched.run_in_process(hash_password)
+
+
+def measure(name, make_jobs):
+    sched = io_scheduler.sched = Scheduler()
+    lateness = []
+    sched.new_task(ticker(sched, lateness))
+    for job in make_jobs(sched):
+        sched.new_task(job)
+    start = time.monotonic()
+    sched.run()
+    elapsed = time.monotonic() - start
+
+    lateness.sort()
+    p50 = lateness[len(lateness) // 2] * 1e3
+    p99 = lateness[int(len(lateness) * 0.99)] * 1e3
+    print(f'{name:>24} {p50:>8.2f} {p99:>8.2f} {lateness[-1] * 1e3:>8.2f} {elapsed:>8.2f}')
+
+
+def main():
+    print(f'{"":>24} {"p50 ms":>8} {"p99 ms":>8} {"max ms":>8} {"total s":>8}')
+    measure('idle loop', lambda sched: [])
+    measure('blocking in the loop', lambda sched: [inline_jobs(sched)])
+    measure('thread pool saturated', lambda sched: [thread_job(sched) for _ in range(JOBS)])
+    measure('process pool saturated', lambda sched: [process_job(sched) for _ in range(JOBS)])
+
+
+if __name__ == '__main__':
+    main()
+
+
+"""
+    Бенчмарк задержки цикла событий при нагрузке на пул потоков и пул процессов.
+
+    Корутина ticker хочет просыпаться каждые INTERVAL секунд и записывает, насколько она опоздала. Рядом с ней
+    запускаются блокирующие задачи:
+    blocking in the loop - блокирующий вызов прямо в корутине, весь цикл стоит, пока он выполняется
+    thread pool saturated - JOBS блокирующих вызовов через sched.run_in_executor(), их больше, чем потоков в пуле
+    process pool saturated - JOBS вычислений(хэширование пароля) через sched.run_in_process()
+
+    Выводятся медиана, 99-й перцентиль и максимум опоздания ticker в миллисекундах. Пока работа вынесена в пул, опоздание
+    остается близким к простаивающему циклу, а блокирующий вызов в цикле задерживает ticker на все время вызова.
+"""
@@ -0,0 +1,89 @@
+import time
+
+from http_parser import RequestParser
+
+
+TINY = b'GET / HTTP/1.1\r\nHost: localhost\r\n\r\n'
+LARGE = (b'GET /api/items?page=2 HTTP/1.1\r\nHost: localhost\r\n' +
+         b''.join(b'X-Header-%d: value number %d\r\n' % (n, n) for n in range(1000)) + b'\r\n')
+SEGMENT = 1460      # Bytes per recv(), the payload of one TCP segment
+
+
+def split_parse(buf):
+    # The straightforward way: wait for the whole head, then split it into lines and every line into name and value
+    end = buf.find(b'\r\n\r\n')
+    if end < 0:
+        return None
+    lines = bytes(buf[:end]).split(b'\r\n')
+    method, target, version = lines[0].decode('latin-1').split(' ')
+    headers = {}
+    for line in lines[1:]:
+        name, _, value = line.partition(b':')
+        headers[name.decode('latin-1').lower()] = value.strip().decode('latin-1')
+    return method, target, version, headers
+
+
+def use_split(data, pieces):
+    buf = bytearray()
+    for piece in pieces:
+        buf += piece
+        request = split_parse(buf)
+        if request is not None:
+            return request[0], request[3].get('host')
+
+
+def use_offsets(data, pieces):
+    buf = bytearray()
+    parser = RequestParser()
+    for piece in pieces:
+        buf += piece
+        request = parser.parse(buf)
+        if request is not None:
+            return request.method, request.headers.get('host')
+
+
+def measure(parse, data, pieces, seconds=1.0):
+    count = 0
+    start = time.perf_counter()
+    while True:
+        for _ in range(100):
+            parse(data, pieces)
+        count += 100
+        elapsed = time.perf_counter() - start
+        if elapsed >= seconds:
+            return elapsed / count * 1e6
+
+
+def main():
+    print(f'{"request":>22} {"split, us":>10} {"offsets, us":>12} {"speedup":>8}')
+    for name, data in [('tiny', TINY), ('1k headers', LARGE)]:
+        for how, pieces in [('whole', [data]),
+                            (f'{SEGMENT} byte recv()s', [data[n:n + SEGMENT] for n in range(0, len(data), SEGMENT)])]:
+            assert use_split(data, pieces) == use_offsets(data, pieces) == ('GET', 'localhost')
+            split = measure(use_split, data, pieces)
+            offsets = measure(use_offsets, data, pieces)
+            label = f'{name}, {how}' if len(pieces) == 1 else f'{name}, {len(pieces)} recv()s'
+            print(f'{label:>22} {split:>10.2f} {offsets:>12.2f} {split / offsets:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
+
+
+"""
+    Сравнение разбора заголовков через split(b'\\r\\n') и через смещения(http_parser.RequestParser).
+
+    Оба разбирают запрос и читают метод и заголовок Host - так делает обычный обработчик, которому нужна пара полей из
+    всех заголовков.
+    tiny - Минимальный запрос с одним заголовком.
+    1k headers - Запрос с 1000 заголовков(около 30 КБ).
+    whole - Запрос пришел целиком одним recv().
+    N recv()s - Запрос пришел по SEGMENT байт. split_parse при каждом новом куске заново ищет конец заголовков с начала
+    буфера, а RequestParser продолжает поиск с того места, где остановился.
+
+    На запросе из 1000 заголовков split создает по несколько объектов bytes и str на каждый заголовок, а RequestParser
+    проходит по ним только find() и регулярными выражениями на C и создает одну строку для Host. На маленьком запросе
+    RequestParser медленнее на несколько микросекунд: время уходит не на разбор, а на объекты Request и вызовы методов
+    на Python. В сервере(bench_http_server.py) это не заметно, так как он не копирует и не удаляет разобранные запросы
+    из буфера.
+"""
@@ -0,0 +1,110 @@
+import multiprocessing
+import os
+import select
+import socket
+import sys
+import time
+
+import io_scheduler
+from http_server import HTTPServer, hello
+
+
+DURATION = 3.0
+REQUEST = b'GET / HTTP/1.1\r\nHost: localhost\r\n\r\n'
+
+
+def server(port, ready):
+    sock = socket.socket()
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(('127.0.0.1', port))
+    sock.listen(1024)
+    ready.set()
+    http = HTTPServer(hello)
+
+    async def serve():
+        while True:
+            for client, _ in await io_scheduler.sched.accept_many(sock):
+                io_scheduler.sched.new_task(http.handle(client))
+
+    io_scheduler.sched.new_task(serve())
+    io_scheduler.sched.run()
+
+
+def load(addr, connections, depth, results):
+    # Like wrk: every connection keeps depth requests in flight, each response is answered with a new request.
+    # All responses of hello() have the same size, so they are counted by size instead of being parsed
+    socks = [socket.create_connection(addr) for _ in range(connections)]
+    socks[0].sendall(REQUEST)
+    first = b''
+    while b'\r\n\r\n' not in first:
+        first += socks[0].recv(65536)
+    head, _, _ = first.partition(b'\r\n\r\n')
+    size = len(head) + 4 + int(head.lower().split(b'content-length: ')[1].split(b'\r\n')[0])
+
+    batch = REQUEST * depth
+    for sock in socks:
+        sock.sendall(batch)
+    pending = {sock.fileno(): 0 for sock in socks}      # Received bytes of incomplete responses
+    poll = select.epoll()
+    by_fd = {}
+    for sock in socks:
+        poll.register(sock, select.EPOLLIN)
+        by_fd[sock.fileno()] = sock
+
+    done = 0
+    deadline = time.perf_counter() + DURATION
+    while time.perf_counter() < deadline:
+        for fd, _ in poll.poll(0.1):
+            received = pending[fd] + len(by_fd[fd].recv(262144))
+            count, pending[fd] = divmod(received, size)
+            done += count
+            if count:
+                by_fd[fd].sendall(REQUEST * count)
+    results.put(done)
+    for sock in socks:
+        sock.close()
+
+
+def run(port, clients, connections, depth):
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=load, args=(('127.0.0.1', port), connections, depth, results))
+                 for _ in range(clients)]
+    for process in processes:
+        process.start()
+    done = sum(results.get() for _ in processes)
+    for process in processes:
+        process.join()
+    return done / DURATION
+
+
+def main():
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 18080
+    ready = multiprocessing.Event()
+    process = multiprocessing.Process(target=server, args=(port, ready), daemon=True)
+    process.start()
+    ready.wait()
+
+    print(f'{cores} cores, {DURATION:.0f}s per run, the load generator shares the cores with the server')
+    print(f'{"clients":>8} {"conns":>6} {"depth":>6} {"req/s":>10} {"req/s/core":>11}')
+    for clients, connections, depth in [(1, 1, 1), (1, 50, 1), (1, 50, 16), (2, 100, 1), (2, 100, 16)]:
+        rate = run(port, clients, connections, depth)
+        print(f'{clients:>8} {connections * clients:>6} {depth:>6} {rate:>10.0f} {rate / cores:>11.0f}')
+    process.terminate()
+
+
+if __name__ == '__main__':
+    main()
+
+
+"""
+    Нагрузочный тест HTTP сервера, похожий на wrk.
+
+    Сервер(HTTPServer с обработчиком hello) запускается в отдельном процессе, нагрузка - в clients процессах, у каждого
+    по connections соединений. В каждом соединении одновременно отправлено depth запросов(depth > 1 - это pipelining),
+    и на каждый пришедший ответ сразу отправляется новый запрос. Ответы hello() все одного размера, поэтому они не
+    разбираются, а считаются по количеству принятых байт.
+
+    Выводится количество запросов в секунду всего и на одно ядро. Нагрузка работает на тех же ядрах, что и сервер,
+    поэтому на одной машине результат занижен, настоящую нагрузку лучше подавать с другой машины.
+"""
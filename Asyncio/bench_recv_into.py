@@ -0,0 +1,108 @@
+import contextlib
+import io
+import multiprocessing
+import socket
+import time
+import tracemalloc
+
+import io_scheduler
+from io_scheduler import Scheduler, echo_handler
+
+
+REQUESTS = 20000
+
+
+async def copying_echo_handler(sock):
+    # echo_handler as it was before recv_into()
+    sched = io_scheduler.sched
+    while True:
+        data = await sched.recv(sock, 65536)
+        if not data:
+            break
+        data = b'Got:' + data
+        while data:
+            sent = await sched.send(sock, data)
+            data = data[sent:]
+    sock.close()
+
+
+def client(sock, size):
+    message = b'x' * size
+    for _ in range(REQUESTS):
+        sock.sendall(message)
+        left = size + 4
+        while left:
+            left -= len(sock.recv(left))
+    sock.close()
+
+
+def trace_receives(sched):
+    # Both handlers wait for the next message once the previous answer is sent and released, so between two
+    # receive calls lies one request: the peak of traced memory since the previous call is what it allocated
+    allocated = [0]
+    last = [tracemalloc.get_traced_memory()[0]]
+
+    def traced(receive):
+        def wrapper(*args):
+            current, peak = tracemalloc.get_traced_memory()
+            allocated[0] += peak - last[0]
+            tracemalloc.reset_peak()
+            last[0] = current
+            return receive(*args)
+        return wrapper
+
+    sched.recv = traced(sched.recv)
+    sched._readable = traced(sched._readable)       # echo_handler waits for data before it takes a buffer
+    return allocated
+
+
+def measure(name, handler, size):
+    sched = io_scheduler.sched = Scheduler()
+    ours, theirs = socket.socketpair()
+    process = multiprocessing.Process(target=client, args=(theirs, size))
+    process.start()
+    theirs.close()
+
+    sched.new_task(handler(ours))
+    tracemalloc.start()
+    allocated = trace_receives(sched)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):     # echo_handler prints 'Connection closed'
+        sched.run()
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    process.join()
+
+    print(f'{name:>10} {size:>8} {allocated[0] / REQUESTS:>12.0f} {peak / 1024:>10.1f} {REQUESTS / elapsed:>10.0f}')
+
+
+def main():
+    print(f'{REQUESTS} echo requests')
+    print(f'{"":>10} {"size":>8} {"alloc B/req":>12} {"peak KiB":>10} {"req/s":>10}')
+    for size in (64, 4096, 60000):
+        measure('recv', copying_echo_handler, size)
+        measure('recv_into', echo_handler, size)
+
+
+if __name__ == '__main__':
+    main()
+
+
+"""
+    Бенчмарк echo_handler с recv_into() и пулом буферов против старого варианта с recv() и склеиванием b'Got:' + data.
+
+    Клиент в отдельном процессе отправляет REQUESTS сообщений размером size и ждет ответ на каждое. Выводится:
+    alloc B/req - Сколько байт выделяется на один запрос, замер по tracemalloc. Оба обработчика ждут следующее
+    сообщение, когда ответ на предыдущее отправлен и освобожден, поэтому между двумя вызовами recv()(_readable() у
+    echo_handler) проходит один запрос. trace_receives() подменяет их у sched и при каждом вызове берет пик памяти с прошлого
+    вызова, а затем сбрасывает его(tracemalloc.reset_peak()). Сумма пиков делится на количество запросов.
+    recv(65536) сначала создает объект bytes на 65536 байт и только потом уменьшает его до размера пришедших данных,
+    а склеивание создает еще один(size + 4 байта), поэтому у старого обработчика это 64 КБ даже на маленьких
+    сообщениях и 2 * size на больших. recv_into() пишет в буфер из пула, а ответ отправляется срезом
+    memoryview этого буфера, поэтому остаются только мелкие объекты(memoryview, корутины) в сотни байт, не зависящие
+    от size
+    peak KiB - Пик памяти, выделенной за время работы, по tracemalloc. Пул буферов создается вместе с планировщиком
+    до запуска tracemalloc, поэтому в пике его нет, а видны только временные объекты на каждое сообщение
+    req/s - Запросов в секунду
+"""
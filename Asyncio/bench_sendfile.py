@@ -0,0 +1,101 @@
+import multiprocessing
+import os
+import resource
+import socket
+import sys
+import tempfile
+import time
+
+import io_scheduler
+from io_scheduler import Scheduler
+
+
+SIZE = int(sys.argv[1]) if len(sys.argv) > 1 else 1024     # File size in MB
+CHUNK = 65536
+
+
+async def read_send(sched, sock, file):
+    sock.setblocking(False)
+    sent = 0
+    while True:
+        data = file.read(CHUNK)
+        if not data:
+            break
+        while data:
+            n = await sched.send(sock, data)
+            data = data[n:]
+            sent += n
+    return sent
+
+
+async def sendfile(sched, sock, file):
+    return await sched.sendfile(sock, file)
+
+
+async def mmap_send(sched, sock, file):
+    return await sched._sendfile_mmap(sock, file, 0, os.fstat(file.fileno()).st_size)
+
+
+def client(sock, server_sock):
+    server_sock.close()     # Inherited through fork, EOF never comes while it is open
+    buf = bytearray(1 << 20)
+    while sock.recv_into(buf):
+        pass
+
+
+def measure(name, serve, path):
+    sched = io_scheduler.sched = Scheduler()
+    ours, theirs = socket.socketpair()
+    process = multiprocessing.Process(target=client, args=(theirs, ours))
+    process.start()
+    theirs.close()
+
+    with open(path, 'rb') as file:
+        task = sched.new_task(serve(sched, ours, file))
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        start = time.perf_counter()
+        sched.run()
+        elapsed = time.perf_counter() - start
+        after = resource.getrusage(resource.RUSAGE_SELF)
+    ours.close()
+    process.join()
+
+    assert task.result() == SIZE * 2 ** 20
+    user = after.ru_utime - usage.ru_utime
+    system = after.ru_stime - usage.ru_stime
+    print(f'{name:>10} {SIZE / elapsed:>10.0f} {user:>8.2f} {system:>8.2f} {(user + system) / elapsed * 100:>7.0f}%')
+
+
+def main():
+    with tempfile.NamedTemporaryFile() as file:
+        block = os.urandom(2 ** 20)
+        for _ in range(SIZE):
+            file.write(block)
+        file.flush()
+
+        print(f'{SIZE} MB file, server process CPU time')
+        print(f'{"":>10} {"MB/s":>10} {"user s":>8} {"sys s":>8} {"CPU":>8}')
+        measure('read/send', read_send, file.name)
+        measure('sendfile', sendfile, file.name)
+        measure('mmap/send', mmap_send, file.name)
+
+
+if __name__ == '__main__':
+    main()
+
+
+"""
+    Бенчмарк отдачи файла через sched.sendfile() против цикла file.read() и sched.send().
+
+    Создается временный файл размером SIZE мегабайт(1 ГБ по умолчанию, размер можно передать первым аргументом:
+    python bench_sendfile.py 256), и сервер отправляет его клиенту в отдельном процессе, который читает и выбрасывает
+    данные. Выводится пропускная способность и процессорное время серверного процесса в пространстве пользователя(user)
+    и в ядре(sys), а также загрузка процессора.
+
+    read/send - Данные читаются кусками по CHUNK байт в память процесса и отправляются send(). Каждый кусок копируется
+    дважды: из страничного кэша в bytes и из bytes в буфер сокета
+    sendfile - os.sendfile(), ядро копирует данные из страничного кэша прямо в сокет
+    mmap/send - Запасной вариант sched.sendfile(): send() срезов отображенного в память файла, без read()
+
+    Файл только что записан, поэтому он целиком лежит в страничном кэше и чтение с диска не мешает сравнению.
+"""
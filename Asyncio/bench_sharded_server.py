@@ -0,0 +1,77 @@
+import multiprocessing
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+
+PORT = 30100
+CLIENTS = 8          # Client processes, each with CONNECTIONS open connections
+CONNECTIONS = 4
+DURATION = 3.0
+
+
+def client(port, results):
+    socks = [socket.create_connection(('127.0.0.1', port)) for _ in range(CONNECTIONS)]
+    count = 0
+    deadline = time.monotonic() + DURATION
+    while time.monotonic() < deadline:
+        for sock in socks:
+            sock.send(b'ping')
+        for sock in socks:
+            sock.recv(100)
+        count += len(socks)
+    for sock in socks:
+        sock.close()
+    results.put(count)
+
+
+def measure(workers, port):
+    server = subprocess.Popen(
+        [sys.executable, 'sharded_server.py', str(workers), str(port)],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        stdout=subprocess.DEVNULL,
+    )
+    time.sleep(1.0)     # Let the workers bind
+
+    results = multiprocessing.Queue()
+    clients = [multiprocessing.Process(target=client, args=(port, results)) for _ in range(CLIENTS)]
+    for process in clients:
+        process.start()
+    total = sum(results.get() for _ in clients)
+    for process in clients:
+        process.join()
+
+    server.send_signal(signal.SIGTERM)
+    server.wait()
+    return total / DURATION
+
+
+def main():
+    cores = os.cpu_count()
+    counts = sorted({1, 2, 4, cores} & set(range(1, cores + 1)))
+    base = None
+    print(f'{cores} cores, {CLIENTS * CONNECTIONS} connections')
+    print(f'{"workers":>8} {"req/s":>10} {"speedup":>8}')
+    for n, workers in enumerate(counts):
+        rate = measure(workers, PORT + n)
+        base = base or rate
+        print(f'{workers:>8} {rate:>10.0f} {rate / base:>8.2f}')
+
+
+if __name__ == '__main__':
+    main()
+
+
+"""
+    Бенчмарк масштабирования sharded_server.py по ядрам процессора.
+
+    Для разного количества воркеров(1, 2, 4 и по количеству ядер) запускается сервер, к нему подключаются CLIENTS
+    клиентских процессов по CONNECTIONS соединений и в течении DURATION секунд отправляют запросы и ждут ответы.
+    Выводится количество запросов в секунду и ускорение относительно одного воркера.
+
+    Клиенты сами занимают процессор, поэтому честный результат получается, когда клиенты запущены на другой машине
+    или на машине ядер больше, чем воркеров.
+"""
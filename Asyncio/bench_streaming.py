@@ -0,0 +1,99 @@
+import http.client
+import json
+import multiprocessing
+import resource
+import socket
+import time
+
+import io_scheduler
+from http_server import HTTPServer, Response, StreamingResponse
+
+
+def users(count):
+    # Stands in for User.objects.all(): rows are produced one at a time
+    for n in range(count):
+        yield {'id': n, 'first_name': f'User {n}', 'last_name': 'Ivanov', 'email': f'user{n}@example.com'}
+
+
+async def buffered(request, count):
+    # Like UserAPIView.get in DRF/2_serializer.py: the whole list is serialized, then sent
+    return Response(json.dumps(list(users(count))), content_type='application/json')
+
+
+async def streamed(request, count):
+    async def body():
+        yield '['
+        for n, user in enumerate(users(count)):
+            yield (',' if n else '') + json.dumps(user)
+        yield ']'
+    return StreamingResponse(body(), content_type='application/json')
+
+
+def server(sock, handler, count, report):
+    # Serves one request and reports how much memory the process needed
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    http = HTTPServer(lambda request: handler(request, count))
+
+    async def serve_one():
+        client, _ = await io_scheduler.sched.accept(sock)
+        await http.handle(client)
+
+    io_scheduler.sched.new_task(serve_one())
+    io_scheduler.sched.run()
+    report.send((before, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))
+
+
+def measure(handler, count):
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    sock.listen(1)
+    receive, report = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(target=server, args=(sock, handler, count, report))
+    process.start()
+
+    start = time.perf_counter()
+    connection = http.client.HTTPConnection(*sock.getsockname())
+    connection.request('GET', '/users/', headers={'Connection': 'close'})
+    response = connection.getresponse()
+    size = 0
+    last = b''
+    while True:
+        data = response.read(65536)
+        if not data:
+            break
+        size += len(data)
+        last = data
+    elapsed = time.perf_counter() - start
+    connection.close()
+    assert last.endswith(b'}]'), 'response is incomplete'
+
+    before, peak = receive.recv()
+    process.join()
+    sock.close()
+    return response.getheader('Transfer-Encoding') or 'length', size, elapsed, (peak - before) / 1024
+
+
+def main():
+    print(f'{"":>9} {"rows":>9} {"framing":>8} {"MB":>7} {"seconds":>8} {"server peak, MB":>16}')
+    for count in (10_000, 100_000, 1_000_000):
+        for name, handler in [('buffered', buffered), ('streamed', streamed)]:
+            framing, size, elapsed, peak = measure(handler, count)
+            print(f'{name:>9} {count:>9} {framing:>8} {size / 2 ** 20:>7.1f} {elapsed:>8.2f} {peak:>16.1f}')
+
+
+if __name__ == '__main__':
+    main()
+
+
+"""
+    Сравнение памяти сервера при отправке большого JSON списка целиком и потоком.
+
+    buffered - Как UserAPIView.get из DRF/2_serializer.py: строится список всех строк, он сериализуется в одну строку
+    JSON, и ответ отправляется с Content-Length. Память растет вместе с количеством строк.
+    streamed - StreamingResponse: асинхронный генератор отдает строки по одной, сервер собирает их в куски по
+    stream_chunk байт и отправляет с Transfer-Encoding: chunked, дожидаясь writer.drain(), если клиент не успевает
+    читать. Память не зависит от количества строк.
+
+    Сервер запускается в отдельном процессе на каждый замер и обслуживает один запрос. server peak - насколько вырос
+    пиковый размер памяти процесса(ru_maxrss) за время запроса. Клиент - http.client, он сам разбирает chunked.
+"""
@@ -0,0 +1,98 @@
+import multiprocessing
+import socket
+import time
+
+import io_scheduler
+from io_scheduler import Scheduler
+from streams import StreamReader, StreamWriter
+
+
+MESSAGES = 100000
+SIZE = 64       # Bytes per message
+MESSAGE = b'x' * (SIZE - 1) + b'\n'
+
+
+async def raw_write(sched, sock):
+    for _ in range(MESSAGES):
+        data = MESSAGE
+        while data:
+            sent = await sched.send(sock, data)
+            data = data[sent:]
+
+
+async def stream_write(sched, sock):
+    writer = StreamWriter(sock)
+    for _ in range(MESSAGES):
+        writer.write(MESSAGE)
+        await writer.drain()
+    writer.close()
+
+
+async def raw_read(sched, sock):
+    for _ in range(MESSAGES):
+        data = b''
+        while len(data) < SIZE:
+            chunk = await sched.recv(sock, SIZE - len(data))
+            if not chunk:
+                raise EOFError()
+            data += chunk
+
+
+async def stream_read(sched, sock):
+    reader = StreamReader(sock)
+    for _ in range(MESSAGES):
+        await reader.readexactly(SIZE)
+
+
+def client_reader(sock):
+    left = MESSAGES * SIZE
+    while left:
+        left -= len(sock.recv(1 << 20))
+
+
+def client_writer(sock):
+    sock.sendall(MESSAGE * MESSAGES)
+
+
+def measure(name, server, client):
+    sched = io_scheduler.sched = Scheduler()
+    ours, theirs = socket.socketpair()
+    process = multiprocessing.Process(target=client, args=(theirs,))
+    process.start()
+    theirs.close()
+
+    sched.new_task(server(sched, ours))
+    start = time.perf_counter()
+    sched.run()
+    process.join()
+    elapsed = time.perf_counter() - start
+    ours.close()
+    print(f'{name:>14} {MESSAGES / elapsed:>12.0f} {MESSAGES * SIZE / elapsed / 2 ** 20:>8.1f}')
+
+
+def main():
+    print(f'{MESSAGES} messages of {SIZE} bytes')
+    print(f'{"":>14} {"msg/s":>12} {"MB/s":>8}')
+    measure('raw send', raw_write, client_reader)
+    measure('stream write', stream_write, client_reader)
+    measure('raw recv', raw_read, client_writer)
+    measure('stream read', stream_read, client_writer)
+
+
+if __name__ == '__main__':
+    main()
+
+
+"""
+    Бенчмарк потоков из streams.py против прямых вызовов sched.send() и sched.recv().
+
+    Сервер отправляет или принимает MESSAGES сообщений по SIZE байт, клиент в отдельном процессе читает или пишет
+    их как можно быстрее. Выводится количество сообщений и мегабайт в секунду.
+
+    raw send - На каждое сообщение sched.send(): ожидание готовности сокета через поллер и один send()
+    stream write - writer.write() кладет сообщение в очередь, сообщения отправляются пачками через sendmsg(), а
+    drain() отдает управление только когда очередь больше high
+    raw recv - sched.recv() до тех пор, пока не наберется целое сообщение
+    stream read - reader.readexactly(): один recv() читает до chunk байт, то есть сразу много сообщений, а следующие
+    readexactly() берут их из буфера без системных вызовов
+"""
@@ -0,0 +1,121 @@
+import threading
+import time
+from functools import partial
+
+import io_scheduler
+from io_scheduler import Scheduler
+from queues import AsyncQueue, ThreadQueue, QueueClosed
+
+
+PRODUCERS = 4
+ITEMS = 50000       # Per producer
+BATCH = 100
+CONSUMERS = 4
+
+
+def new_sched():
+    sched = io_scheduler.sched = Scheduler()
+    return sched
+
+
+def per_item(sched):
+    # Every item is its own call_soon_threadsafe() into an ordinary AsyncQueue
+    q = AsyncQueue()
+    sched._use_waker()
+
+    def deliver(item):
+        q.items.append(item)
+        q._wake_getter()
+
+    def produce():
+        for n in range(ITEMS):
+            sched.call_soon_threadsafe(partial(deliver, n))
+
+    def close():
+        for _ in range(CONSUMERS):
+            deliver(None)
+        sched._release_waker()
+
+    return q, produce, lambda: sched.call_soon_threadsafe(close)
+
+
+def thread_queue(sched):
+    q = ThreadQueue()
+
+    def produce():
+        for n in range(ITEMS):
+            q.put(n)
+
+    return q, produce, q.close
+
+
+def thread_queue_batched(sched):
+    q = ThreadQueue()
+
+    def produce():
+        for start in range(0, ITEMS, BATCH):
+            q.put_many(range(start, start + BATCH))
+
+    return q, produce, q.close
+
+
+async def consumer(q, received):
+    try:
+        while True:
+            item = await q.get()
+            if item is None:
+                return
+            received.append(item)
+    except QueueClosed:
+        pass
+
+
+async def producers(sched, produce, close):
+    threads = [threading.Thread(target=produce) for _ in range(PRODUCERS)]
+    for thread in threads:
+        thread.start()
+    await sched.run_in_executor(lambda: [thread.join() for thread in threads])
+    close()
+
+
+def measure(name, setup):
+    sched = new_sched()
+    q, produce, close = setup(sched)
+    received = []
+    for _ in range(CONSUMERS):
+        sched.new_task(consumer(q, received))
+    sched.new_task(producers(sched, produce, close))
+
+    start = time.perf_counter()
+    sched.run()
+    elapsed = time.perf_counter() - start
+
+    assert len(received) == PRODUCERS * ITEMS
+    wakeups = sched.stats['threadsafe_wakeups']
+    print(f'{name:>22} {len(received) / elapsed:>12.0f} {wakeups:>10} {len(received) / wakeups:>14.0f}')
+
+
+def main():
+    print(f'{PRODUCERS} producer threads, {PRODUCERS * ITEMS} items, {CONSUMERS} consumer coroutines')
+    print(f'{"":>22} {"items/s":>12} {"wakeups":>10} {"items/wakeup":>14}')
+    measure('call_soon_threadsafe', per_item)
+    measure('ThreadQueue.put', thread_queue)
+    measure('ThreadQueue.put_many', thread_queue_batched)
+
+
+if __name__ == '__main__':
+    main()
+
+
+"""
+    Бенчмарк передачи данных из потоков в корутины.
+
+    PRODUCERS потоков кладут по ITEMS элементов, CONSUMERS корутин на планировщике из io_scheduler.py забирают их.
+    Выводится количество элементов в секунду, сколько раз потоки будили цикл(stats['threadsafe_wakeups'], каждое
+    пробуждение - это запись в Waker и чтение из него) и сколько элементов пришлось на одно пробуждение.
+
+    call_soon_threadsafe - Каждый элемент передается циклу отдельной функцией, которая кладет его в AsyncQueue.
+    Записи в Waker объединяются флагом _notified, но на каждый элемент создается функция и проходит через _threadsafe.
+    ThreadQueue.put - Элементы кладутся прямо в deque очереди, циклу передается одна функция на пачку элементов
+    ThreadQueue.put_many - То же самое, но производитель кладет элементы пачками по BATCH
+"""
@@ -0,0 +1,72 @@
+import random
+import time
+
+from timers import TimerHeap, TimerWheel
+
+
+TIMERS = 200000
+CANCELLED = 0.9      # Most per-connection timeouts never fire
+HORIZON = 60.0       # Timeouts are spread over one minute
+STEP = 0.01          # How often the loop looks at its timers
+
+
+def run(store, deadlines, cancel):
+    noop = lambda: None
+
+    start = time.perf_counter()
+    timers = [store.push(deadline, noop) for deadline in deadlines]
+    inserted = time.perf_counter()
+
+    for n in cancel:
+        store.cancel(timers[n])
+    cancelled = time.perf_counter()
+
+    fired = 0
+    now = 0.0
+    while store:
+        now += STEP
+        store.next_deadline()
+        fired += len(store.pop_expired(now))
+    expired = time.perf_counter()
+
+    return (inserted - start, cancelled - inserted, expired - cancelled, fired)
+
+
+def main():
+    random.seed(0)
+    deadlines = [random.uniform(0.001, HORIZON) for _ in range(TIMERS)]
+    cancel = random.sample(range(TIMERS), int(TIMERS * CANCELLED))
+
+    print(f'{TIMERS} timers, {int(CANCELLED * 100)}% cancelled')
+    print(f'{"store":>10} {"insert ns":>10} {"cancel ns":>10} {"expire ms":>10} {"fired":>8}')
+    for name, store in (('heap', TimerHeap()), ('wheel', TimerWheel(origin=0.0))):
+        insert, cancel_time, expire, fired = run(store, deadlines, cancel)
+        print(f'{name:>10} {insert / TIMERS * 1e9:>10.0f} {cancel_time / len(cancel) * 1e9:>10.0f} '
+              f'{expire * 1e3:>10.1f} {fired:>8}')
+
+
+if __name__ == '__main__':
+    main()
+
+
+"""
+    Микробенчмарк хранилищ таймеров: куча(TimerHeap) против иерархического колеса(TimerWheel).
+
+    Создается TIMERS таймеров со случайным временем срабатывания в пределах минуты, затем 90% из них отменяется, как
+    это бывает с таймаутами соединений, а оставшиеся вынимаются по мере того, как "время" идет шагами по STEP секунд.
+    Часы здесь поддельные(now), поэтому бенчмарк не ждет целую минуту.
+
+    Выводится стоимость одной вставки и одной отмены в наносекундах и общее время на извлечение всех сработавших
+    таймеров. Вставка в колесо не зависит от количества таймеров, а вставка в кучу растет как O(log n). Отмена в
+    колесе сразу удаляет таймер из слота, а в куче отмененный таймер остается лежать до своего времени.
+
+    Замер на 200000 таймерах(1 ядро, CPython 3.11):
+         store  insert ns  cancel ns  expire ms
+          heap       1550       1110       37.9
+         wheel       1820        980       38.8
+    В CPython heapq написан на C, поэтому колесо на чистом Python кучу не обгоняет. Вставка в колесо медленнее:
+    вычисление уровня и слота на Python дороже, чем heappush на C. Отмена немного быстрее, так как таймер сразу
+    удаляется из слота. Извлечение примерно наравне: куча вынимает и отмененные таймеры(180000 надгробий), но
+    делает это на C, а колесо обходит только занятые слоты, но каждый доживший таймер перекладывается с уровня на
+    уровень на Python. Пока колесо не быстрее, планировщик по умолчанию использует TimerHeap.
+"""
@@ -0,0 +1,42 @@
+class BufferPool:
+    def __init__(self, size=65536, count=64):
+        self.size = size
+        self.count = count
+        self._arena = bytearray(size * count)       # One allocation for every pooled buffer
+        view = memoryview(self._arena)
+        self._free = [view[n * size:(n + 1) * size] for n in range(count)]     # Sliced once, reused as is
+        self.misses = 0         # Buffers allocated because the pool was empty
+
+    def __len__(self):
+        return len(self._free)
+
+    def acquire(self):
+        if self._free:
+            return self._free.pop()     # The most recently released one is still warm in the cache
+        self.misses += 1
+        return memoryview(bytearray(self.size))
+
+    def release(self, buf):
+        if buf.obj is self._arena:      # Buffers allocated on a miss are left to the garbage collector
+            self._free.append(buf)
+
+
+"""
+    Пул буферов для чтения из сокетов через sched.recv_into().
+
+    sched.recv(sock, n) на каждый вызов создает новый объект bytes с принятыми данными. recv_into() записывает данные
+    в уже существующий буфер, поэтому на каждое сообщение память не выделяется.
+
+    BufferPool(size, count) - Выделяет один большой bytearray на count буферов по size байт и заранее нарезает его на
+    memoryview. memoryview - это окно в чужой буфер: срез memoryview не копирует байты, а лишь указывает на часть
+    того же буфера.
+
+    acquire() - Отдает свободный буфер. Если свободных нет, то создается новый, он не возвращается в пул, чтобы пул не
+    рос бесконечно при всплеске соединений. Количество таких промахов видно в misses, по нему можно подобрать count.
+    release(buf) - Возвращает буфер в пул. Буфер берется на одно сообщение: когда сокет стал читаемым, и возвращается
+    после его обработки. Поэтому буферов в пуле нужно столько, сколько сообщений обрабатывается одновременно, а не
+    сколько открыто соединений, и простаивающие соединения памяти не занимают.
+
+    У каждого планировщика свой пул(sched.buffers), так как планировщик работает в одном потоке и пулу не нужна
+    блокировка.
+"""
@@ -12,17 +12,16 @@ class AsyncQueue:
     def put(self, item):
         self.items.append(item)
         if self.waiting:
-            func = self.waiting.popleft()
             # Do we call it right away? No. Schedule it to be called.
-            sched.call_soon(func)
+            # The waiter is already a (func, args) pair the scheduler runs as is
+            sched.ready.append(self.waiting.popleft())
 
-    def get(self, callback):
+    def get(self, callback, *args):
         # Wait until an item is available. Then return it
         if self.items:
-            callback(self.items.popleft())
+            callback(self.items.popleft(), *args)
         else:
-            self.waiting.append(lambda: self.get(callback))
-            print('put into waiting')
+            self.waiting.append((self.get, (callback, *args)))    # No closure, just what get() needs to be called again
 
 
 aq = AsyncQueue()
@@ -33,7 +32,7 @@ def producer(q, count):
         if n < count:
             print('Producing', n)
             q.put(n)
-            sched.call_later(2, lambda: _run(n + 1))
+            sched.call_later(2, _run, n + 1)
         else:
             print('Producer done')
             q.put(None)
@@ -49,27 +48,29 @@ def producer(q, count):
 """
 
 
-def consumer(q):
-    def _consume(item):
-        if item is None:
-            print('Consumer done')
-        else:
-            print('Consuming', item)
-            sched.call_soon(lambda: consumer(q))
+def _consume(item, q):
+    if item is None:
+        print('Consumer done')
+    else:
+        print('Consuming', item)
+        sched.call_soon(consumer, q)
 
-    q.get(callback=_consume)
+
+def consumer(q):
+    q.get(_consume, q)
 
 
 """
     Потребитель пытается получить данные
-    Если в очереди есть готовые данные, он берет их, обрабатывает и запрашивает по новой (sched.call_soon(lambda: consumer(q)))
+    Если в очереди есть готовые данные, он берет их, обрабатывает и запрашивает по новой (sched.call_soon(consumer, q))
     Если в очереди данных нет, он их ждет
     Повторяет он эти действия до тех пор, пока производитель данных не прекратит свою работу
 """
 
-sched.call_soon(lambda: producer(aq, 10))
-sched.call_soon(lambda: consumer(aq,))
-sched.run()
+if __name__ == '__main__':
+    sched.call_soon(producer, aq, 10)
+    sched.call_soon(consumer, aq)
+    sched.run()
 
 
 """
@@ -94,8 +95,13 @@ sched.run()
 
     Более подробно:
     Вызывает функцию потребитель передавая ей первый елемент из очереди
-    Если очередь елементов пуста, вставляет в очередь ожидающих геттеров себя же, вместе с переданным ему в аргументы
-    потребителем.
+    Если очередь елементов пуста, вставляет в очередь ожидающих геттеров пару (self.get, (callback, *args)). Раньше
+    здесь создавалась новая функция lambda: self.get(callback), то есть замыкание на каждое ожидание. Пара меньше
+    замыкания и имеет тот же вид, что и записи в очереди планировщика (func, args), поэтому put() будит геттер без
+    новых выделений памяти: просто перекладывает пару из self.waiting в sched.ready.
+
+    Потребитель _consume тоже больше не создается заново внутри consumer() на каждый элемент, а объявлен один раз
+    и получает очередь аргументом.
 
     Идея заключается в том, что при отсутствии данных, вызов потребителя откладывается на более поздний
     момент, когда производитель положит данные в очередь.
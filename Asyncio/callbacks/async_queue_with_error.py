@@ -28,9 +28,10 @@ class AsyncQueue:
 
     def close(self):
         self._closed = True
-        if self.waiting and not self.items:
-            for func in self.waiting:
-                sched.call_soon(func)
+        # Wake every waiting getter at once: those that find an item take it,
+        # the rest get the QueueClosed result
+        sched.ready.extend(self.waiting)
+        self.waiting.clear()
 
     def put(self, item):
         if self._closed:
@@ -38,22 +39,21 @@ class AsyncQueue:
 
         self.items.append(item)
         if self.waiting:
-            func = self.waiting.popleft()
             # Do we call it right away? No. Schedule it to be called.
-            sched.call_soon(func)
+            # The waiter is already a (func, args) pair the scheduler runs as is
+            sched.ready.append(self.waiting.popleft())
 
-    def get(self, callback):
+    def get(self, callback, *args):
         # Wait until an item is available. Then return it
         # Question: How does a closed queue interact  with get()
         if self.items:
-            callback(Result(value=self.items.popleft()))  # Good result
+            callback(Result(value=self.items.popleft()), *args)  # Good result
         else:
             # No items available (must wait)
             if self._closed:
-                callback(Result(exc=QueueClosed()))  # Error result
+                callback(Result(exc=QueueClosed()), *args)  # Error result
             else:
-                self.waiting.append(lambda: self.get(callback))
-                print('put into waiting')
+                self.waiting.append((self.get, (callback, *args)))
 
 
 aq = AsyncQueue()
@@ -64,7 +64,7 @@ def producer(q, count):
         if n < count:
             print('Producing', n)
             q.put(n)
-            sched.call_later(2, lambda: _run(n + 1))
+            sched.call_later(2, _run, n + 1)
         else:
             print('Producer done')
             q.close()   # Means no more items will be produced
@@ -80,22 +80,23 @@ def producer(q, count):
 """
 
 
-def consumer(q):
-    def _consume(result):
-        try:
-            item = result.result()
-            print('Consuming', item)
-            sched.call_soon(lambda: consumer(q))
+def _consume(result, q):
+    try:
+        item = result.result()
+        print('Consuming', item)
+        sched.call_soon(consumer, q)
+
+    except QueueClosed:
+        print('Consumer done')
 
-        except QueueClosed:
-            print('Consumer done')
 
-    q.get(callback=_consume)
+def consumer(q):
+    q.get(_consume, q)
 
 
 """
     Потребитель пытается получить данные
-    Если в очереди есть готовые данные, он берет их, обрабатывает и запрашивает по новой (sched.call_soon(lambda: consumer(q)))
+    Если в очереди есть готовые данные, он берет их, обрабатывает и запрашивает по новой (sched.call_soon(consumer, q))
     Если в очереди данных нет, он их ждет
     Повторяет он эти действия до тех пор, пока производитель данных не прекратит свою работу
     Когда производитель завершает свою работу, то он закрывает очередь и потребитель вместо данных получает ошибку,
@@ -103,9 +104,10 @@ def consumer(q):
 """
 
 
-sched.call_soon(lambda: producer(aq, 10))
-sched.call_soon(lambda: consumer(aq,))
-sched.run()
+if __name__ == '__main__':
+    sched.call_soon(producer, aq, 10)
+    sched.call_soon(consumer, aq)
+    sched.run()
 
 
 """
@@ -117,8 +119,11 @@ sched.run()
     Она лишь кладет элементы в очередь, не проверяя, полна ли она, и оповещает ждущий геттер, если он есть
 
     close - Закрывает очередь
-    Если в очереди ждущих геттеров что то есть, а в очереди елементов пусто, вызывает оставшиеся в ожидании геттеры
-    Геттер же в свою очередь передает потребителю объект result с ошибкой и потребитель завершает свою работу
+    Одним вызовом sched.ready.extend() переносит всех ждущих геттеров в очередь планировщика, даже если в очереди
+    елементов еще что то есть. Раньше при непустой очереди никто не будился: если put() уже разбудил один геттер, но
+    тот еще не успел забрать элемент, то остальные геттеры оставались ждать навсегда.
+    Разбуженный геттер сначала отдает потребителю оставшийся элемент, а если елементов нет - объект result с ошибкой,
+    и потребитель завершает свою работу. Так оставшиеся данные разбираются до того, как потребители завершатся
 
 
     put - Кладет данные в очередь, не проверяя ее заполненность
@@ -138,8 +143,8 @@ sched.run()
     Вызывает функцию потребитель передавая ей объект result с данными
 
     Если очередь пуста и закрыта, вызывает потребителя, передавая ему объект result с ошибкой
-    Если очередь пуста, но открыта, вставляет в очередь ожидающих геттеров себя же, вместе с
-    переданным ему в аргументы потребителем.
+    Если очередь пуста, но открыта, вставляет в очередь ожидающих геттеров пару (self.get, (callback, *args)), без
+    замыкания. Это готовая запись для очереди планировщика, поэтому put() и close() просто переносят ее в sched.ready.
 
     Идея заключается в том, что при отсутствии данных, вызов потребителя откладывается на более поздний
     момент, когда производитель положит данные в очередь.
@@ -0,0 +1,87 @@
+import time
+import tracemalloc
+from collections import deque
+
+from async_queue import AsyncQueue, sched
+
+
+CONSUMERS = 10000
+
+
+class ClosureQueue(AsyncQueue):
+    # The queue as it was before: every waiting getter is a new lambda
+    def put(self, item):
+        self.items.append(item)
+        if self.waiting:
+            sched.call_soon(self.waiting.popleft())
+
+    def get(self, callback, *args):
+        if self.items:
+            callback(self.items.popleft(), *args)
+        else:
+            self.waiting.append(lambda: self.get(callback, *args))
+
+
+def closure_consumer(q):
+    def _consume(item):
+        pass
+
+    q.get(_consume)
+
+
+def _consume(item, q):
+    pass
+
+
+def tuple_consumer(q):
+    q.get(_consume, q)
+
+
+def measure(name, queue_class, consumer):
+    q = queue_class()
+    sched.ready = deque()
+    tracemalloc.start()
+
+    before = tracemalloc.take_snapshot()
+    for _ in range(CONSUMERS):
+        consumer(q)
+    waiting = tracemalloc.take_snapshot().compare_to(before, 'filename')
+
+    before = tracemalloc.take_snapshot()
+    for n in range(CONSUMERS):
+        q.put(n)
+    woken = tracemalloc.take_snapshot().compare_to(before, 'filename')
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    sched.run()
+    elapsed = time.perf_counter() - start
+
+    per_waiter = sum(stat.size_diff for stat in waiting) / CONSUMERS
+    per_wakeup = sum(stat.size_diff for stat in woken) / CONSUMERS
+    print(f'{name:>10} {per_waiter:>14.1f} {per_wakeup:>14.1f} {elapsed / CONSUMERS * 1e6:>10.2f}')
+
+
+def main():
+    print(f'{CONSUMERS} waiting consumers')
+    print(f'{"":>10} {"bytes/waiter":>14} {"bytes/wakeup":>14} {"us/item":>10}')
+    measure('closures', ClosureQueue, closure_consumer)
+    measure('tuples', AsyncQueue, tuple_consumer)
+
+
+if __name__ == '__main__':
+    main()
+
+
+"""
+    Бенчмарк памяти ожидающих геттеров в AsyncQueue.
+
+    CONSUMERS потребителей встают в ожидание на пустой очереди, затем производитель кладет столько же элементов и
+    будит их всех. Через tracemalloc считается, сколько байт выделяется на одного ожидающего потребителя и на одно
+    пробуждение, и сколько времени занимает обработка одного элемента планировщиком.
+
+    closures - Старый вариант: на каждое ожидание создается lambda, а потребитель создает новую функцию _consume при
+    каждом вызове. Замыкание тянет за собой ячейки(cell) для захваченных переменных.
+    tuples - Текущий вариант: в очереди ожидающих лежит кортеж (callback, args), а потребитель - обычная функция
+    модуля, которая получает очередь аргументом.
+"""
@@ -0,0 +1,119 @@
+import queue
+import threading
+import time
+
+from work_stealing import WorkStealingPool
+
+
+PRODUCERS = 4
+ITEMS = 50000       # Per producer
+BATCH = 64
+
+
+def work(sent, latencies):
+    latencies.append(time.perf_counter() - sent)
+    sum(range(20))      # A little bit of work per item
+
+
+def run_producers(submit):
+    def produce():
+        for _ in range(ITEMS):
+            submit(time.perf_counter())
+
+    threads = [threading.Thread(target=produce) for _ in range(PRODUCERS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def plain_queue(workers, latencies):
+    q = queue.Queue()
+
+    def consume():
+        while True:
+            sent = q.get()
+            if sent is None:
+                break
+            work(sent, latencies)
+
+    consumers = [threading.Thread(target=consume) for _ in range(workers)]
+    for thread in consumers:
+        thread.start()
+    run_producers(q.put)
+    for _ in consumers:
+        q.put(None)     # One sentinel per consumer
+    for thread in consumers:
+        thread.join()
+
+
+def stealing(workers, latencies):
+    pool = WorkStealingPool(lambda sent: work(sent, latencies), workers)
+    run_producers(pool.submit)
+    pool.close()
+    pool.join()
+
+
+def stealing_batched(workers, latencies):
+    def handle(items):
+        for sent in items:
+            work(sent, latencies)
+
+    pool = WorkStealingPool(handle, workers, batch=BATCH)
+    run_producers(pool.submit)
+    pool.close()
+    pool.join()
+
+
+def measure(name, runner, workers):
+    latencies = []
+    start = time.perf_counter()
+    runner(workers, latencies)
+    elapsed = time.perf_counter() - start
+
+    assert len(latencies) == PRODUCERS * ITEMS
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1e3
+    p99 = latencies[int(len(latencies) * 0.99)] * 1e3
+    print(f'{name:>18} {workers:>8} {len(latencies) / elapsed:>12.0f} {p50:>8.2f} {p99:>8.2f}')
+
+
+def main():
+    print(f'{PRODUCERS} producers, {PRODUCERS * ITEMS} items')
+    print(f'{"":>18} {"workers":>8} {"items/s":>12} {"p50 ms":>8} {"p99 ms":>8}')
+    for workers in (1, 4, 16):
+        measure('queue.Queue', plain_queue, workers)
+        measure('work stealing', stealing, workers)
+        measure('work stealing x64', stealing_batched, workers)
+
+
+if __name__ == '__main__':
+    main()
+
+
+"""
+    Бенчмарк WorkStealingPool против одной общей очереди queue.Queue, как в producer_consumer.py.
+
+    PRODUCERS потоков-производителей кладут по ITEMS элементов. Элемент - это время его отправки, потребитель
+    записывает, через сколько он его получил(задержка), и выполняет немного работы. Для 1, 4 и 16 воркеров выводится
+    пропускная способность(элементов в секунду), медиана и 99-й перцентиль задержки.
+
+    queue.Queue - Все потребители берут элементы из одной очереди под одной блокировкой, завершаются по None
+    work stealing - У каждого воркера своя deque, свободные воркеры перехватывают работу у занятых
+    work stealing x64 - То же самое, но воркер забирает до BATCH элементов за раз
+
+    Из за GIL потоки не выполняют Python код параллельно, поэтому пропускная способность растет не от количества
+    воркеров, а от того, сколько времени уходит на синхронизацию между ними. Задержка здесь включает и время, которое
+    элемент пролежал в очереди, пока производители работают быстрее потребителей.
+
+    Результаты на одном ядре(items/s):
+    воркеров          1        4       16
+    queue.Queue       229k     218k    250k
+    work stealing     506k     403k    206k
+    work stealing x64 765k     665k    378k
+
+    Выигрыш по пропускной способности есть не везде. На 16 воркерах work stealing без batch медленнее обычной
+    queue.Queue(в этом запуске 206k против 250k, в другом 192k против 295k): пустые воркеры постоянно перехватывают
+    по одному элементу друг у друга, будят друг друга и переключают GIL. Задержка(p50, p99) при этом ниже, чем у
+    queue.Queue. На 1-4 воркерах и с batch пул быстрее, потому что на элемент приходится меньше синхронизации.
+"""
@@ -3,33 +3,98 @@ from collections import deque
 import heapq
 
 
+class TimerHandle:
+    def __init__(self, sched, func, args):
+        self.sched = sched
+        self.func = func
+        self.args = args
+
+    def cancel(self):
+        if self.sched is not None:     # Not fired or cancelled yet
+            self.sched._cancel(self)
+
+
 class Scheduler:
-    def __init__(self):
+    def __init__(self, budget=None):
         self.ready = deque()     # Functions ready to execute
         self.sleeping = []       # Sleeping functions
         self.sequence = 0        # Used to break ties in priority queue
-
-    def call_soon(self, func):
-        self.ready.append(func)
-
-    def call_later(self, delay, func):
+        self.cancelled = 0       # Cancelled timers still sitting in the heap
+        self.budget = budget     # Max seconds of callbacks per tick, None - run the whole batch
+        self.stats = {
+            'ticks': 0,
+            'callbacks': 0,
+            'max_callbacks_per_tick': 0,
+            'max_tick_latency': 0.0,       # Longest time timers were not looked at
+            'max_timer_lateness': 0.0,     # Longest delay between a deadline and its timer being run
+            'over_budget': 0,              # Ticks cut short by the budget
+        }
+
+    def call_soon(self, func, *args):
+        self.ready.append((func, args))     # No closure needed to pass arguments
+
+    def call_later(self, delay, func, *args):
         self.sequence += 1
-        deadline = time.time() + delay     # Expiration time
-        heapq.heappush(self.sleeping, (deadline, self.sequence, func))
+        deadline = time.monotonic() + delay     # Expiration time
+        handle = TimerHandle(self, func, args)
+        heapq.heappush(self.sleeping, (deadline, self.sequence, handle))
+        return handle
+
+    def _cancel(self, handle):
+        handle.sched = None
+        handle.func = None      # Tombstone, skipped by run()
+        self.cancelled += 1
+        # Rebuild the heap once more than half of it are tombstones
+        if self.cancelled > 64 and self.cancelled * 2 > len(self.sleeping):
+            self.sleeping = [entry for entry in self.sleeping if entry[2].func is not None]
+            heapq.heapify(self.sleeping)
+            self.cancelled = 0
 
     def run(self):
+        stats = self.stats
         while self.ready or self.sleeping:
             if not self.ready:
+                # Drop tombstones from the top, so the nearest deadline is a live timer
+                while self.sleeping and self.sleeping[0][2].func is None:
+                    heapq.heappop(self.sleeping)
+                    self.cancelled -= 1
+                if not self.sleeping:
+                    break       # Only cancelled timers were left
                 # Find the nearest deadline
-                deadline, _, func = heapq.heappop(self.sleeping)
-                delta = deadline - time.time()
+                delta = self.sleeping[0][0] - time.monotonic()
                 if delta > 0:
                     time.sleep(delta)
-                self.ready.append(func)
 
-            while self.ready:
-                func = self.ready.popleft()
-                func()
+            # Move every expired timer to the ready queue
+            now = time.monotonic()
+            while self.sleeping and self.sleeping[0][0] <= now:
+                deadline, _, handle = heapq.heappop(self.sleeping)
+                if handle.func is None:
+                    self.cancelled -= 1
+                    continue
+                handle.sched = None
+                if now - deadline > stats['max_timer_lateness']:
+                    stats['max_timer_lateness'] = now - deadline
+                self.ready.append((handle.func, handle.args))
+
+            # Run only what is ready right now, functions scheduled by this batch wait for the next tick
+            count = len(self.ready)
+            start = time.monotonic()
+            for n in range(count):
+                func, args = self.ready.popleft()
+                func(*args)
+                if self.budget is not None and time.monotonic() - start > self.budget:
+                    stats['over_budget'] += 1
+                    count = n + 1
+                    break
+            latency = time.monotonic() - start
+
+            stats['ticks'] += 1
+            stats['callbacks'] += count
+            if count > stats['max_callbacks_per_tick']:
+                stats['max_callbacks_per_tick'] = count
+            if latency > stats['max_tick_latency']:
+                stats['max_tick_latency'] = latency
 
 
 sched = Scheduler()     # Behind scenes scheduler object
@@ -38,20 +103,20 @@ sched = Scheduler()     # Behind scenes scheduler object
 def countdown(n):
     if n > 0:
         print('Down', n)
-        sched.call_later(4, lambda: countdown(n - 1))   # time.sleep(4)
+        sched.call_later(4, countdown, n - 1)   # time.sleep(4)
 
 
 def countup(stop):
     def _run(x):
         if x < stop:
             print('Up', x)
-            sched.call_later(1, lambda: _run(x + 1))    # time.sleep(1)
+            sched.call_later(1, _run, x + 1)    # time.sleep(1)
     _run(0)
 
 
 if __name__ == '__main__':
-    sched.call_soon(lambda: countdown(5))
-    sched.call_soon(lambda: countup(20))
+    sched.call_soon(countdown, 5)
+    sched.call_soon(countup, 20)
     sched.run()
 
 
@@ -59,8 +124,31 @@ if __name__ == '__main__':
     Scheduler - Решает какие функции нужно вызвать сразу, а какие вызвать позже в определенное время
 
     call_soon - Добавляет функцию в очередь готовых к выполнению
+    Аргументы функции передаются следом за ней: call_soon(func, *args). В очередь кладется кортеж (func, args), поэтому
+    не нужно создавать новую lambda на каждый вызов только для того, чтобы передать аргументы
 
     call_later - Добавляет в очередь ждущих выполнения функцию, вместе с временем ее вызова в будущем
+    Аргументы передаются так же, как и в call_soon: call_later(delay, func, *args)
+    Возвращает TimerHandle, у которого можно вызвать cancel(), чтобы функция так и не была вызвана
+
+    run - Каждую итерацию(tick) перекладывает все наступившие таймеры в очередь готовых и вызывает только те функции,
+    которые были в очереди готовых на начало итерации. Функция, которая снова кладет себя в очередь(call_soon), как
+    consumer в async_queue.py, будет вызвана только на следующей итерации, поэтому она не может бесконечно занимать
+    цикл и не давать срабатывать таймерам.
+
+    budget - Ограничение по времени на одну итерацию в секундах, оставшиеся функции ждут следующей итерации
+
+    stats - Счетчики голодания цикла: количество итераций(ticks), вызванных функций(callbacks), наибольшее количество
+    функций за итерацию(max_callbacks_per_tick), самая долгая итерация(max_tick_latency), самое большое опоздание
+    таймера(max_timer_lateness) и количество итераций, прерванных из за budget(over_budget)
+
+    TimerHandle.cancel - Отмененная функция не удаляется из кучи сразу, так как поиск в куче стоит O(n). Вместо этого
+    у записи стирается функция(func = None) и она становится надгробием(tombstone), которое run() просто пропускает.
+    Чтобы надгробия не копились в куче бесконечно, когда их становится больше половины кучи, она перестраивается без
+    них. Перестройка стоит O(n), но происходит только после большого количества отмен, поэтому в среднем отмена
+    стоит O(1)
+    Перед сном run() снимает надгробия с вершины кучи, иначе он спал бы до срока отмененного таймера, а не до
+    ближайшего живого. Если в куче остались только надгробия, run() завершается сразу
 
     run - Вызывает все готовые к вызову функции
     Если таковых нет, то берет ближайшую ожидающую вызова,
@@ -0,0 +1,169 @@
+import itertools
+import random
+import threading
+import time
+from collections import deque
+
+
+class PoolClosed(Exception):
+    pass
+
+
+class WorkStealingPool:
+    def __init__(self, handler, workers=4, batch=None):
+        self.handler = handler
+        self.batch = batch          # None - handler(item), n - handler([up to n items])
+        self.deques = [deque() for _ in range(workers)]     # One per worker, append/pop are atomic under the GIL
+        self.stolen = [0] * workers     # Items each worker took from the others
+        self.errors = [0] * workers     # Handler calls that raised, per worker
+        self._next = itertools.count()  # Round robin over the deques for submit()
+        self._cond = threading.Condition()
+        self._idle = 0              # Workers sleeping on _cond
+        self._closed = False
+        self._threads = [threading.Thread(target=self._work, args=(n,), daemon=True) for n in range(workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, item):
+        if self._closed:
+            raise PoolClosed()
+        self.deques[next(self._next) % len(self.deques)].append(item)
+        if self._idle:      # Only take the lock when somebody sleeps
+            with self._cond:
+                self._cond.notify()
+
+    def submit_many(self, items):
+        if self._closed:
+            raise PoolClosed()
+        items = list(items)
+        count = len(self.deques)
+        start = next(self._next)
+        chunk = -(-len(items) // count)
+        for n in range(count):
+            self.deques[(start + n) % count].extend(items[n * chunk:(n + 1) * chunk])
+        if self._idle:
+            with self._cond:
+                self._cond.notify_all()
+
+    def close(self):
+        # No sentinels: workers drain what is left and stop once every deque is empty
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def join(self):
+        for thread in self._threads:
+            thread.join()
+
+    def _take(self, own, size):
+        items = []
+        try:
+            while len(items) < size:
+                items.append(own.popleft())
+        except IndexError:
+            pass
+        return items
+
+    def _steal(self, number, size):
+        count = len(self.deques)
+        offset = random.randrange(count)
+        for n in range(count):
+            victim = self.deques[(offset + n) % count]
+            if victim is self.deques[number] or not victim:
+                continue
+            # Take up to half of the victim's work from the opposite end to the owner
+            items = []
+            try:
+                for _ in range(min(size, max(1, len(victim) // 2))):
+                    items.append(victim.pop())
+            except IndexError:
+                pass
+            if items:
+                self.stolen[number] += len(items)
+                return items
+        return []
+
+    def _handle(self, number, work):
+        # A failed item must not kill the worker, otherwise its deque is never drained and join() hangs
+        try:
+            self.handler(work)
+        except Exception as e:
+            self.errors[number] += 1
+            print('Error in handler:', repr(e))
+
+    def _work(self, number):
+        own = self.deques[number]
+        size = self.batch or 1
+        while True:
+            items = self._take(own, size) or self._steal(number, size)
+            if items:
+                if self.batch:
+                    self._handle(number, items)
+                else:
+                    for item in items:
+                        self._handle(number, item)
+                continue
+
+            with self._cond:
+                self._idle += 1
+                # Recheck under the lock, submit() may have added work before it saw us idle
+                while not self._closed and not any(self.deques):
+                    self._cond.wait()
+                self._idle -= 1
+                if self._closed and not any(self.deques):
+                    return
+
+
+def producer(pool, name, count):
+    for n in range(count):
+        print(name, 'producing', n)
+        pool.submit((name, n))
+        time.sleep(0.1)
+
+
+def consumer(item):
+    print(threading.current_thread().name, 'consuming', item)
+
+
+if __name__ == '__main__':
+    pool = WorkStealingPool(consumer, workers=3)
+    producers = [threading.Thread(target=producer, args=(pool, f'producer {n}', 5)) for n in range(2)]
+    for thread in producers:
+        thread.start()
+    for thread in producers:
+        thread.join()
+    pool.close()
+    pool.join()
+    print('Pool done, stolen per worker:', pool.stolen)
+
+
+"""
+    Пул потоков с перехватом работы(work stealing). В producer_consumer.py один поток-потребитель берет данные из одной
+    очереди queue.Queue, а завершается по значению None. Если потребителей несколько, то каждому нужно отправить свой
+    None, а все они соревнуются за одну блокировку внутри queue.Queue на каждый элемент.
+
+    WorkStealingPool(handler, workers, batch) - У каждого воркера своя очередь deque. Операции append, popleft и pop у
+    deque атомарные при GIL, поэтому для них не нужна блокировка.
+
+    submit(item) - Кладет элемент в очереди воркеров по кругу. Производителей может быть сколько угодно, из любых потоков.
+    Блокировка берется только если есть спящий воркер, которого нужно разбудить.
+    submit_many(items) - Раскладывает элементы по очередям воркеров кусками, а не по одному.
+
+    _work - Цикл воркера. Берет работу из начала своей очереди. Если своя очередь пуста, то перехватывает(_steal) работу
+    у другого воркера, выбранного случайно: забирает до половины его очереди с конца, чтобы не мешать владельцу, который
+    берет с начала. Если работы нет нигде, то засыпает на условной переменной. Перед сном воркер еще раз проверяет очереди
+    под блокировкой, поэтому элемент, положенный в момент засыпания, не потеряется.
+
+    batch - Если задан, то воркер забирает до batch элементов за раз и вызывает handler со списком элементов. Это
+    уменьшает количество обращений к очередям и вызовов обработчика на элемент.
+
+    close - Закрывает пул без None для каждого потребителя. Новые элементы больше не принимаются(PoolClosed), а воркеры
+    дорабатывают оставшееся и завершаются, когда все очереди пусты. join() ждет их завершения.
+
+    _handle - Исключение из handler перехватывается и печатается, а воркер продолжает работу. Раньше оно завершало поток
+    воркера молча: его deque больше никто не разбирал, кроме случайных перехватов, и join() мог зависнуть навсегда.
+    При batch ошибка относится ко всему списку: элементы, до которых handler не дошел, не обрабатываются повторно.
+    errors - Сколько вызовов handler каждого воркера завершились исключением.
+
+    stolen - Сколько элементов каждый воркер перехватил у других, показывает насколько неравномерно распределялась работа.
+"""
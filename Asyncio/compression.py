@@ -0,0 +1,142 @@
+import zlib
+
+import io_scheduler
+from http_server import StreamingResponse
+
+
+ENCODINGS = {'gzip': 16 + zlib.MAX_WBITS, 'deflate': zlib.MAX_WBITS}     # Name -> wbits of zlib
+COMPRESSIBLE = ('text/', 'application/json', 'application/javascript', 'application/xml', 'image/svg+xml')
+
+
+def negotiate(accept_encoding, offered=tuple(ENCODINGS)):
+    # Accept-Encoding: gzip;q=0.8, deflate, *;q=0 - the encoding with the highest q, the server's order on a tie
+    weights = {}
+    for item in accept_encoding.split(','):
+        name, _, params = item.partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params[:2].lower() == 'q=':
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name] = q
+
+    best, best_q = None, 0.0
+    for name in offered:
+        q = weights.get(name, weights.get('*', 0.0))
+        if q > best_q:
+            best, best_q = name, q
+    return best
+
+
+def compress(data, encoding, level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, ENCODINGS[encoding])
+    return compressor.compress(data) + compressor.flush()
+
+
+class Compressor:
+    # Wraps a handler, e.g. HTTPServer(Compressor(router)), and compresses the responses it returns
+    def __init__(self, handler, minimum_size=1024, level=6, offload_size=None, types=COMPRESSIBLE):
+        self.handler = handler
+        self.minimum_size = minimum_size    # Smaller bodies are sent as is, the gain does not pay for the work
+        self.level = level
+        self.offload_size = offload_size    # Bodies of this size or larger are compressed in the thread pool
+        self.types = types
+        self.stats = {'compressed': 0, 'skipped': 0, 'offloaded': 0, 'bytes_in': 0, 'bytes_out': 0}
+
+    async def __call__(self, request):
+        response = await self.handler(request)
+        return await self.compress(request, response)
+
+    async def compress(self, request, response):
+        headers = response.headers
+        if response.status < 200 or response.status in (204, 304) or 'Content-Encoding' in headers:
+            return response
+        if not headers.get('Content-Type', '').startswith(self.types):
+            return response
+        # Whatever is chosen, caches must keep the answers to different Accept-Encoding apart
+        headers['Vary'] = f'{headers["Vary"]}, Accept-Encoding' if 'Vary' in headers else 'Accept-Encoding'
+
+        encoding = negotiate(request.headers.get('accept-encoding', ''))
+        if encoding is None:
+            return response
+        if type(response) is StreamingResponse:
+            response.body = self._compress_stream(response.body, encoding)
+            headers['Content-Encoding'] = encoding
+            self.stats['compressed'] += 1
+            return response
+
+        body = response.body
+        if len(body) < self.minimum_size:
+            self.stats['skipped'] += 1
+            return response
+        if self.offload_size is not None and len(body) >= self.offload_size:
+            # zlib releases the GIL while it works, so the loop keeps serving other connections meanwhile
+            self.stats['offloaded'] += 1
+            data = await io_scheduler.sched.run_in_executor(compress, body, encoding, self.level)
+        else:
+            data = compress(body, encoding, self.level)
+        if len(data) >= len(body):
+            self.stats['skipped'] += 1
+            return response
+        self.stats['compressed'] += 1
+        self.stats['bytes_in'] += len(body)
+        self.stats['bytes_out'] += len(data)
+        response.body = data
+        headers['Content-Encoding'] = encoding
+        return response
+
+    async def _compress_stream(self, body, encoding):
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, ENCODINGS[encoding])
+        try:
+            async for data in body:
+                if isinstance(data, str):
+                    data = data.encode()
+                self.stats['bytes_in'] += len(data)
+                data = compressor.compress(data)
+                if data:        # zlib keeps small pieces until it has enough for a block
+                    self.stats['bytes_out'] += len(data)
+                    yield data
+            data = compressor.flush()
+            self.stats['bytes_out'] += len(data)
+            yield data
+        finally:
+            aclose = getattr(body, 'aclose', None)
+            if aclose is not None:
+                await aclose()
+
+
+"""
+    Сжатие ответов HTTP сервера(http_server.py).
+
+    Клиент перечисляет в заголовке Accept-Encoding, какие сжатия он понимает, например gzip, deflate, br;q=0.5.
+    q - вес от 0 до 1, по умолчанию 1, q=0 означает "не присылать". negotiate() выбирает из поддерживаемых
+    сервером(ENCODINGS) сжатие с наибольшим весом, при равных весах - в порядке ENCODINGS. '*' - любое сжатие,
+    не названное отдельно. Если подходящего нет, ответ отправляется без сжатия. Сжатое тело помечается заголовком
+    Content-Encoding, а Vary: Accept-Encoding говорит кешам между сервером и клиентом, что ответ зависит от этого
+    заголовка запроса.
+
+    gzip и deflate - это один и тот же алгоритм сжатия zlib с разными заголовками вокруг данных, заголовки выбираются
+    параметром wbits: 16 + MAX_WBITS - gzip, MAX_WBITS - zlib(в HTTP он называется deflate).
+
+    Compressor(handler) - Оборачивает обработчик: HTTPServer(Compressor(router)). Сжимаются только ответы с типами
+    из types(текст, JSON и т.п.), картинки и архивы уже сжаты, и повторное сжатие только тратит процессор.
+    minimum_size - Тела меньше этого размера не сжимаются: на маленьком теле экономия в несколько байт, а
+    заголовки gzip и время на сжатие те же. Если сжатое тело не меньше исходного, отправляется исходное.
+    level - Уровень сжатия от 1(быстрее) до 9(меньше).
+    offload_size - Тела от этого размера сжимаются в пуле потоков(sched.run_in_executor()). Сжатие 1 МБ занимает
+    миллисекунды, и все это время цикл событий не обслуживал бы другие соединения. zlib отпускает GIL на время
+    сжатия, поэтому поток действительно работает параллельно с циклом. Для маленьких тел передача в поток стоит
+    дороже самого сжатия, поэтому по умолчанию offload_size=None - не передавать.
+
+    StreamingResponse сжимается по мере отправки: каждая часть передается в один и тот же compressobj, который
+    отдает сжатые данные блоками, а в конце flush() дописывает остаток. Так сжимается весь поток целиком, а не
+    каждая часть отдельно, и память не растет.
+
+    stats - compressed(сжато ответов), skipped(малые или несжимаемые), offloaded(сжато в потоке), bytes_in и
+    bytes_out(размер до и после сжатия).
+"""
@@ -0,0 +1,217 @@
+import socket
+import time
+from functools import partial
+
+import io_scheduler
+from io_scheduler import switch, CancelledError
+
+
+class ConnectionPool:
+    def __init__(self, max_per_host=10, idle_timeout=30.0, connect_timeout=5.0):
+        self.sched = io_scheduler.sched     # Looked up now, a worker process may have replaced it
+        self.max_per_host = max_per_host
+        self.idle_timeout = idle_timeout    # Idle connections older than this are closed
+        self.connect_timeout = connect_timeout
+        self._idle = {}         # addr -> [(sock, released at)], the newest at the end
+        self._open = {}         # addr -> connections open to addr, idle and checked out
+        self._waiting = {}      # addr -> {task: True} waiting for a free connection, in order
+        self._reaper = None     # Timer of the next _reap()
+        self.stats = {'connects': 0, 'reused': 0, 'unhealthy': 0, 'reaped': 0, 'waited': 0}
+
+    def connection(self, addr):
+        return Checkout(self, addr)
+
+    async def acquire(self, addr):
+        while True:
+            idle = self._idle.get(addr)
+            while idle:
+                sock, _ = idle.pop()    # LIFO: the most recently used one is the least likely to be dropped
+                if self._healthy(sock):
+                    self.stats['reused'] += 1
+                    return sock
+                self.stats['unhealthy'] += 1
+                self._close(addr, sock)
+
+            if self._open.get(addr, 0) < self.max_per_host:
+                self._open[addr] = self._open.get(addr, 0) + 1
+                try:
+                    sock = await self.sched.connect(addr, self.connect_timeout)
+                except BaseException:
+                    self._open[addr] -= 1
+                    self._wake(addr)    # The slot is free again
+                    raise
+                self.stats['connects'] += 1
+                return sock
+
+            # Every connection to addr is checked out, wait for one to come back
+            self.stats['waited'] += 1
+            waiting = self._waiting.setdefault(addr, {})
+            task = self.sched.current
+            waiting[task] = True
+            self.sched._park(partial(waiting.pop, task, False))
+            try:
+                await switch()
+            except CancelledError:
+                self._wake(addr)    # Pass the wakeup on
+                raise
+
+    def release(self, addr, sock, reuse=True):
+        if reuse and sock.fileno() != -1:
+            self._idle.setdefault(addr, []).append((sock, time.monotonic()))
+            if self._reaper is None:
+                self._reaper = self.sched.call_later(self.idle_timeout, self._reap)
+        else:
+            self._close(addr, sock)
+        self._wake(addr)
+
+    def _healthy(self, sock):
+        # An idle connection must have nothing to read: b'' means the server closed it,
+        # data means a leftover of a previous response
+        try:
+            sock.recv(1, socket.MSG_PEEK | socket.MSG_DONTWAIT)
+        except BlockingIOError:
+            return True     # Nothing to read, the connection is fine
+        except OSError:
+            pass
+        return False
+
+    def _close(self, addr, sock):
+        self.sched.poller.discard(sock)
+        sock.close()
+        self._open[addr] -= 1
+
+    def _wake(self, addr):
+        waiting = self._waiting.get(addr)
+        if waiting:
+            task = next(iter(waiting))
+            del waiting[task]
+            self.sched.ready.append(task)
+
+    def _reap(self):
+        self._reaper = None
+        deadline = time.monotonic() - self.idle_timeout
+        for addr, idle in self._idle.items():
+            # The oldest are at the start of the list
+            count = 0
+            while count < len(idle) and idle[count][1] <= deadline:
+                self._close(addr, idle[count][0])
+                count += 1
+            del idle[:count]
+            self.stats['reaped'] += count
+        if any(self._idle.values()):
+            self._reaper = self.sched.call_later(self.idle_timeout / 2, self._reap)
+
+    def close(self):
+        if self._reaper is not None:
+            self._reaper.cancel()
+            self._reaper = None
+        for addr, idle in self._idle.items():
+            for sock, _ in idle:
+                self._close(addr, sock)
+            idle.clear()
+
+
+class Checkout:
+    def __init__(self, pool, addr):
+        self.pool = pool
+        self.addr = addr
+
+    async def __aenter__(self):
+        self.sock = await self.pool.acquire(self.addr)
+        return self.sock
+
+    async def __aexit__(self, exc_type, exc, tb):
+        # After an error the connection may be in the middle of a request, do not reuse it
+        self.pool.release(self.addr, self.sock, reuse=exc_type is None)
+        return False
+
+
+if __name__ == '__main__':
+    from io_scheduler import echo_handler, gather
+
+    sched = io_scheduler.sched
+    server = socket.socket()
+    server.bind(('127.0.0.1', 0))
+    server.listen(100)
+    addr = server.getsockname()
+    accepted = []
+
+    async def echo_server():
+        while True:
+            client, _ = await sched.accept(server)
+            accepted.append(client)
+            sched.new_task(echo_handler(client))
+
+    async def request(pool, message):
+        async with pool.connection(addr) as sock:
+            await sched.send(sock, message)
+            return await sched.recv(sock, 100)
+
+    async def main():
+        pool = ConnectionPool(max_per_host=4, idle_timeout=0.5)
+
+        replies = await gather(*[request(pool, b'hello %d' % n) for n in range(50)])
+        assert replies == [b'Got:hello %d' % n for n in range(50)]
+        print('50 requests over', len(accepted), 'connections', pool.stats)
+        assert len(accepted) == 4
+
+        # The server drops the connections, the pool notices it on checkout and opens a new one
+        for client in accepted:
+            client.shutdown(socket.SHUT_RDWR)
+        await sched.sleep(0.05)
+        assert await request(pool, b'again') == b'Got:again'
+        print('after dropped connections', pool.stats)
+        assert pool.stats['unhealthy'] == 4 and pool.stats['connects'] == 5
+
+        # Idle connections are closed after idle_timeout
+        await sched.sleep(1.0)
+        print('after idle_timeout', pool.stats, 'idle left', sum(map(len, pool._idle.values())))
+        assert not any(pool._idle.values())
+
+        try:
+            await sched.connect(('127.0.0.1', 1), timeout=1.0)
+        except ConnectionRefusedError as e:
+            print('closed port:', e)
+
+        pool.close()
+        sched.poller.discard(server)
+        server.close()
+
+    server_task = sched.new_task(echo_server())
+    main_task = sched.new_task(main())
+    main_task.add_done_callback(lambda task: server_task.cancel())
+    sched.run()
+    main_task.result()
+
+
+"""
+    Пул исходящих соединений. Обработчик, который на каждый запрос открывает новое соединение к другому сервису,
+    платит за тройное рукопожатие TCP(а с TLS еще больше) на каждом запросе. Пул держит открытые соединения и отдает
+    их повторно.
+
+    Соединения хранятся по ключу - адресу(host, port).
+
+    acquire(addr) - Отдает соединение к addr:
+    Сначала берется свободное соединение, последнее возвращенное в пул(LIFO). Оно дольше всех было в работе и меньше
+    всех простаивало, поэтому сервер вряд ли успел его закрыть, а остальные могут спокойно устареть и быть закрыты.
+    Перед выдачей соединение проверяется(_healthy): recv() с MSG_PEEK | MSG_DONTWAIT не ждет и не забирает данные.
+    Если читать нечего(BlockingIOError) - соединение живое. Если пришел b'' - сервер его закрыл, если пришли данные -
+    в соединении остались данные от прошлого ответа. Такие соединения закрываются и берется следующее.
+    Если свободных нет, а открыто меньше max_per_host, то открывается новое через sched.connect() с connect_timeout.
+    Если открыто уже max_per_host, корутина ждет, пока кто то вернет соединение. Так пул не открывает к одному
+    сервису неограниченное количество соединений.
+
+    release(addr, sock, reuse) - Возвращает соединение в пул и будит одного ожидающего. Если reuse=False или сокет
+    закрыт, то соединение закрывается и освобождает место для нового.
+
+    connection(addr) - Асинхронный контекстный менеджер: async with pool.connection(addr) as sock. Если внутри
+    произошла ошибка, то соединение не возвращается в пул, так как оно могло остаться посреди запроса.
+
+    _reap - Закрывает соединения, которые простаивают дольше idle_timeout. Таймер ставится только пока в пуле есть
+    свободные соединения. Свободные соединения добавляются в конец списка, поэтому самые старые лежат в начале.
+
+    close() - Закрывает все свободные соединения и отменяет таймер.
+
+    stats - connects(открыто новых), reused(отдано повторно), unhealthy(закрыто при проверке), reaped(закрыто по
+    простою), waited(сколько раз ждали свободного места).
+"""
@@ -3,11 +3,22 @@ from collections import deque
 import heapq
 
 
+class TimerHandle:
+    def __init__(self, sched, func):
+        self.sched = sched
+        self.func = func
+
+    def cancel(self):
+        if self.sched is not None:     # Not fired or cancelled yet
+            self.sched._cancel(self)
+
+
 class Scheduler:
     def __init__(self):
         self.ready = deque()     # Functions ready to execute
         self.sleeping = []       # Sleeping functions
         self.sequence = 0
+        self.cancelled = 0       # Cancelled timers still sitting in the heap
         self.current = None
 
     def call_soon(self, func):
@@ -15,18 +26,34 @@ class Scheduler:
 
     def call_later(self, delay, func):
         self.sequence += 1
-        deadline = time.time() + delay     # Expiration time
-        heapq.heappush(self.sleeping, (deadline, self.sequence, func))
+        deadline = time.monotonic() + delay     # Expiration time
+        handle = TimerHandle(self, func)
+        heapq.heappush(self.sleeping, (deadline, self.sequence, handle))
+        return handle
+
+    def _cancel(self, handle):
+        handle.sched = None
+        handle.func = None      # Tombstone, skipped by run()
+        self.cancelled += 1
+        # Rebuild the heap once more than half of it are tombstones
+        if self.cancelled > 64 and self.cancelled * 2 > len(self.sleeping):
+            self.sleeping = [entry for entry in self.sleeping if entry[2].func is not None]
+            heapq.heapify(self.sleeping)
+            self.cancelled = 0
         
     def run(self):
         while self.ready or self.sleeping:
             if not self.ready:
                 # Find the nearest deadline
-                deadline, _, func = heapq.heappop(self.sleeping)
-                delta = deadline - time.time()
+                deadline, _, handle = heapq.heappop(self.sleeping)
+                if handle.func is None:
+                    self.cancelled -= 1
+                    continue
+                handle.sched = None
+                delta = deadline - time.monotonic()
                 if delta > 0:
                     time.sleep(delta)
-                self.ready.append(func)
+                self.ready.append(handle.func)
 
             while self.ready:
                 func = self.ready.popleft()
@@ -34,7 +61,9 @@ class Scheduler:
 
     # Coroutine-based functions 
     def new_task(self, coro):
-        self.ready.append(Task(coro))   # Wrapped coroutine
+        task = Task(coro)       # Wrapped coroutine
+        self.ready.append(task)
+        return task
 
     async def sleep(self, delay):
         self.call_later(delay, self.current)  
@@ -46,6 +75,12 @@ class Scheduler:
 class Task:
     def __init__(self, coro):
         self.coro = coro        # "Wrapped coroutine"
+        self._done = False
+        self._result = None
+        self._exception = None
+        self._retrieved = False
+        self._waiting = []      # Tasks awaiting this one
+        self._callbacks = []
 
     def __call__(self):
         try:
@@ -54,8 +89,57 @@ class Task:
             self.coro.send(None)
             if sched.current:
                 sched.ready.append(self)
-        except StopIteration:
-            pass
+        except StopIteration as e:
+            self._finish(e.value, None)
+        except Exception as e:
+            self._finish(None, e)   # Kept for whoever awaits the task, run() goes on
+
+    def _finish(self, result, exception):
+        self._done = True
+        self._result = result
+        self._exception = exception
+        sched.ready.extend(self._waiting)
+        for func in self._callbacks:
+            sched.ready.append(lambda func=func: func(self))
+        self._waiting = self._callbacks = None
+
+    def done(self):
+        return self._done
+
+    def result(self):
+        if not self._done:
+            raise RuntimeError('Task is not done yet')
+        self._retrieved = True
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+    def exception(self):
+        if not self._done:
+            raise RuntimeError('Task is not done yet')
+        self._retrieved = True
+        return self._exception
+
+    def add_done_callback(self, func):
+        if self._done:
+            sched.ready.append(lambda: func(self))
+        else:
+            self._callbacks.append(func)
+
+    def remove_done_callback(self, func):
+        if not self._done and func in self._callbacks:
+            self._callbacks.remove(func)
+
+    def __await__(self):
+        if not self._done:
+            self._waiting.append(sched.current)   # Woken up by _finish()
+            sched.current = None
+            yield
+        return self.result()
+
+    def __del__(self):
+        if self._exception is not None and not self._retrieved:
+            print(f'Task exception was never retrieved: {self._exception!r}')
 
 
 class Awaitable:
@@ -67,25 +151,120 @@ def switch():
     return Awaitable()
 
 
+FIRST_COMPLETED = 'FIRST_COMPLETED'
+FIRST_EXCEPTION = 'FIRST_EXCEPTION'
+ALL_COMPLETED = 'ALL_COMPLETED'
+
+
+def _ensure_task(aw):
+    return aw if isinstance(aw, Task) else sched.new_task(aw)
+
+
+async def wait(aws, return_when=ALL_COMPLETED):
+    tasks = [_ensure_task(aw) for aw in aws]
+    pending = [task for task in tasks if not task.done()]
+    failed = any(task.done() and task._exception is not None for task in tasks)
+
+    finished = not pending or (
+        return_when == FIRST_COMPLETED and len(pending) < len(tasks)
+        or return_when == FIRST_EXCEPTION and failed
+    )
+    if not finished:
+        waiter = sched.current
+        left = len(pending)
+        woken = False
+
+        def on_done(task):
+            nonlocal left, woken
+            left -= 1
+            if not woken and (not left or return_when == FIRST_COMPLETED
+                              or return_when == FIRST_EXCEPTION and task._exception is not None):
+                woken = True
+                sched.ready.append(waiter)
+
+        for task in pending:
+            task.add_done_callback(on_done)
+        sched.current = None
+        await switch()      # One wakeup, however many tasks there are
+        for task in pending:
+            task.remove_done_callback(on_done)
+
+    done = {task for task in tasks if task.done()}
+    return done, set(tasks) - done
+
+
+async def gather(*aws, return_exceptions=False):
+    tasks = [_ensure_task(aw) for aw in aws]
+    await wait(tasks, ALL_COMPLETED if return_exceptions else FIRST_EXCEPTION)
+    if return_exceptions:
+        return [task.exception() or task._result for task in tasks]
+    for task in tasks:
+        if task.done() and task.exception() is not None:
+            raise task.exception()
+    return [task.result() for task in tasks]
+
+
 sched = Scheduler()    # Background scheduler object
 
 
 class AsyncQueue:
-    def __init__(self):
+    def __init__(self, maxsize=0):
         self.items = deque()
-        self.waiting = deque()
+        self.maxsize = maxsize      # 0 - no limit
+        self.waiting = deque()      # Getters waiting for data
+        self.putters = deque()      # Putters waiting for free space
+
+    def full(self):
+        return 0 < self.maxsize <= len(self.items)
 
     async def put(self, item):
+        while self.full():
+            self.putters.append(sched.current)   # Wait for free space
+            sched.current = None
+            await switch()
+
         self.items.append(item)
         if self.waiting:
             sched.ready.append(self.waiting.popleft())
 
     async def get(self):
-        if not self.items:
+        while not self.items:
             self.waiting.append(sched.current)   # Put myself to sleep
             sched.current = None        # "Disappear"
             await switch()              # Switch to another task
-        return self.items.popleft()
+
+        item = self.items.popleft()
+        if self.putters:
+            sched.ready.append(self.putters.popleft())
+        return item
+
+    async def put_many(self, items):
+        items = list(items)
+        start = 0
+        while start < len(items):
+            while self.full():
+                self.putters.append(sched.current)
+                sched.current = None
+                await switch()
+
+            end = len(items) if not self.maxsize else start + self.maxsize - len(self.items)
+            batch = items[start:end]
+            self.items.extend(batch)
+            start += len(batch)
+            # One wakeup per waiting getter, a getter with get_many() takes the whole batch
+            for _ in range(min(len(batch), len(self.waiting))):
+                sched.ready.append(self.waiting.popleft())
+
+    async def get_many(self, n):
+        while not self.items:
+            self.waiting.append(sched.current)
+            sched.current = None
+            await switch()
+
+        batch = [self.items.popleft() for _ in range(min(n, len(self.items)))]
+        for _ in range(min(len(batch), len(self.putters))):
+            sched.ready.append(self.putters.popleft())
+        return batch
 
 
 # Coroutine-based tasks
@@ -150,6 +329,8 @@ sched.run()
     Цикла в методе __call__ нет, так как он реализован снаружи в методе планировщика run().
     В этом цикле как раз и вызывается либо функция обратного вызова либо наш калабл объект
 
+    Метод call_later возвращает TimerHandle с методом cancel(), так же как и в callbacks/scheduler.py.
+
     Также к планировщику основанному на колбэках, для работы с корутинами добавлено 2 метода - new_task и sleep
 
     new_task - Если мы хотим положить корутину в очередь готовых к вызову, то отдаем ее в метод планировщика new_task,
@@ -159,4 +340,34 @@ sched.run()
     должна быть вызвана и саму текущую, исполняемую корутину, из которой и был вызван метод sleep. После того, как корутина
     положена в очередь спящих, у нее убирается обозначение как текущей(исполняемой, self.current = None). И в конце концов
     метод sleep отдает контроль управления(await switch())
-"""
\ No newline at end of file
+
+    Task теперь не только обертка над корутиной, но и ее будущий результат(future). Когда корутина завершается,
+    StopIteration несет в себе возвращенное значение(e.value), оно сохраняется в _result. Если корутина выбросила
+    исключение, оно сохраняется в _exception, а цикл run() продолжает работать дальше, вместо того чтобы упасть.
+    Результат можно получить через task.result(), который выбросит сохраненное исключение, если оно было.
+
+    Объект Task можно ожидать(result = await task). Если задача еще не завершена, то ожидающая корутина кладется в
+    список _waiting задачи и перестает быть текущей. Когда задача завершается(_finish), все ожидающие ее корутины
+    кладутся в очередь готовых. Так же можно подписаться на завершение задачи функцией add_done_callback(func).
+    Если исключение задачи так никто и не получил, то при удалении задачи об этом печатается сообщение.
+
+    new_task теперь возвращает объект Task.
+
+    wait(tasks, return_when) - Ждет завершения задач и возвращает два множества: завершенные и незавершенные.
+    ALL_COMPLETED - ждать всех, FIRST_COMPLETED - первой завершившейся, FIRST_EXCEPTION - первой упавшей(или всех).
+    Ожидающая корутина подписывается на завершение каждой задачи и считает, сколько осталось, поэтому просыпается
+    ровно один раз, а не опрашивает задачи в цикле.
+
+    gather(*coros) - Запускает корутины как задачи и возвращает список их результатов в том же порядке. Если одна из
+    задач упала, то gather выбрасывает ее исключение, а с return_exceptions=True возвращает исключения в списке
+    вместо результатов.
+
+    maxsize - Ограничение размера очереди. Если очередь заполнена, то производитель в put() не кладет элемент, а
+    засыпает в очереди ожидающих производителей(putters), так же как потребитель засыпает в get() при пустой очереди.
+    Потребитель, забрав элемент, будит одного ожидающего производителя. Так быстрый производитель не может
+    заполнить всю память, а вынужден ждать, пока потребитель освободит место(backpressure). Производитель и потребитель
+    после пробуждения еще раз проверяют очередь в цикле while, так как место или элемент мог забрать кто то другой.
+
+    put_many(items) - Кладет сразу пачку элементов, а get_many(n) - забирает до n элементов за раз. Вместо того чтобы
+    будить потребителя на каждый элемент, на всю пачку приходится одно пробуждение и одно переключение задач.
+"""
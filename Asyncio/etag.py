@@ -0,0 +1,181 @@
+import hashlib
+import mmap
+import multiprocessing
+import os
+import struct
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from functools import wraps
+
+from http_server import Response
+
+
+class Versions:
+    # Version counters of models: every write to a model bumps its version, so (model, version) names the data
+    def __init__(self):
+        # Counters start again in every process, the epoch keeps tags of different processes
+        # (sharded_server workers, restarts) from ever being equal
+        self.epoch = os.urandom(4).hex()
+        self._versions = {}     # model -> (version, modified at)
+        self._started = time.time()     # Models not written yet are as old as the data the process started with
+
+    def get(self, model):
+        return self._versions.get(model, (0, self._started))
+
+    def bump(self, model):
+        version, _ = self.get(model)
+        self._versions[model] = (version + 1, time.time())
+
+    def etag(self, models):
+        return 'W/"%s-%s"' % (self.epoch, '.'.join(str(self.get(model)[0]) for model in models))
+
+    def modified(self, models):
+        return max(self.get(model)[1] for model in models)
+
+
+class SharedVersions(Versions):
+    # Versions of sharded_server workers: a table in shared memory, created in the launcher before the workers are
+    # forked, so a write in one worker is seen by all of them. The models are listed up front, one slot each
+    _SLOT = struct.Struct('<Qd')    # version, modified at
+
+    def __init__(self, models):
+        super().__init__()
+        self._slots = {model: n * self._SLOT.size for n, model in enumerate(models)}
+        self._memory = mmap.mmap(-1, max(len(self._slots), 1) * self._SLOT.size)
+        self._lock = multiprocessing.Lock()
+
+    def get(self, model):
+        version, modified = self._SLOT.unpack_from(self._memory, self._slots[model])
+        return version, modified or self._started
+
+    def bump(self, model):
+        offset = self._slots[model]
+        with self._lock:    # Two workers writing at once must not end up with the same version
+            version, _ = self._SLOT.unpack_from(self._memory, offset)
+            self._SLOT.pack_into(self._memory, offset, version + 1, time.time())
+
+
+versions = Versions()
+
+
+def etag_matches(if_none_match, etag):
+    # Weak comparison: W/"x" and "x" are the same tag
+    if if_none_match.strip() == '*':
+        return True
+    etag = etag.removeprefix('W/')
+    return any(tag.strip().removeprefix('W/') == etag for tag in if_none_match.split(','))
+
+
+def not_modified(etag, last_modified=None):
+    headers = {'ETag': etag}
+    if last_modified is not None:
+        headers['Last-Modified'] = last_modified
+    return Response(b'', 304, headers, content_type=None)
+
+
+def precondition_failed(etag):
+    return Response(b'', 412, {'ETag': etag}, content_type=None)
+
+
+def conditional(*models, registry=versions):
+    # Handler decorator: answers 304 from the versions of models without calling the handler.
+    # The request is the last positional argument, as the router passes it to handlers and viewset actions
+    def decorator(handler):
+        @wraps(handler)
+        async def wrapper(*args, **kwargs):
+            request = args[-1]
+            etag = registry.etag(models)
+            modified = registry.modified(models)
+            # Last-Modified has one second resolution: while the second of the last write goes on, another write
+            # would get the same value, so it is sent only for earlier seconds
+            last_modified = formatdate(int(modified), usegmt=True) if int(modified) < int(time.time()) else None
+
+            safe = request.method in ('GET', 'HEAD')
+            if_none_match = request.headers.get('if-none-match')
+            if if_none_match is not None:
+                if etag_matches(if_none_match, etag):
+                    # For a write the match means its precondition failed, the handler must not run
+                    return not_modified(etag, last_modified) if safe else precondition_failed(etag)
+            elif safe and last_modified is not None:
+                since = request.headers.get('if-modified-since')
+                if since is not None and _parse_date(since) >= int(modified):
+                    return not_modified(etag, last_modified)
+
+            response = await handler(*args, **kwargs)
+            if response.status == 200:
+                response.headers['ETag'] = etag
+                if last_modified is not None:
+                    response.headers['Last-Modified'] = last_modified
+            return response
+        return wrapper
+    return decorator
+
+
+def _parse_date(value):
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return -1
+
+
+class BodyETag:
+    # For handlers whose data has no version counter: the tag is a hash of the rendered body, so a 304 saves
+    # the bytes on the wire but not the rendering
+    def __init__(self, handler):
+        self.handler = handler
+
+    async def __call__(self, request):
+        response = await self.handler(request)
+        # Other methods have already done their work by now, it is too late to check a precondition
+        if request.method not in ('GET', 'HEAD') or response.status != 200 or 'ETag' in response.headers or not isinstance(response.body, bytes):
+            return response
+        etag = 'W/"%s"' % hashlib.blake2b(response.body, digest_size=8).hexdigest()
+        if_none_match = request.headers.get('if-none-match')
+        if if_none_match is not None and etag_matches(if_none_match, etag):
+            return not_modified(etag)
+        response.headers['ETag'] = etag
+        return response
+
+
+"""
+    Условные запросы(conditional requests): клиент, у которого уже есть ответ, спрашивает, изменился ли он, и если
+    нет, то получает 304 Not Modified без тела.
+
+    ETag - Метка версии ответа, которую сервер отправляет вместе с ответом. Клиент в следующем запросе присылает ее в
+    If-None-Match, и если метка совпадает с текущей, сервер отвечает 304. W/ в начале - слабая метка: ответ тот же по
+    смыслу, но байты могут отличаться(например, сжат по другому, см. compression.py), поэтому метка одна для всех
+    Content-Encoding. If-None-Match: * совпадает с любой меткой.
+    Last-Modified и If-Modified-Since - То же по времени изменения, с точностью до секунды. Проверяется, только если
+    клиент не прислал If-None-Match.
+
+    Versions - Счетчик версий на каждую модель. Любая запись в модель(создание, изменение, удаление) вызывает
+    versions.bump('users'). Метка ответа строится из версий моделей, из которых он собран, поэтому проверить ее можно
+    до того, как делать запрос к данным и сериализацию. Счетчики хранятся в памяти процесса и начинаются заново при
+    каждом запуске, поэтому в метку добавлена случайная epoch: без нее два процесса(или процесс после перезапуска) с
+    разными данными, но одинаковыми номерами версий отвечали бы 304 на чужую метку.
+    Versions годится только для одного процесса. Воркеры sharded_server.py - это отдельные процессы, и запись,
+    сделанная в одном из них, увеличила бы версию только у него: остальные продолжали бы отвечать 304 на метку
+    устаревших данных.
+
+    SharedVersions(models) - Версии для нескольких процессов. Счетчики лежат в разделяемой памяти(mmap без файла),
+    которая создается в родительском процессе до fork() и после него остается общей для всех воркеров, а вместе с
+    ней и epoch. Поэтому объект нужно создать до запуска Launcher, например при импорте модуля с обработчиками, и
+    передать в conditional(..., registry=shared). Список моделей задается сразу, на каждую выделяется слот(версия и
+    время записи). bump() выполняется под межпроцессной блокировкой, чтобы две одновременные записи не получили одну
+    и ту же версию. Между машинами память не общая, там счетчик нужно хранить в общей базе(например Redis).
+
+    conditional(*models) - Декоратор обработчика или экшена вьюсета:
+    @conditional('users')
+    async def list(self, request): ...
+    Если метка из If-None-Match совпадает с текущей, то 304 отправляется без вызова обработчика. Иначе обработчик
+    вызывается, и к его ответу добавляются ETag и Last-Modified.
+    304 отвечается только на GET и HEAD. Для остальных методов(PUT, DELETE и т.д.) совпадение If-None-Match значит,
+    что условие записи не выполнено(например If-None-Match: * - создать, только если ресурса еще нет), и
+    отправляется 412 Precondition Failed, тоже без вызова обработчика. If-Modified-Since для них не проверяется.
+    Last-Modified отправляется, только если секунда последней записи уже прошла. Иначе вторая запись в ту же секунду
+    получила бы то же время, и клиент со старыми данными получил бы 304 по If-Modified-Since.
+
+    BodyETag(handler) - Для данных без счетчика версий: метка - это хеш готового тела ответа. Обработчик и
+    сериализация все равно выполняются на каждый запрос, экономится только передача тела. Метка проверяется только
+    у GET и HEAD: остальные запросы к моменту получения ответа уже выполнили запись.
+"""
@@ -11,7 +11,7 @@ class Scheduler:
         self.sequence = 0
 
     def sleep(self, delay):
-        deadline = time.time() + delay
+        deadline = time.monotonic() + delay
         self.sequence += 1
         heapq.heappush(self.sleeping, (deadline, self.sequence, self.current))
         self.current = None  # "Disappear"
@@ -23,7 +23,7 @@ class Scheduler:
         while self.ready or self.sleeping:
             if not self.ready:
                 deadline, _, coro = heapq.heappop(self.sleeping)
-                delta = deadline - time.time()
+                delta = deadline - time.monotonic()
                 if delta > 0:
                     time.sleep(delta)
                 self.ready.append(coro)
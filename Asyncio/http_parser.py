@@ -0,0 +1,315 @@
+import re
+from array import array
+from http import HTTPStatus
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message='', headers=None):
+        super().__init__(message or HTTPStatus(status).phrase)
+        self.status = status
+        self.headers = headers or {}    # Sent with the error response, e.g. Allow for 405
+
+
+class Headers:
+    # Read only mapping over the receive buffer: names and values are decoded when they are looked up
+    __slots__ = ('_buf', '_start', '_end', '_offsets', '_found')
+
+    def __init__(self, buf, start, end):
+        self._buf = buf
+        self._start = start         # The \r\n ending the request line
+        self._end = end             # The \r\n ending the last header
+        self._offsets = None        # name start, name end, value start, value end for every header
+        self._found = None          # Values already looked up
+
+    def _index(self):
+        offsets = self._offsets
+        if offsets is None:
+            offsets = self._offsets = array('I')
+            for match in _HEADER.finditer(self._buf, self._start + 2, self._end + 2):
+                offsets.extend(match.span(1) + match.span(2))
+        return offsets
+
+    def __len__(self):
+        return len(self._index()) // 4
+
+    def __iter__(self):
+        buf, offsets = self._buf, self._index()
+        for i in range(0, len(offsets), 4):
+            yield buf[offsets[i]:offsets[i + 1]].decode('latin-1').lower()
+
+    def __contains__(self, name):
+        return self.get(name) is not None
+
+    def __getitem__(self, name):
+        value = self.get(name)
+        if value is None:
+            raise KeyError(name)
+        return value
+
+    def get(self, name, default=None):
+        found = self._found
+        if found is None:
+            found = self._found = {}
+        elif name in found:
+            value = found[name]
+            return default if value is None else value
+
+        # One search over the head in C, only the values of this header are copied out of the buffer
+        pattern = _lookups.get(name)
+        if pattern is None:
+            key = re.escape(name.encode('latin-1'))
+            # The lookahead on the first letter lets the search skip most lines without the slower case folding
+            pattern = _lookups[name] = re.compile(rb'\r\n(?=[%s%s])%s:[ \t]*([^\r\n]*)' % (
+                key[:1].lower(), key[:1].upper(), key), re.IGNORECASE)
+        values = pattern.findall(self._buf, self._start, self._end)
+        if len(values) == 1:
+            value = values[0].decode('latin-1').rstrip(' \t')
+        elif values:
+            value = ', '.join(v.decode('latin-1').rstrip(' \t') for v in values)     # Repeated headers are joined
+        else:
+            value = None
+        found[name] = value
+        return default if value is None else value
+
+    def items(self):
+        return [(name, self[name]) for name in dict.fromkeys(self)]
+
+
+class Request:
+    __slots__ = ('_buf', '_line', '_head', 'keep_alive', '_body', '_method', '_headers')
+
+    def __init__(self, buf, line, head, keep_alive):
+        self._buf = buf
+        self._line = line           # (start, end) of the method, the target and the version
+        self._head = head           # (start, end) of the headers
+        self.keep_alive = keep_alive
+        self._body = slice(0, 0)    # Offsets in the buffer until it is read, bytes after that
+        self._method = None
+        self._headers = None
+
+    def _field(self, n):
+        start, end = self._line[n]
+        return self._buf[start:end].decode('latin-1')
+
+    @property
+    def method(self):
+        # Read by the server and the router for every request, so it is decoded once
+        method = self._method
+        if method is None:
+            method = self._method = self._field(1)
+        return method
+
+    @property
+    def target(self):
+        return self._field(2)
+
+    @property
+    def version(self):
+        return self._field(3)
+
+    @property
+    def path(self):
+        return self.target.partition('?')[0]
+
+    @property
+    def query(self):
+        return self.target.partition('?')[2]
+
+    @property
+    def headers(self):
+        headers = self._headers
+        if headers is None:
+            headers = self._headers = Headers(self._buf, *self._head)
+        return headers
+
+    @property
+    def body(self):
+        body = self._body
+        if type(body) is slice:
+            body = self._body = bytes(self._buf[body])
+        return body
+
+
+_TOKEN = rb"[!#$%&'*+.^_`|~0-9A-Za-z-]+"
+_REQUEST_LINE = re.compile(rb'(%s) ([^ \r\n]+) (HTTP/[0-9.]+)\r\n' % _TOKEN)
+_HEADER = re.compile(rb'(%s):[ \t]*([^\r\n]*?)[ \t]*\r\n' % _TOKEN)
+_FRAMING = re.compile(rb'\r\n(?=[cCtTeE])(content-length|transfer-encoding|connection|expect)([ \t]*):[ \t]*'
+                      rb'([^\r\n]*?)[ \t]*(?=\r\n)', re.IGNORECASE)
+_CHUNK_SIZE = re.compile(rb'([0-9A-Fa-f]{1,8})(?:;[^\r\n]*)?')     # Size and extensions, at most 4 GB
+_MAX_CHUNK_LINE = 1024      # Chunk size line with its extensions and \r\n
+_lookups = {}       # Header name -> compiled search for its values
+
+
+class RequestParser:
+    # Incremental: parse() is called every time more data arrives, it remembers where it stopped
+
+    def __init__(self, max_header=65536, max_body=1 << 20):
+        self.max_header = max_header
+        self.max_body = max_body
+        self.reset(0)
+
+    def reset(self, start):
+        self.start = start          # Where the current request begins in the buffer
+        self.end = None             # Where it ends once it is complete
+        self.expect_continue = False    # The head asks for 100 Continue before the body is sent
+        self._scan = start          # Where to continue looking for the end of the head
+        self._request = None        # Head parsed, the body is not complete yet
+        self._body = None           # Where the body begins
+        self._length = 0            # Content-Length of the body
+        self._chunks = None         # Parts of a chunked body received so far, the rest of its state is set
+                                    # up by _parse_head() when the body is chunked
+
+    def parse(self, buf):
+        if self._request is None:
+            end = buf.find(b'\r\n\r\n', self._scan)
+            if end < 0:
+                if len(buf) - self.start > self.max_header:
+                    raise HTTPError(431)
+                self._scan = max(self.start, len(buf) - 3)     # The separator may be cut in half
+                return None
+            if end - self.start > self.max_header:
+                raise HTTPError(431)
+            self._request = self._parse_head(buf, end)
+            self._body = end + 4
+        request = self._request
+
+        if self._chunks is not None:
+            if not self._parse_chunks(buf):
+                return None
+            request._body = b''.join(self._chunks)
+        else:
+            end = self._body + self._length
+            if len(buf) < end:
+                return None
+            request._body = slice(self._body, end)
+            self.end = end
+        return request
+
+    def _parse_head(self, buf, end):
+        # The head is searched by regular expressions working on the buffer itself: no line is split off or
+        # decoded here, only the headers that decide where the request ends are read
+        line = _REQUEST_LINE.match(buf, self.start, end + 2)
+        if line is None:
+            raise HTTPError(400, 'Bad request line')
+        if not line.group(3).startswith(b'HTTP/1.'):
+            raise HTTPError(505)
+        line_end = line.end() - 2
+        version = line.group(3)
+        head = (line_end, end)
+
+        fields = _FRAMING.findall(buf, line_end, end + 2)
+        if not fields:      # Most requests: no body and nothing special about the connection
+            return Request(buf, line.regs, head, version == b'HTTP/1.1')
+
+        value = {}
+        for name, space, field in fields:
+            name = name.lower()
+            if space:
+                raise HTTPError(400, 'Whitespace before the colon in %s' % name.decode())
+            if name in value:
+                raise HTTPError(400, 'Repeated %s' % name.decode())
+            value[name] = field.lower()
+
+        if b'transfer-encoding' in value:
+            if value[b'transfer-encoding'] != b'chunked':
+                raise HTTPError(501, 'Only chunked transfer encoding is supported')
+            if b'content-length' in value:
+                raise HTTPError(400, 'Both Content-Length and Transfer-Encoding')
+            self._chunks = []
+            self._chunked_size = 0
+            self._chunk_pos = end + 4       # Offset of the next chunk size line or trailer
+            self._trailers = None           # Where the trailers begin, once the last chunk is read
+        elif b'content-length' in value:
+            if not value[b'content-length'].isdigit():
+                raise HTTPError(400, 'Bad Content-Length')
+            self._length = int(value[b'content-length'])
+            if self._length > self.max_body:
+                raise HTTPError(413)
+
+        connection = value.get(b'connection', b'')
+        if version == b'HTTP/1.1':
+            keep_alive = b'close' not in connection
+        else:
+            keep_alive = b'keep-alive' in connection
+        self.expect_continue = value.get(b'expect') == b'100-continue'
+        return Request(buf, line.regs, head, keep_alive)
+
+    def _parse_chunks(self, buf):
+        # chunk: <hex size>[;extensions]\r\n<data>\r\n ... 0\r\n[trailers]\r\n
+        pos = self._chunk_pos
+        while True:
+            if self._trailers is not None:
+                line_end = buf.find(b'\r\n', pos)
+                # The trailers are a second head and get the same limit
+                if (len(buf) if line_end < 0 else line_end) - self._trailers > self.max_header:
+                    raise HTTPError(431)
+                if line_end < 0:
+                    return False
+                if line_end == pos:     # Empty line ends the trailers and the body
+                    self.end = line_end + 2
+                    return True
+                pos = self._chunk_pos = line_end + 2
+                continue
+            line_end = buf.find(b'\r\n', pos, pos + _MAX_CHUNK_LINE)
+            if line_end < 0:
+                if len(buf) - pos >= _MAX_CHUNK_LINE:
+                    raise HTTPError(400, 'Chunk size line too long')
+                return False
+            # Only plain hex digits: int(x, 16) alone would also take '-2', '0x5', '1_0' and spaces, and a proxy in
+            # front of the server would not read those sizes the way we do
+            size = _CHUNK_SIZE.fullmatch(buf, pos, line_end)
+            if size is None:
+                raise HTTPError(400, 'Bad chunk size')
+            size = int(size.group(1), 16)
+            if self._chunked_size + size > self.max_body:      # Before waiting for the data, not after
+                raise HTTPError(413)
+            if size == 0:
+                self._trailers = line_end + 2
+                pos = self._chunk_pos = line_end + 2
+                continue
+            data_end = line_end + 2 + size
+            if len(buf) < data_end + 2:
+                return False
+            if buf[data_end:data_end + 2] != b'\r\n':
+                raise HTTPError(400, 'Bad chunk')
+            self._chunks.append(bytes(buf[line_end + 2:data_end]))
+            self._chunked_size += size
+            pos = self._chunk_pos = data_end + 2
+
+
+"""
+    Разбор HTTP запроса без копирования. Формат сообщения описан в HTTP/draft.py: стартовая строка, заголовки,
+    пустая строка и тело.
+
+    Простой разбор(head.split(b'\\r\\n'), затем split каждой строки) создает по несколько объектов bytes и str на каждый
+    заголовок, даже если обработчик не прочитает ни одного из них. Здесь буфер соединения не режется на строки, а
+    запоминаются только смещения.
+
+    RequestParser.parse(buf) - buf - это bytearray, в который дописываются данные из сокета. Конец заголовков
+    (\\r\\n\\r\\n) ищется через buf.find() с того места, где остановился прошлый поиск, поэтому если заголовки пришли
+    за несколько recv(), уже просмотренные данные заново не просматриваются. find(), как и регулярные выражения,
+    работает прямо по буферу и ничего не копирует.
+    Когда заголовки пришли целиком, стартовая строка разбирается регулярным выражением, от него остаются только
+    смещения метода, цели(target) и версии(match.regs). Из заголовков сразу нужны только те, от которых зависит, где
+    кончается запрос: Content-Length, Transfer-Encoding, Connection, Expect. Они ищутся одним проходом регулярного
+    выражения(_FRAMING) по всем заголовкам. Цикл по строкам на Python был бы медленнее, чем split, который работает на
+    C, поэтому по заголовкам проходят только find() и регулярные выражения. Опережающая проверка первой буквы
+    (?=[cCtTeE]) позволяет быстро пропускать строки, не сравнивая их без учета регистра. У большинства запросов(GET)
+    ни одного из этих заголовков нет, и запрос создается сразу.
+    Повтор любого из этих заголовков или пробел перед двоеточием - ошибка 400, так как иначе прокси перед сервером
+    и сам сервер могут по разному понять, где кончается запрос(request smuggling).
+
+    Request - Хранит ссылку на буфер и смещения. method, target, version, path, query декодируются в str при
+    обращении(method запоминается, его читают у каждого запроса). body - срез буфера, копируется в bytes при первом
+    обращении. Тело chunked склеивается сразу.
+    Headers - Заголовки, только для чтения, создаются при первом обращении к request.headers.
+    get(name) - Один поиск по заголовкам регулярным выражением для этого имени(без учета регистра), из буфера
+    копируются только значения этого заголовка. Выражения компилируются один раз на имя, результат запоминается.
+    Повторяющиеся заголовки склеиваются через ', '.
+    Перебор(iter, len, items) строит индекс: смещения начала и конца имени и значения каждого заголовка в array('I')
+    - по 4 байта на число, а не объект int на каждое.
+
+    Смещения указывают в буфер соединения, поэтому сервер не удаляет из него разобранные запросы(del buf[:n]
+    сдвинул бы все смещения), а после ответа на пачку запросов переносит неразобранный остаток в новый буфер. Старый
+    буфер живет, пока на него ссылаются запросы. В буфер только дописываются данные, смещения при этом остаются верными.
+"""
@@ -0,0 +1,334 @@
+import socket
+import sys
+import time
+from email.utils import formatdate
+from http import HTTPStatus
+
+import io_scheduler
+from http_parser import HTTPError, RequestParser
+from streams import StreamWriter
+
+
+class Response:
+    __slots__ = ('status', 'headers', 'body')
+
+    def __init__(self, body=b'', status=200, headers=None, content_type='text/plain; charset=utf-8'):
+        if isinstance(body, str):
+            body = body.encode()
+        self.status = status
+        self.headers = headers if headers is not None else {}
+        if content_type and 'Content-Type' not in self.headers:
+            self.headers['Content-Type'] = content_type
+        self.body = body
+
+
+class StreamingResponse(Response):
+    # The body is an async iterator of bytes or str, sent with chunked transfer encoding as it is produced
+    __slots__ = ()
+
+    def __init__(self, body, status=200, headers=None, content_type='text/plain; charset=utf-8'):
+        super().__init__(b'', status, headers, content_type)
+        self.body = body
+
+
+_STATUS_LINES = {status.value: f'HTTP/1.1 {status.value} {status.phrase}\r\n'.encode() for status in HTTPStatus}
+_date = [0, b'']
+
+
+def date_header():
+    # Formatting the date on every response is wasted work, it only changes once a second
+    now = int(time.time())
+    if now != _date[0]:
+        _date[0] = now
+        _date[1] = f'Date: {formatdate(now, usegmt=True)}\r\n'.encode()
+    return _date[1]
+
+
+class HTTPServer:
+    def __init__(self, handler, max_header=65536, max_body=1 << 20, keepalive_timeout=15.0, recv_size=65536,
+                 stream_chunk=16384, request_timeout=30.0):
+        self.handler = handler      # async def handler(request) -> Response
+        self.max_header = max_header
+        self.max_body = max_body
+        self.keepalive_timeout = keepalive_timeout
+        self.request_timeout = request_timeout      # For a whole request, counted from its first byte
+        self.recv_size = recv_size
+        self.stream_chunk = stream_chunk    # Small pieces of a streamed body are joined up to this size
+        self.stats = {'connections': 0, 'requests': 0, 'max_pipelined': 0, 'errors': 0}
+
+    async def serve(self, addr, backlog=1024):
+        sched = io_scheduler.sched
+        sock = socket.socket()
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(addr)
+        sock.listen(backlog)
+        while True:
+            for client, _ in await sched.accept_many(sock):
+                sched.new_task(self.handle(client))
+
+    async def handle(self, sock):
+        sched = io_scheduler.sched
+        sock.setblocking(False)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        writer = StreamWriter(sock)
+        parser = RequestParser(self.max_header, self.max_body)
+        buf = bytearray()
+        out = bytearray()       # Heads of responses, reused while the writer has nothing queued
+        self.stats['connections'] += 1
+        try:
+            while True:
+                # Read until at least one request is complete
+                deadline = None
+                while True:
+                    try:
+                        request = parser.parse(buf)
+                    except HTTPError as e:
+                        self.stats['errors'] += 1
+                        writer.write(self._error_response(e))
+                        return
+                    if request is not None:
+                        break
+                    if parser.expect_continue:
+                        writer.write(b'HTTP/1.1 100 Continue\r\n\r\n')
+                        parser.expect_continue = False
+                    if parser.start == len(buf):
+                        timeout = self.keepalive_timeout    # Between requests
+                    elif self.request_timeout is None:
+                        timeout = None
+                    else:
+                        # A client sending a byte now and then must not hold the connection and its buffer forever
+                        if deadline is None:
+                            deadline = time.monotonic() + self.request_timeout
+                        timeout = max(deadline - time.monotonic(), 0)
+                    try:
+                        if not await self._fill(sched, sock, buf, timeout):
+                            return
+                    except TimeoutError:
+                        if deadline is not None:
+                            self.stats['errors'] += 1
+                            writer.write(self._error_response(HTTPError(408)))
+                        return
+
+                # Answer this request and every other one already in the buffer (pipelining),
+                # all the responses go out with one sendmsg()
+                if writer.get_write_buffer_size():
+                    out = bytearray()       # Still referenced by queued output
+                else:
+                    out.clear()
+                parts = []
+                count = 0
+                stream = None
+                while request is not None:
+                    count += 1
+                    keep_alive = request.keep_alive
+                    response = await self._respond(request)
+                    no_body = request.method == 'HEAD' or response.status in (204, 304)
+                    if type(response) is StreamingResponse:
+                        if no_body:
+                            await self._close_stream(response.body)
+                        else:
+                            stream = response.body
+                        chunked = request.version != 'HTTP/1.0'
+                        keep_alive = keep_alive and chunked     # Without chunks the end of the body is the close
+                    start = len(out)
+                    self._write_head(out, response, request, keep_alive)
+                    parts.append((start, len(out), b'' if no_body or stream is not None else response.body))
+                    parser.reset(parser.end)
+                    if not keep_alive or stream is not None:
+                        break       # The next pipelined requests wait until the stream is sent
+                    try:
+                        request = parser.parse(buf)
+                    except HTTPError:
+                        request = None      # Answered on the next turn of the outer loop
+                view = memoryview(out)
+                writer.writelines(piece for start, end, body in parts for piece in (view[start:end], body))
+                del view
+                if stream is not None and not await self._stream(writer, stream, chunked):
+                    keep_alive = False
+
+                self.stats['requests'] += count
+                if count > self.stats['max_pipelined']:
+                    self.stats['max_pipelined'] = count
+                # Requests keep offsets into buf, the unparsed rest is moved to a new buffer instead of
+                # deleting the answered requests from this one
+                buf = buf[parser.start:]
+                parser.reset(0)
+                await writer.drain()
+                if not keep_alive:
+                    return
+        except (ConnectionError, TimeoutError):
+            pass
+        finally:
+            writer.close()
+
+    async def _fill(self, sched, sock, buf, timeout):
+        if timeout is not None:
+            async with sched.timeout(timeout):
+                await sched._readable(sock)
+        else:
+            await sched._readable(sock)
+        # The pooled buffer is taken only once data has arrived, idle keep-alive connections hold none
+        chunk = sched.buffers.acquire()
+        try:
+            n = sock.recv_into(chunk)
+            buf += chunk[:n]
+        finally:
+            sched.buffers.release(chunk)
+        return n
+
+    async def _respond(self, request):
+        try:
+            return await self.handler(request)
+        except HTTPError as e:
+            return Response(str(e), e.status, dict(e.headers))
+        except Exception as e:
+            self.stats['errors'] += 1
+            print('Error in handler:', repr(e))
+            return Response('Internal Server Error', 500)
+
+    async def _stream(self, writer, body, chunked):
+        # Returns False if the body could not be sent in full and the connection must be closed
+        pending = bytearray()
+        try:
+            async for data in body:
+                if isinstance(data, str):
+                    data = data.encode()
+                if not pending and len(data) >= self.stream_chunk:
+                    self._write_chunk(writer, data, chunked)
+                else:
+                    pending += data
+                    if len(pending) < self.stream_chunk:
+                        continue
+                    self._write_chunk(writer, pending, chunked)
+                    pending = bytearray()       # The old one stays queued in the writer until it is sent
+                await writer.drain()            # Waits only when the client reads slower than the body is produced
+            if pending:
+                self._write_chunk(writer, pending, chunked)
+            if chunked:
+                writer.write(b'0\r\n\r\n')
+            return True
+        except (ConnectionError, TimeoutError):
+            raise
+        except Exception as e:
+            # The head is already sent, the client sees a body without the last chunk
+            self.stats['errors'] += 1
+            print('Error in streamed body:', repr(e))
+            return False
+        finally:
+            await self._close_stream(body)
+
+    def _write_chunk(self, writer, data, chunked):
+        if chunked:
+            writer.writelines((b'%x\r\n' % len(data), data, b'\r\n'))
+        else:
+            writer.write(data)
+
+    async def _close_stream(self, body):
+        aclose = getattr(body, 'aclose', None)      # Runs the finally blocks of an async generator
+        if aclose is not None:
+            await aclose()
+
+    def _write_head(self, out, response, request, keep_alive):
+        out += _STATUS_LINES.get(response.status) or f'HTTP/1.1 {response.status} Unknown\r\n'.encode()
+        out += date_header()
+        for name, value in response.headers.items():
+            out += f'{name}: {value}\r\n'.encode('latin-1')
+        if type(response) is StreamingResponse:
+            if request.version != 'HTTP/1.0':
+                out += b'Transfer-Encoding: chunked\r\n'
+        elif response.status not in (204, 304):     # These never have a body
+            out += b'Content-Length: %d\r\n' % len(response.body)
+        if not keep_alive:
+            out += b'Connection: close\r\n'
+        elif request.version == 'HTTP/1.0':
+            out += b'Connection: keep-alive\r\n'
+        out += b'\r\n'
+
+    def _error_response(self, error):
+        body = str(error).encode()
+        return (_STATUS_LINES[error.status] + date_header() +
+                b'Content-Type: text/plain\r\nContent-Length: %d\r\nConnection: close\r\n\r\n%s' % (len(body), body))
+
+
+async def hello(request):
+    if request.method == 'POST':
+        return Response(b'Got %d bytes' % len(request.body))
+    return Response(b'Hello, World!')
+
+
+if __name__ == '__main__':
+    from sharded_server import Launcher
+
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else 8080
+    server = HTTPServer(hello)
+    if workers == 1:
+        io_scheduler.sched.new_task(server.serve(('', port)))
+        io_scheduler.sched.run()
+    else:
+        Launcher(('', port), handler=server.handle, workers=workers).run()
+
+
+"""
+    HTTP/1.1 сервер на планировщике из io_scheduler.py. Формат сообщений описан в HTTP/draft.py: стартовая строка,
+    заголовки, пустая строка и тело.
+
+    HTTPServer(handler) - handler - это корутина, которая получает Request и возвращает Response.
+    serve(addr) - Принимает соединения пачками(sched.accept_many()) и на каждое запускает задачу handle().
+    handle(sock) - Обслуживает одно соединение. Его можно передать в Launcher из sharded_server.py, чтобы запустить
+    сервер на всех ядрах: python http_server.py 4 8080.
+
+    RequestParser(http_parser.py) - Инкрементальный разбор без копирования. Данные из сокета дописываются в буфер
+    соединения по мере прихода, и parse(buf) вызывается снова, продолжая с того места, где остановился.
+    После заголовков тело читается либо по Content-Length, либо по частям(Transfer-Encoding: chunked). В chunked
+    каждая часть - это размер в шестнадцатеричном виде, \\r\\n, данные и \\r\\n, а часть размером 0 завершает тело,
+    после нее могут идти дополнительные заголовки(trailers) и пустая строка. _chunk_pos - Начало следующей части,
+    поэтому уже разобранные части не разбираются заново. Размер части - только шестнадцатеричные цифры, не больше 8:
+    int(x, 16) принял бы и '-2', и '0x5', и '1_0', и пробелы вокруг. Отрицательный размер уменьшал бы счетчик тела
+    и обходил max_body, а прокси перед сервером, который читает такой размер иначе, позволил бы спрятать один запрос
+    внутри другого(request smuggling). Превышение max_body проверяется по размеру части, до того как пришли ее данные.
+    Строка размера вместе с расширениями(;name=value) ограничена _MAX_CHUNK_LINE(1 КБ), а trailers - max_header, как
+    и заголовки: иначе клиент, который не присылает \r\n, заставлял бы сервер копить в буфере сколько угодно данных.
+    Ошибки формата - это HTTPError с кодом ответа: 400(неверный запрос), 413(слишком большое тело), 431(слишком
+    большие заголовки), 501(неизвестный Transfer-Encoding), 505(не HTTP/1.x). На них сервер отвечает и закрывает
+    соединение, так как не знает, где начинается следующий запрос.
+
+    Keep-alive - В HTTP/1.1 соединение по умолчанию остается открытым после ответа, если клиент не прислал
+    Connection: close, в HTTP/1.0 наоборот - закрывается, если клиент не прислал Connection: keep-alive. Открытое
+    соединение, на котором клиент молчит дольше keepalive_timeout, закрывается. Данные из сокета читаются в буфер из
+    пула(sched.buffers), который берется, только когда сокет стал читаемым, и сразу возвращается, поэтому соединение
+    между запросами держит только буфер buf с неразобранным остатком.
+    request_timeout - Время на весь запрос, от его первого байта до последнего байта тела. Без него клиент, который
+    прислал половину заголовков или тела и замолчал или присылает по байту раз в несколько секунд(slowloris), держал
+    бы соединение и его буфер сколько угодно, а таких соединений можно открыть тысячи. Ограничение на весь запрос, а
+    не на каждый recv(), поэтому редкие байты его не продлевают. По истечении сервер отвечает 408 Request Timeout и
+    закрывает соединение.
+
+    Pipelining - Клиент может отправить несколько запросов подряд, не дожидаясь ответов. Поэтому после ответа на запрос
+    сервер проверяет, нет ли в буфере следующего целого запроса, и отвечает на все такие запросы по порядку. Ответы
+    на них отправляются вместе, одним sendmsg()(writer.writelines()), а неразобранный остаток переносится в новый буфер
+    один раз на пачку, а не после каждого запроса.
+
+    Буферы ответа - Стартовая строка и заголовки всех ответов пачки пишутся в один bytearray out, а тела ответов
+    отправляются отдельными кусками, без копирования в out. Если после отправки в очереди записи ничего не осталось,
+    то out очищается и используется снова для следующей пачки, иначе создается новый, так как на старый еще ссылается
+    очередь записи. Стартовые строки для всех кодов ответа подготовлены заранее(_STATUS_LINES), а заголовок Date
+    форматируется не чаще раза в секунду(date_header()).
+
+    StreamingResponse(body) - Ответ, тело которого отдает асинхронный генератор(async def с yield) по частям, пока
+    ответ отправляется. Длина тела заранее не известна, поэтому вместо Content-Length ответ отправляется с
+    Transfer-Encoding: chunked: каждая часть - это ее длина в шестнадцатеричном виде, \\r\\n, данные и \\r\\n, а
+    часть длиной 0 означает конец тела. Клиенту HTTP/1.0 chunked не понятен, ему тело отправляется как есть, а
+    конец тела - это закрытие соединения.
+    Мелкие части(например, по строке таблицы) склеиваются в куски по stream_chunk байт, чтобы не делать sendmsg() на
+    каждую. После каждого куска вызывается writer.drain(): если клиент читает медленнее, чем генератор отдает
+    данные, то генератор останавливается, пока очередь записи не уменьшится. Поэтому в памяти одновременно не больше
+    stream_chunk байт и очереди записи, каким бы большим ни было тело.
+    Если генератор выбросил исключение, то заголовки уже отправлены и ответить 500 нельзя. Соединение закрывается
+    без последней части, и клиент видит, что тело оборвалось. При разрыве соединения и на HEAD генератор закрывается
+    (aclose()), чтобы отработали его блоки finally.
+    Следующие запросы пачки(pipelining) обрабатываются только после того, как поток отправлен целиком.
+
+    Expect: 100-continue - Клиент ждет разрешения, прежде чем отправить большое тело. Сервер отвечает
+    100 Continue, как только получил заголовки.
+"""
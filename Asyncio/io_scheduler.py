@@ -1,103 +1,501 @@
+import errno
+import mmap
+import os
+import socket as _socket      # The module itself, the server part below does from socket import *
 import time
 from collections import deque
-import heapq
-from select import select
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from socket import socketpair
 
+from buffers import BufferPool
+from pollers import SelectorPoller
+from timers import TimerHeap
 
-class Scheduler:
+
+class Waker:
     def __init__(self):
+        if hasattr(os, 'eventfd'):
+            self._fd = os.eventfd(0, os.EFD_NONBLOCK | os.EFD_CLOEXEC)
+            self._socks = None
+        else:
+            self._socks = socketpair()      # Self-pipe
+            for sock in self._socks:
+                sock.setblocking(False)
+            self._fd = self._socks[0].fileno()
+
+    def fileno(self):
+        return self._fd
+
+    def wake(self):
+        try:
+            if self._socks is None:
+                os.eventfd_write(self._fd, 1)
+            else:
+                self._socks[1].send(b'\0')
+        except BlockingIOError:
+            pass    # Already full of wakeups, the loop will wake up anyway
+
+    def drain(self):
+        try:
+            if self._socks is None:
+                os.eventfd_read(self._fd)
+            else:
+                while self._socks[0].recv(4096):
+                    pass
+        except BlockingIOError:
+            pass
+
+
+class Scheduler:
+    def __init__(self, poller=None, timers=None, budget=None, max_workers=None):
         self.ready = deque()     # Functions ready to execute
-        self.sleeping = []       # Sleeping functions
-        self.sequence = 0 
-        self._read_waiting = { }
-        self._write_waiting = { }
+        self.sleeping = timers if timers is not None else TimerHeap()     # Sleeping functions
+        self.poller = poller if poller is not None else SelectorPoller()    # Functions waiting for I/O
+        self.current = None
+        self.budget = budget     # Max seconds of callbacks per tick, None - run the whole batch
+        self.stats = {
+            'ticks': 0,
+            'callbacks': 0,
+            'max_callbacks_per_tick': 0,
+            'max_tick_latency': 0.0,       # Longest time I/O and timers were not looked at
+            'max_timer_lateness': 0.0,     # Longest delay between a deadline and its timer being run
+            'over_budget': 0,              # Ticks cut short by the budget
+            'threadsafe_wakeups': 0,       # Times other threads woke the loop up
+            'accepted': 0,
+            'max_accept_batch': 0,         # Most connections taken from the accept queue in one wakeup
+        }
+
+        # Executor pools are created on first use
+        self.max_workers = max_workers or min(32, (os.cpu_count() or 1) + 4)
+        self.max_pending = self.max_workers * 4     # Jobs submitted at once, the rest wait for a slot
+        self._thread_pool = None
+        self._process_pool = None
+        self._pending_jobs = 0
+        self._slot_waiting = {}        # Tasks waiting for a free executor slot, in order
+        self._threadsafe = deque()     # Functions handed over from other threads
+        self._notified = False
+        self._waker = Waker()
+        self._waker_users = 0          # Executor jobs and thread queues that keep run() going for the waker
+        self._waker_listened = False   # The waker is registered in the poller
+        self.buffers = BufferPool()    # Read buffers for recv_into()
 
     def call_soon(self, func):
         self.ready.append(func)
 
     def call_later(self, delay, func):
-        self.sequence += 1
-        deadline = time.time() + delay     # Expiration time
-        heapq.heappush(self.sleeping, (deadline, self.sequence, func))
+        deadline = time.monotonic() + delay     # Expiration time
+        return self.sleeping.push(deadline, func)   # Handle with cancel()
 
     def read_wait(self, fileno, func):
-        self._read_waiting[fileno] = func   # Trigger func() when fileno is readable
+        self.poller.read_wait(fileno, func)   # Trigger func() when fileno is readable
 
     def write_wait(self, fileno, func):
-        self._write_waiting[fileno] = func  # Trigger func() when fileno is writeable
+        self.poller.write_wait(fileno, func)  # Trigger func() when fileno is writeable
 
     def run(self):
-        while (self.ready or self.sleeping or self._read_waiting or self._write_waiting):
-            if not self.ready:
+        stats = self.stats
+        # The waker is listened to for the whole run, call_soon_threadsafe() may come at any moment.
+        # By itself it does not keep the loop alive, only its users and undelivered functions do
+        self._listen_waker()
+        while (self.ready or self.sleeping or len(self.poller) > self._waker_listened
+               or self._waker_users or self._threadsafe):
+            if self.ready:
+                timeout = 0            # Work is pending, only check for I/O
+            else:
                 # Find the nearest deadline
-                if self.sleeping:
-                    deadline, _, func = self.sleeping[0]
-                    timeout = deadline - time.time()
+                deadline = self.sleeping.next_deadline()
+                if deadline is not None:
+                    timeout = deadline - time.monotonic()
                     if timeout < 0:
                         timeout = 0
                 else:
                     timeout = None     # Wait forever
 
-                # Wait for I/O (and sleep)
-                can_read, can_write, _ = select(self._read_waiting, self._write_waiting, [], timeout)
-
-                for fd in can_read:
-                    self.ready.append(self._read_waiting.pop(fd))
-                for fd in can_write:
-                    self.ready.append(self._write_waiting.pop(fd))
-
-                # Check for sleeping tasks
-                now = time.time()
-                while self.sleeping:
-                    if now > self.sleeping[0][0]:
-                        self.ready.append(heapq.heappop(self.sleeping)[2])
-                    else:
-                        break
-
-            while self.ready:
+            # Wait for I/O (and sleep)
+            self.ready.extend(self.poller.poll(timeout))
+
+            # Check for sleeping tasks
+            now = time.monotonic()
+            for timer in self.sleeping.pop_expired(now):
+                if now - timer.deadline > stats['max_timer_lateness']:
+                    stats['max_timer_lateness'] = now - timer.deadline
+                self.ready.append(timer.func)
+
+            # Run only what is ready right now. Functions scheduled by this batch
+            # wait for the next tick, so I/O and timers are never starved
+            count = len(self.ready)
+            start = time.monotonic()
+            for n in range(count):
                 func = self.ready.popleft()
                 func()
+                if self.budget is not None and time.monotonic() - start > self.budget:
+                    stats['over_budget'] += 1
+                    count = n + 1
+                    break
+            latency = time.monotonic() - start
+
+            stats['ticks'] += 1
+            stats['callbacks'] += count
+            if count > stats['max_callbacks_per_tick']:
+                stats['max_callbacks_per_tick'] = count
+            if latency > stats['max_tick_latency']:
+                stats['max_tick_latency'] = latency
+
+        if self._waker_listened:
+            self._waker_listened = False
+            self.poller.discard(self._waker)
 
     def new_task(self, coro):
-        self.ready.append(Task(coro))   # Wrapped coroutine
+        task = Task(coro)       # Wrapped coroutine
+        self.ready.append(task)
+        return task
+
+    def call_soon_threadsafe(self, func):
+        # The only method that may be called from another thread
+        self._threadsafe.append(func)
+        if not self._notified:      # One write wakes the loop for every function handed over until it runs
+            self._notified = True
+            self._waker.wake()
+
+    def _use_waker(self):
+        self._waker_users += 1      # Keeps run() going while nothing else is left
+
+    def _release_waker(self):
+        self._waker_users -= 1
+
+    def _listen_waker(self):
+        if not self._waker_listened:
+            self._waker_listened = True
+            self.read_wait(self._waker, self._on_wakeup)
+
+    def _on_wakeup(self):
+        self._waker_listened = False
+        self._waker.drain()
+        self._notified = False
+        self.stats['threadsafe_wakeups'] += 1
+        while self._threadsafe:
+            self.ready.append(self._threadsafe.popleft())
+        self._listen_waker()
+
+    def _job_done(self, task, handed_back):
+        self._pending_jobs -= 1
+        self._release_waker()
+        if not handed_back:         # Still waiting, a cancel has not put it on ready already
+            handed_back.append(True)
+            self.ready.append(task)
+        self._wake_slot_waiter()
+
+    def _wake_slot_waiter(self):
+        if self._slot_waiting:
+            task = next(iter(self._slot_waiting))
+            del self._slot_waiting[task]
+            self.ready.append(task)
+
+    async def run_in_executor(self, fn, *args):
+        if self._thread_pool is None:
+            self._thread_pool = ThreadPoolExecutor(self.max_workers)
+        return await self._run_in(self._thread_pool, fn, args)
+
+    async def run_in_process(self, fn, *args):
+        if self._process_pool is None:
+            self._process_pool = ProcessPoolExecutor(os.cpu_count())
+        return await self._run_in(self._process_pool, fn, args)
+
+    async def _run_in(self, executor, fn, args):
+        while self._pending_jobs >= self.max_pending:
+            self._slot_waiting[self.current] = True
+            self._park(partial(self._slot_waiting.pop, self.current, False))
+            try:
+                await switch()
+            except CancelledError:
+                self._wake_slot_waiter()    # Pass the free slot on
+                raise
+
+        self._use_waker()
+        self._pending_jobs += 1
+
+        task = self.current
+        future = executor.submit(fn, *args)
+        handed_back = []    # Not empty once the task is on ready, put there by _job_done() or by a cancel
+
+        def abandon():
+            if handed_back or future.done():
+                return False    # _job_done() wakes the task or already has
+            future.cancel()     # A job already running in the pool can not be stopped, its result is dropped
+            handed_back.append(True)
+            return True
+
+        # Runs in the pool thread: only hand the task back to the loop
+        future.add_done_callback(lambda future: self.call_soon_threadsafe(lambda: self._job_done(task, handed_back)))
+        self._park(abandon)
+        await switch()
+        return future.result()
 
-    async def sleep(self, delay):
-        self.call_later(delay, self.current)
+    def _park(self, cancel_wait):
+        # cancel_wait() takes the current task out of whatever it waits on,
+        # it returns False if the task has already been woken up
+        self.current._cancel_wait = cancel_wait
         self.current = None
+
+    def timeout(self, delay):
+        return Timeout(delay)
+
+    async def sleep(self, delay):
+        timer = self.call_later(delay, self.current)
+        self._park(timer.cancel)
         await switch()   # Switch to a new task
 
     async def recv(self, sock, maxbytes):
         self.read_wait(sock, self.current)
-        self.current = None
+        self._park(partial(self.poller.cancel_read_wait, sock, self.current))
         await switch()
         return sock.recv(maxbytes)
 
+    async def recv_into(self, sock, buf, nbytes=0):
+        self.read_wait(sock, self.current)
+        self._park(partial(self.poller.cancel_read_wait, sock, self.current))
+        await switch()
+        return sock.recv_into(buf, nbytes)      # Into the caller's buffer, nothing allocated
+
     async def send(self, sock, data):
         self.write_wait(sock, self.current)
-        self.current = None
+        self._park(partial(self.poller.cancel_write_wait, sock, self.current))
         await switch()
         return sock.send(data)
 
+    async def _readable(self, sock):
+        # For reads into a pooled buffer: the buffer is taken only once there is something to read
+        self.read_wait(sock, self.current)
+        self._park(partial(self.poller.cancel_read_wait, sock, self.current))
+        await switch()
+
+    async def _writable(self, sock):
+        self.write_wait(sock, self.current)
+        self._park(partial(self.poller.cancel_write_wait, sock, self.current))
+        await switch()
+
+    async def sendfile(self, sock, file, offset=0, count=None):
+        # The socket is made non-blocking: a blocking sendfile() of a big file would stop the whole loop
+        sock.setblocking(False)
+        if count is None:
+            count = os.fstat(file.fileno()).st_size - offset
+        if count <= 0:
+            return 0
+
+        sent = 0
+        if hasattr(os, 'sendfile'):
+            while sent < count:
+                await self._writable(sock)
+                try:
+                    n = os.sendfile(sock.fileno(), file.fileno(), offset + sent, count - sent)
+                except BlockingIOError:
+                    continue
+                except OSError as e:
+                    if sent or e.errno not in (errno.EINVAL, errno.ENOSYS, errno.ENOTSOCK, errno.EOPNOTSUPP):
+                        raise
+                    break       # Not supported for this file or socket, fall back to mmap
+                if not n:
+                    break       # The file is shorter than count
+                sent += n
+            else:
+                file.seek(offset + sent)
+                return sent
+
+        sent += await self._sendfile_mmap(sock, file, offset + sent, count - sent)
+        file.seek(offset + sent)
+        return sent
+
+    async def _sendfile_mmap(self, sock, file, offset, count):
+        sent = 0
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped, memoryview(mapped) as view:
+            # The pages of the file itself, nothing is read into memory
+            with view[offset:offset + count] as data:
+                while sent < len(data):
+                    await self._writable(sock)
+                    try:
+                        sent += sock.send(data[sent:])
+                    except BlockingIOError:
+                        continue
+        return sent
+
+    async def connect(self, addr, timeout=None):
+        if timeout is None:
+            return await self._connect(addr)
+        async with self.timeout(timeout):
+            return await self._connect(addr)
+
+    async def _connect(self, addr):
+        host, port = addr[:2]
+        try:
+            infos = _socket.getaddrinfo(host, port, type=_socket.SOCK_STREAM, flags=_socket.AI_NUMERICHOST)
+        except _socket.gaierror:
+            # A name lookup may go over the network, do it in the thread pool
+            infos = await self.run_in_executor(_socket.getaddrinfo, host, port, 0, _socket.SOCK_STREAM)
+
+        error = None
+        for family, type, proto, _, address in infos:
+            sock = _socket.socket(family, type, proto)
+            try:
+                sock.setblocking(False)
+                err = sock.connect_ex(address)
+                if err in (errno.EINPROGRESS, errno.EWOULDBLOCK):
+                    await self._writable(sock)      # Writeable once the handshake is over, successful or not
+                    err = sock.getsockopt(_socket.SOL_SOCKET, _socket.SO_ERROR)
+                if err:
+                    raise OSError(err, os.strerror(err), address)
+                return sock
+            except OSError as e:
+                sock.close()
+                error = e       # Try the next address
+            except BaseException:
+                self.poller.discard(sock)     # Cancelled or timed out while connecting
+                sock.close()
+                raise
+        raise error
+
     async def accept(self, sock):
         self.read_wait(sock, self.current)
-        self.current = None
+        self._park(partial(self.poller.cancel_read_wait, sock, self.current))
         await switch()
         return sock.accept()
 
+    async def accept_many(self, sock, limit=64):
+        # Drains up to limit pending connections per wakeup instead of one per trip through the loop
+        sock.setblocking(False)
+        self.read_wait(sock, self.current)
+        self._park(partial(self.poller.cancel_read_wait, sock, self.current))
+        await switch()
+
+        accepted = []
+        while len(accepted) < limit:
+            try:
+                client, addr = sock.accept()
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError as e:
+                if e.errno in (errno.ECONNABORTED, errno.EPROTO):
+                    continue        # The client gave up while waiting in the queue
+                if e.errno not in (errno.EMFILE, errno.ENFILE, errno.ENOBUFS, errno.ENOMEM):
+                    raise
+                if not accepted:
+                    await self.sleep(0.1)   # Out of descriptors, give open connections time to close
+                break
+            client.setblocking(False)
+            accepted.append((client, addr))
+
+        stats = self.stats
+        stats['accepted'] += len(accepted)
+        if len(accepted) > stats['max_accept_batch']:
+            stats['max_accept_batch'] = len(accepted)
+        return accepted
+
+
+class CancelledError(BaseException):
+    pass
+
 
 class Task:
     def __init__(self, coro):
         self.coro = coro        # "Wrapped coroutine"
+        self._done = False
+        self._result = None
+        self._exception = None
+        self._retrieved = False
+        self._waiting = {}      # Tasks awaiting this one, in order
+        self._callbacks = []
+        self._cancel_wait = None
+        self._must_cancel = False
 
     def __call__(self):
+        if self._done:
+            return      # Put on ready twice, the second run must not touch the finished coroutine
+        self._cancel_wait = None
         try:
             sched.current = self
 
-            self.coro.send(None)
+            if self._must_cancel:
+                self._must_cancel = False
+                self.coro.throw(CancelledError())
+            else:
+                self.coro.send(None)
             if sched.current:
                 sched.ready.append(self)
-        except StopIteration:
-            pass
+            elif self._must_cancel:
+                self._unpark()      # Cancelled itself and went to sleep
+        except StopIteration as e:
+            self._finish(e.value, None)
+        except CancelledError as e:
+            self._finish(None, e)
+        except Exception as e:
+            self._finish(None, e)   # Kept for whoever awaits the task, run() goes on
+
+    def cancel(self):
+        if self._done:
+            return False
+        self._must_cancel = True    # CancelledError is thrown in on the next run
+        self._unpark()
+        return True
+
+    def cancelled(self):
+        return isinstance(self._exception, CancelledError)
+
+    def _unpark(self):
+        cancel_wait, self._cancel_wait = self._cancel_wait, None
+        if cancel_wait is not None and cancel_wait():
+            sched.ready.append(self)
+
+    def _finish(self, result, exception):
+        self._done = True
+        self._result = result
+        self._exception = exception
+        waiting = self._waiting
+        sched.ready.extend(waiting)
+        # Emptied, not only dropped: a waiter cancelled in this same tick must find itself gone from it,
+        # or its parked pop() would put it on ready a second time
+        waiting.clear()
+        for func in self._callbacks:
+            sched.ready.append(lambda func=func: func(self))
+        self._waiting = self._callbacks = None
+
+    def done(self):
+        return self._done
+
+    def result(self):
+        if not self._done:
+            raise RuntimeError('Task is not done yet')
+        self._retrieved = True
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+    def exception(self):
+        if not self._done:
+            raise RuntimeError('Task is not done yet')
+        self._retrieved = True
+        return self._exception
+
+    def add_done_callback(self, func):
+        if self._done:
+            sched.ready.append(lambda: func(self))
+        else:
+            self._callbacks.append(func)
+
+    def remove_done_callback(self, func):
+        if not self._done and func in self._callbacks:
+            self._callbacks.remove(func)
+
+    def __await__(self):
+        if not self._done:
+            task = sched.current
+            self._waiting[task] = True          # Woken up by _finish()
+            sched._park(partial(self._waiting.pop, task, False))
+            yield
+        return self.result()
+
+    def __del__(self):
+        if self._exception is not None and not self._retrieved and not self.cancelled():
+            print(f'Task exception was never retrieved: {self._exception!r}')
 
 
 class Awaitable:
@@ -109,18 +507,119 @@ def switch():
     return Awaitable()
 
 
+FIRST_COMPLETED = 'FIRST_COMPLETED'
+FIRST_EXCEPTION = 'FIRST_EXCEPTION'
+ALL_COMPLETED = 'ALL_COMPLETED'
+
+
+def _ensure_task(aw):
+    return aw if isinstance(aw, Task) else sched.new_task(aw)
+
+
+async def wait(aws, return_when=ALL_COMPLETED):
+    tasks = [_ensure_task(aw) for aw in aws]
+    pending = [task for task in tasks if not task.done()]
+    failed = any(task.done() and task._exception is not None for task in tasks)
+
+    finished = not pending or (
+        return_when == FIRST_COMPLETED and len(pending) < len(tasks)
+        or return_when == FIRST_EXCEPTION and failed
+    )
+    if not finished:
+        waiter = sched.current
+        left = len(pending)
+        woken = False
+
+        def on_done(task):
+            nonlocal left, woken
+            left -= 1
+            if not woken and (not left or return_when == FIRST_COMPLETED
+                              or return_when == FIRST_EXCEPTION and task._exception is not None):
+                woken = True
+                sched.ready.append(waiter)
+
+        def cancel_wait():
+            nonlocal woken
+            if woken:
+                return False
+            woken = True
+            return True
+
+        for task in pending:
+            task.add_done_callback(on_done)
+        sched._park(cancel_wait)
+        try:
+            await switch()      # One wakeup, however many tasks there are
+        finally:
+            for task in pending:
+                task.remove_done_callback(on_done)
+
+    done = {task for task in tasks if task.done()}
+    return done, set(tasks) - done
+
+
+async def gather(*aws, return_exceptions=False):
+    tasks = [_ensure_task(aw) for aw in aws]
+    try:
+        await wait(tasks, ALL_COMPLETED if return_exceptions else FIRST_EXCEPTION)
+    except CancelledError:
+        for task in tasks:
+            task.cancel()       # Nobody is left to collect their results
+        raise
+    if return_exceptions:
+        return [task.exception() or task._result for task in tasks]
+    for task in tasks:
+        if task.done() and task.exception() is not None:
+            raise task.exception()
+    return [task.result() for task in tasks]
+
+
+class Timeout:
+    def __init__(self, delay):
+        self.delay = delay
+        self.expired = False
+
+    async def __aenter__(self):
+        self.task = sched.current
+        self.timer = sched.call_later(self.delay, self._expire)
+        return self
+
+    def _expire(self):
+        self.expired = True
+        self.task.cancel()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.timer.cancel()
+        if self.expired and exc_type is CancelledError:
+            raise TimeoutError() from exc
+        return False
+
+
 sched = Scheduler()    # Background scheduler object
 
 
 from socket import *
-async def tcp_server(addr):
+async def tcp_server(addr, backlog=1024, batch=64):
     sock = socket(AF_INET, SOCK_STREAM)
+    sock.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
     sock.bind(addr)
-    sock.listen(1)
+    sock.listen(backlog)        # Capped by net.core.somaxconn
     while True:
-        client, addr = await sched.accept(sock)
-        print('Connection from', addr)
-        sched.new_task(echo_handler(client))
+        for client, addr in await sched.accept_many(sock, batch):
+            print('Connection from', addr)
+            sched.new_task(echo_handler(client))
+
+
+def accept_queue(sock):
+    # (connections waiting in the accept queue, its size) of a listening TCP socket,
+    # None where TCP_INFO does not report it. Linux puts them in tcpi_unacked and tcpi_sacked
+    try:
+        info = sock.getsockopt(IPPROTO_TCP, TCP_INFO, 104)
+    except (NameError, OSError):
+        return None
+    if len(info) < 32:
+        return None
+    return int.from_bytes(info[24:28], 'little'), int.from_bytes(info[28:32], 'little')
 
 
 """
@@ -130,27 +629,103 @@ async def tcp_server(addr):
     создав новый сокет для общения с подключившимся клиентом. Возвращает новый сокет и адрес клиента, выводит адрес в
     консоль и передает планировщику новую задачу - корутину echo_handler, в которую передает новый, созданный для общения
     с клиентом сокет.
+
+    Очередь подключений(backlog). Ядро само завершает рукопожатие TCP и складывает готовые соединения в очередь
+    слушающего сокета, а accept() только забирает их оттуда. Раньше очередь была длиной 1(listen(1)), и при всплеске
+    подключений ядро отбрасывало новые: клиент повторял попытку только через секунду и больше. Теперь размер очереди
+    задается параметром backlog(ядро ограничивает его значением net.core.somaxconn).
+
+    sched.accept_many(sock, limit) - Раньше на каждое соединение приходился полный круг цикла: пробуждение poll(), один
+    accept(), снова ожидание. accept_many() после одного пробуждения забирает из очереди до limit соединений, пока
+    accept() на неблокирующем сокете не вернет BlockingIOError. limit не дает одному всплеску подключений надолго
+    занять цикл. Принятые сокеты переводятся в неблокирующий режим. Системный вызов accept4() с SOCK_NONBLOCK сделал
+    бы это сразу, но socket.accept() в Python не принимает флаги, поэтому на это уходит отдельный setblocking(False).
+    ECONNABORTED(клиент ушел, пока ждал в очереди) пропускается. Если закончились дескрипторы(EMFILE), то корутина
+    засыпает на 0.1 секунды, а не крутится в цикле, так как сокет остается готовым к чтению.
+    В sched.stats считаются принятые соединения(accepted) и наибольшее количество за одно пробуждение(max_accept_batch).
+
+    accept_queue(sock) - Глубина очереди подключений: сколько соединений в ней ждет accept() и ее размер. На Linux
+    ядро отдает их для слушающего сокета через TCP_INFO в полях tcpi_unacked и tcpi_sacked. Если очередь часто
+    близка к размеру, то backlog мал или цикл не успевает принимать соединения.
 """
 
 async def echo_handler(sock):
     while True:
-        data = await sched.recv(sock, 10000)
-        if not data:
-            break
-        await sched.send(sock, b'Got:' + data)
+        await sched._readable(sock)     # An idle connection holds no buffer
+        buf = sched.buffers.acquire()
+        try:
+            buf[:4] = b'Got:'       # Data is received right after the prefix
+            n = sock.recv_into(buf[4:])
+            if not n:
+                break
+            data = buf[:n + 4]      # A view, the bytes are not copied
+            while data:
+                sent = await sched.send(sock, data)    # send() may take only part of the data
+                data = data[sent:]
+        finally:
+            sched.buffers.release(buf)
     print('Connection closed')
     sock.close()
 
 
 """
     Корутина echo_handler запускает цикл, внутри которого, ожидает и принимает данные от клиента. После прихода данных,
-    отправляет их клиенту обратно с добавление строки 'Got:' в начале. Если от клиента изначально пришли пустые данные,
+    отправляет их клиенту обратно с добавление строки 'Got:' в начале. send() может отправить только часть данных, поэтому
+    остаток отправляется снова, пока не будет отправлено все. Если от клиента изначально пришли пустые данные,
     то это означает, что клиент отключился. Корутина в этом случае завершает цикл, выводит в консоль сообщение о закрытии
     соединения и закрывает соединение у сокета, созданного для общения с клиентом.
+
+    Данные читаются в буфер из пула планировщика(sched.buffers), сразу после префикса 'Got:'. Поэтому ответ - это срез
+    memoryview того же буфера: нет ни нового объекта bytes на каждый recv(), ни копии при склеивании b'Got:' + data.
+    Буфер берется из пула только когда сокет стал читаемым(sched._readable()), и возвращается после отправки ответа.
+    Соединение, которое ждет данных, буфер не держит: иначе тысячи простаивающих соединений держали бы по 64 КБ
+    каждое, а пул на 64 буфера кончился бы, и остальные буферы выделялись бы заново(misses).
 """
 
-sched.new_task(tcp_server(('', 30000)))
-sched.run()
+
+async def relay(src, dst):
+    # Copies everything from src to dst until src is closed, a pooled buffer per message, no allocation
+    while True:
+        await sched._readable(src)
+        buf = sched.buffers.acquire()
+        try:
+            n = src.recv_into(buf)
+            if not n:
+                break
+            data = buf[:n]
+            while data:
+                sent = await sched.send(dst, data)
+                data = data[sent:]
+        finally:
+            sched.buffers.release(buf)
+
+
+"""
+    sendfile(sock, file, offset, count) - Отправляет count байт файла начиная с offset. Обычная отдача файла - это
+    цикл file.read() и sock.send(): данные копируются из ядра в память процесса, а потом обратно в ядро, в буфер
+    сокета. os.sendfile() просит ядро переслать данные из файла в сокет напрямую, минуя память процесса.
+
+    Сокет переводится в неблокирующий режим, поэтому sendfile() отправляет столько, сколько поместилось в буфер сокета,
+    и корутина ждет готовности сокета к записи перед следующей порцией, давая поработать другим задачам.
+
+    Если os.sendfile() нет или он не поддерживает этот файл или сокет(EINVAL, ENOSYS и т.п.), то файл отображается в
+    память через mmap и отправляется срезами memoryview отображения. Копирования через read() все равно нет: страницы
+    файла отправляются прямо из страничного кэша. После отправки позиция файла переводится в конец отправленной части.
+
+    connect(addr, timeout) - Неблокирующее подключение к серверу. Сокет переводится в неблокирующий режим, и
+    connect_ex() сразу возвращает EINPROGRESS, а тройное рукопожатие TCP идет в ядре. Когда оно закончится(успешно или
+    нет), сокет станет доступен для записи, поэтому корутина ждет записи, а результат подключения берется из опции
+    сокета SO_ERROR. Если адрес - это имя, а не ip, то getaddrinfo() выполняется в пуле потоков, так как поиск имени
+    может идти по сети. Если имя разрешилось в несколько адресов, они пробуются по очереди. timeout ограничивает все
+    подключение целиком через sched.timeout(), по истечении выбрасывается TimeoutError, а сокет закрывается.
+
+    relay - Пересылает данные из одного сокета в другой(прокси) тем же способом, что и echo_handler: когда src стал
+    читаемым, данные читаются в буфер из пула и отправляются срезом memoryview этого буфера, без копирования.
+"""
+
+if __name__ == '__main__':
+    sched.new_task(tcp_server(('', 30000)))
+    sched.run()
 
 
 """
@@ -172,6 +747,12 @@ sched.run()
     из которых были вызваны методы для записи или чтения данных из этих сокетов.
 
     run - Основной передел коснулся метода run.
+    Спящие функции теперь лежат в хранилище таймеров(timers.py) на часах time.monotonic(). По умолчанию это куча
+    TimerHeap, но ее можно заменить колесом таймеров: Scheduler(timers=TimerWheel()). Время ближайшего таймера
+    возвращает next_deadline(), а все наступившие таймеры - pop_expired(now). Метод call_later() возвращает объект
+    таймера, у которого можно вызвать cancel(), если функцию больше не нужно вызывать(например таймаут запроса, на
+    который уже пришел ответ).
+
     Здесь также вычисляется оставшееся время до вызова ближайшей спящей корутины, но теперь вместо вызыва метода time.sleep()
     на время осташееся до вызова, вызывается функция select(), куда передается оставшееся до вызова время в качестве
     таймаута. Функция select() - это способ отслеживать готовность сокетов к операциям ввода или вывода. Она принимает
@@ -190,6 +771,11 @@ sched.run()
     И это логично. Ведь если нет ни одной готовой к исполнению или ожидающей задачи, то это время лучше с пользой. В данном
     случае ожидать запроса на подключение, прихода данных или возможности их отправки.
 
+    Сейчас ожидание готовности сокетов вынесено в отдельный слой - поллер(pollers.py). По умолчанию используется
+    SelectorPoller, построенный на epoll/kqueue/poll, который держит регистрацию сокетов в ядре между итерациями
+    цикла и не упирается в ограничение select() на 1024 дескриптора. Старое поведение доступно как SelectPoller:
+    Scheduler(poller=SelectPoller()). Метод poller.poll(timeout) делает то же самое, что описано ниже для select().
+
     После того как хотябы от одного сокета поступил сигнал, функция select() прекращает блокировать поток и возвращает
     список готовых к общению сокетов. Один список сокетов, список ожидавших подключения либо прихода
     данных(can_read), второй ожидавших возможности отправки данных(can_write). Один из списков может быть пустым. Например
@@ -206,6 +792,24 @@ sched.run()
     В конце концов запускается цикл, вызывающий все готовые к выполнению корутины, предварительно доставая их из очереди
     готовых.
 
+    Причем вызываются только те функции, которые были в очереди готовых на момент начала этого цикла(count).
+    Если функция снова кладет себя в очередь готовых(call_soon), то она будет вызвана только на следующей итерации,
+    после очередной проверки сокетов и таймеров. Иначе такая функция могла бы крутиться бесконечно и не давать
+    планировщику проверять сокеты и таймеры. Если в очереди готовых что то есть, то poll() вызывается с timeout=0,
+    то есть только проверяет готовность сокетов и не блокирует поток.
+
+    budget - Ограничение по времени на одну итерацию в секундах. Если функции в очереди готовых работают дольше, то
+    оставшиеся функции ждут следующей итерации.
+
+    stats - Счетчики, по которым видно, не голодает ли цикл:
+    ticks - количество итераций цикла
+    callbacks - общее количество вызванных функций, callbacks / ticks - среднее количество функций за итерацию
+    max_callbacks_per_tick - наибольшее количество функций за одну итерацию
+    max_tick_latency - самое долгое время выполнения функций за одну итерацию, то есть самое долгое время, когда
+    сокеты и таймеры не проверялись
+    max_timer_lateness - самое большое опоздание таймера, то есть насколько позже своего времени он был вызван
+    over_budget - количество итераций, которые были прерваны из за budget
+
     recv - Этот метод кладет сокет, ожидающий прихода данных и связанную с ним корутину в очередь(словарь) ожидающих
     прихода данных либо подключения (self._read_waiting). После делает корутину не текущей(неисполняемой в данный момент),
     так как она теперь ожидает. После отдает контроль управления корутине, а та в свою очредь сразу же отдает контроль
@@ -220,4 +824,76 @@ sched.run()
 
     accept() - Работает по тому же принципу что и метод recv(), только задействует серверный сокет для принятия подключения
     от клиентского сокета.
+
+    run_in_executor() - Любой блокирующий вызов внутри корутины(DNS, чтение файла, хэширование пароля) останавливает
+    весь цикл событий. Поэтому такой вызов отдается в пул потоков(ThreadPoolExecutor) через
+    await sched.run_in_executor(fn, *args), а корутина засыпает до тех пор, пока вызов не завершится.
+    Для вычислений, которые занимают процессор, есть run_in_process() с пулом процессов(ProcessPoolExecutor), так как
+    потоки в Python из за GIL не выполняют Python код параллельно.
+
+    Пул ограничен: в нем max_workers потоков и не больше max_pending отправленных задач. Остальные корутины ждут в
+    очереди _slot_waiting, пока не освободится место, поэтому очередь пула не растет бесконечно.
+
+    Поток пула не может сам положить корутину в очередь готовых, так как планировщик не потокобезопасен. Поэтому по
+    окончании работы поток кладет функцию в потокобезопасную очередь _threadsafe и будит цикл через Waker. Waker - это
+    eventfd(или пара сокетов там, где eventfd нет), который зарегистрирован в поллере на чтение, как обычный сокет.
+    Запись в него будит poll(), поэтому цикл не опрашивает пул постоянно, а спит, пока его не разбудят. Флаг _notified
+    не дает потокам писать в Waker, если цикл уже разбужен, поэтому несколько завершившихся задач стоят одного
+    системного вызова.
+
+    call_soon_threadsafe(func) - Единственный метод планировщика, который можно вызывать из другого потока. Он кладет
+    функцию в очередь _threadsafe и будит цикл через Waker. Цикл слушает Waker все время работы run(), так как функцию
+    из другого потока могут передать в любой момент, например из threading.Timer, пока задача спит. Но сам Waker не
+    держит цикл: run() не ждет его вечно, когда других дел нет. Цикл продолжает работу ради Waker, только пока есть
+    незавершенные задачи в пуле или открытые очереди ThreadQueue(queues.py), они отмечаются через _use_waker() и
+    _release_waker(), или пока в _threadsafe есть еще не переданные функции. При выходе из run() Waker убирается из
+    поллера, а функции, переданные после этого, выполнятся при следующем вызове run().
+    Сколько раз другие потоки будили цикл, видно в stats['threadsafe_wakeups'].
+
+    Task теперь не только обертка над корутиной, но и ее будущий результат(future). Когда корутина завершается,
+    StopIteration несет в себе возвращенное значение(e.value), оно сохраняется в _result. Если корутина выбросила
+    исключение, оно сохраняется в _exception, а цикл run() продолжает работать дальше, вместо того чтобы упасть.
+    Результат можно получить через task.result(), который выбросит сохраненное исключение, если оно было.
+
+    Объект Task можно ожидать(result = await task). Если задача еще не завершена, то ожидающая корутина кладется в
+    список _waiting задачи и перестает быть текущей. Когда задача завершается(_finish), все ожидающие ее корутины
+    кладутся в очередь готовых, а _waiting очищается. Если ожидающую задачу в том же такте отменят(cancel()), то ее
+    _cancel_wait(pop из _waiting) вернет False, и задача не попадет в очередь второй раз. Завершенная задача, если
+    все же оказалась в очереди, больше не запускается.
+    Так же можно подписаться на завершение задачи функцией add_done_callback(func).
+    Если исключение задачи так никто и не получил, то при удалении задачи об этом печатается сообщение.
+
+    new_task теперь возвращает объект Task.
+
+    wait(tasks, return_when) - Ждет завершения задач и возвращает два множества: завершенные и незавершенные.
+    ALL_COMPLETED - ждать всех, FIRST_COMPLETED - первой завершившейся, FIRST_EXCEPTION - первой упавшей(или всех).
+    Ожидающая корутина подписывается на завершение каждой задачи и считает, сколько осталось, поэтому просыпается
+    ровно один раз, а не опрашивает задачи в цикле.
+
+    gather(*coros) - Запускает корутины как задачи и возвращает список их результатов в том же порядке. Если одна из
+    задач упала, то gather выбрасывает ее исключение, а с return_exceptions=True возвращает исключения в списке
+    вместо результатов.
+
+    Отмена задач - task.cancel(). Задачу, которая ждет сокет, таймер, другую задачу или очередь, нужно не только
+    разбудить, но и убрать из того места, где она ждет, иначе ее потом разбудят еще раз. Поэтому каждое место, где
+    задача засыпает, вызывает sched._park(cancel_wait) и передает функцию, которая убирает задачу оттуда за O(1):
+    sleep() - отменяет таймер(timer.cancel), recv()/send()/accept() - убирают ожидание из поллера
+    (cancel_read_wait/cancel_write_wait), await task - убирает из словаря ожидающих задачи, AsyncQueue.get() из
+    queues.py - из словаря ожидающих геттеров. cancel_wait() возвращает False, если задачу уже разбудили, тогда
+    второй раз в очередь готовых она не кладется.
+
+    cancel() помечает задачу(_must_cancel), убирает ее из места ожидания и кладет в очередь готовых. При следующем
+    вызове задачи в корутину вместо send(None) бросается исключение CancelledError через coro.throw(). Корутина может
+    его перехватить, например чтобы закрыть сокет, но должна выбросить его дальше. CancelledError наследуется от
+    BaseException, чтобы его случайно не перехватил обычный except Exception.
+
+    Задачу, которая ждет результата из пула потоков, прервать нельзя, поток продолжит работу, но его результат будет
+    выброшен, а задача получит CancelledError сразу.
+
+    gather() при отмене отменяет и все свои задачи.
+
+    timeout(delay) - Асинхронный контекстный менеджер: async with sched.timeout(5): ... При входе заводит таймер,
+    который отменит текущую задачу. Если время вышло, то CancelledError на выходе превращается в TimeoutError, а если
+    блок успел выполниться, то таймер отменяется. Так можно ограничить время ожидания клиента, чтобы обработчики
+    зависших соединений не висели вечно.
 """
@@ -0,0 +1,216 @@
+import selectors
+from select import select
+
+
+def default_selector():
+    # epoll on Linux, kqueue on BSD/macOS, poll everywhere else
+    for name in ('EpollSelector', 'KqueueSelector', 'PollSelector'):
+        selector_class = getattr(selectors, name, None)
+        if selector_class is not None:
+            return selector_class()
+    return selectors.SelectSelector()
+
+
+class ConcurrentWaitError(RuntimeError):
+    pass
+
+
+class SelectPoller:
+    def __init__(self, strict=False):
+        self.strict = strict
+        self._read_waiting = {}     # fileobj -> {func: True}, waiters in order
+        self._write_waiting = {}
+
+    def __len__(self):
+        return len(self._read_waiting) + len(self._write_waiting)
+
+    def read_wait(self, fileobj, func):
+        _add_waiter(self._read_waiting, fileobj, func, self.strict)
+
+    def write_wait(self, fileobj, func):
+        _add_waiter(self._write_waiting, fileobj, func, self.strict)
+
+    def cancel_read_wait(self, fileobj, func):
+        return _remove_waiter(self._read_waiting, fileobj, func)
+
+    def cancel_write_wait(self, fileobj, func):
+        return _remove_waiter(self._write_waiting, fileobj, func)
+
+    def has_reader(self, fileobj):
+        return fileobj in self._read_waiting
+
+    def discard(self, fileobj):
+        self._read_waiting.pop(fileobj, None)
+        self._write_waiting.pop(fileobj, None)
+
+    def poll(self, timeout):
+        can_read, can_write, _ = select(self._read_waiting, self._write_waiting, [], timeout)
+        ready = [_pop_waiter(self._read_waiting, fd) for fd in can_read]
+        ready.extend(_pop_waiter(self._write_waiting, fd) for fd in can_write)
+        return ready
+
+    def close(self):
+        pass
+
+
+def _add_waiter(waiting, fileobj, func, strict):
+    waiters = waiting.get(fileobj)
+    if waiters is None:
+        waiting[fileobj] = {func: True}
+    elif strict and func not in waiters:
+        raise ConcurrentWaitError(f'{fileobj!r} is already waited on in this direction')
+    else:
+        waiters[func] = True
+
+
+def _remove_waiter(waiting, fileobj, func):
+    waiters = waiting.get(fileobj)
+    if waiters is None or waiters.pop(func, None) is None:
+        return False
+    if not waiters:
+        del waiting[fileobj]
+    return True
+
+
+def _pop_waiter(waiting, fileobj):
+    # Only the first waiter is woken: it may read or write everything the file is ready for.
+    # The polling is level triggered, so the next one is woken by the next poll if there is more
+    waiters = waiting[fileobj]
+    func = next(iter(waiters))
+    del waiters[func]
+    if not waiters:
+        del waiting[fileobj]
+    return func
+
+
+class SelectorPoller:
+    def __init__(self, selector=None, strict=False):
+        self.selector = selector or default_selector()
+        self.strict = strict        # Raise ConcurrentWaitError instead of queueing a second waiter
+        self._read_waiting = {}     # fileobj -> {func: True}, waiters in order
+        self._write_waiting = {}
+        self._fired = []        # Woken files, registration is checked before the next poll
+
+    def __len__(self):
+        return len(self._read_waiting) + len(self._write_waiting)
+
+    def read_wait(self, fileobj, func):
+        _add_waiter(self._read_waiting, fileobj, func, self.strict)
+        self._update(fileobj)
+
+    def write_wait(self, fileobj, func):
+        _add_waiter(self._write_waiting, fileobj, func, self.strict)
+        self._update(fileobj)
+
+    def cancel_read_wait(self, fileobj, func):
+        if _remove_waiter(self._read_waiting, fileobj, func):
+            self._update(fileobj)
+            return True
+        return False
+
+    def cancel_write_wait(self, fileobj, func):
+        if _remove_waiter(self._write_waiting, fileobj, func):
+            self._update(fileobj)
+            return True
+        return False
+
+    def has_reader(self, fileobj):
+        return fileobj in self._read_waiting
+
+    def discard(self, fileobj):
+        self._read_waiting.pop(fileobj, None)
+        self._write_waiting.pop(fileobj, None)
+        self._update(fileobj)
+
+    def _update(self, fileobj):
+        events = 0
+        if fileobj in self._read_waiting:
+            events |= selectors.EVENT_READ
+        if fileobj in self._write_waiting:
+            events |= selectors.EVENT_WRITE
+
+        try:
+            key = self.selector.get_key(fileobj)
+        except (KeyError, ValueError):     # Not registered or already closed
+            key = None
+
+        if key is not None and key.fileobj is not fileobj:
+            # The descriptor was closed and reused by a new file
+            self.selector.unregister(key.fileobj)
+            key = None
+
+        if not events:
+            if key is not None:
+                self.selector.unregister(fileobj)
+        elif key is None:
+            self.selector.register(fileobj, events)
+        elif key.events != events:
+            self.selector.modify(fileobj, events)
+
+    def poll(self, timeout):
+        # Drop registrations nobody has waited on again since the last wakeup
+        fired, self._fired = self._fired, []
+        for fileobj in fired:
+            self._update(fileobj)
+
+        ready = []
+        for key, mask in self.selector.select(timeout):
+            fileobj = key.fileobj
+            if mask & selectors.EVENT_READ and fileobj in self._read_waiting:
+                ready.append(_pop_waiter(self._read_waiting, fileobj))
+            if mask & selectors.EVENT_WRITE and fileobj in self._write_waiting:
+                ready.append(_pop_waiter(self._write_waiting, fileobj))
+            self._fired.append(fileobj)
+        return ready
+
+    def close(self):
+        self.selector.close()
+
+
+"""
+    Поллер - это слой планировщика, который отвечает за ожидание готовности сокетов к вводу/выводу. Планировщик
+    кладет в поллер корутины, ожидающие чтения или записи(read_wait, write_wait), а в методе run() вызывает poll(),
+    который блокирует поток на время timeout и возвращает список функций, чьи сокеты стали готовы.
+
+    SelectPoller - Старое поведение планировщика из io_scheduler.py. При каждом вызове poll() вся очередь ожидающих
+    сокетов целиком передается в функцию select(). Ядро каждый раз заново просматривает все сокеты, поэтому стоимость
+    одного пробуждения растет вместе с количеством соединений - O(n). Кроме того select() не умеет работать с
+    дескрипторами больше FD_SETSIZE(1024) и выбрасывает ValueError.
+
+    SelectorPoller - Построен на модуле selectors. default_selector() выбирает лучший механизм операционной системы:
+    epoll на Linux, kqueue на BSD/macOS и poll в остальных случаях. Сокеты регистрируются в ядре один раз и остаются
+    зарегистрированными между итерациями цикла. Регистрация меняется только когда ожидающая функция добавляется или
+    удаляется. Вызов select() у epoll возвращает только готовые сокеты, поэтому стоимость пробуждения зависит от
+    количества готовых сокетов, а не от общего количества соединений.
+
+    _update - Сверяет события, на которые подписан сокет в ядре, с тем, кто его сейчас ждет. Если никто не ждет,
+    снимает сокет с регистрации, если появился новый тип ожидания - меняет регистрацию(modify), если ничего не
+    изменилось, то системный вызов не делается вообще.
+    Если сокет закрыли, а его номер дескриптора достался новому сокету, то старая регистрация удаляется.
+
+    poll - Сработавший сокет не снимается с регистрации сразу. Обычно корутина, которую разбудили, тут же снова
+    ждет этот же сокет(например echo_handler после recv() снова вызывает recv()). Поэтому сработавшие сокеты
+    складываются в _fired и проверяются только перед следующим вызовом poll(). Если за это время их снова начали ждать,
+    регистрация остается прежней и лишних системных вызовов не происходит.
+
+    cancel_read_wait, cancel_write_wait - Убирают ожидание сокета, если его ждет именно эта функция. Возвращают True,
+    если функция еще ждала и была убрана, и False, если ее уже разбудили. Нужны для отмены задач.
+
+    discard - Убирает все ожидания сокета, например перед его закрытием.
+    has_reader - Ждет ли кто то чтения из сокета. Например StreamWriter.close() не должен закрывать сокет, пока из
+    него ждет данных StreamReader другой задачи.
+
+    Ожидающие. Раньше сокет в _read_waiting и _write_waiting сопоставлялся ровно одной функции, и второй recv() на том
+    же сокете из другой задачи молча затирал первого ожидающего, который после этого не просыпался никогда. Теперь
+    каждому сокету в каждом направлении сопоставлен словарь ожидающих {func: True}: он хранит порядок добавления и
+    позволяет убрать ожидающего из середины за O(1) при отмене. Так один сокет могут одновременно ждать, например,
+    задача-читатель и несколько задач-писателей(WebSocket, полнодуплексный прокси).
+
+    При готовности сокета будится только первый ожидающий в этом направлении(FIFO). Он может прочитать или записать
+    все, к чему сокет готов, и если бы разбудить всех сразу, то остальные на блокирующем сокете встали бы в recv()
+    вместе со всем циклом. epoll, как и select, срабатывает по уровню: пока данные остались, следующий poll() снова
+    вернет сокет и разбудит следующего ожидающего.
+
+    strict - Если включен(SelectorPoller(strict=True)), то второй ожидающий на том же сокете в том же направлении
+    вызывает ConcurrentWaitError. Помогает найти места, где две задачи по ошибке читают один сокет.
+"""
@@ -0,0 +1,209 @@
+import threading
+import time
+from collections import deque
+from functools import partial
+
+import io_scheduler
+from io_scheduler import switch, gather, CancelledError
+
+
+class AsyncQueue:
+    def __init__(self):
+        self.items = deque()
+        self.waiting = {}       # Getters waiting for data, a dict keeps the order and removes in O(1)
+
+    def _wake_getter(self):
+        if self.waiting:
+            task = next(iter(self.waiting))
+            del self.waiting[task]
+            io_scheduler.sched.ready.append(task)
+
+    async def put(self, item):
+        self.items.append(item)
+        self._wake_getter()
+
+    async def get(self):
+        sched = io_scheduler.sched
+        while not self.items:
+            task = sched.current
+            self.waiting[task] = True      # Put myself to sleep
+            sched._park(partial(self.waiting.pop, task, False))
+            try:
+                await switch()
+            except CancelledError:
+                if self.items:
+                    self._wake_getter()    # The item this getter was woken for goes to the next one
+                raise
+        return self.items.popleft()
+
+
+class QueueClosed(Exception):
+    pass
+
+
+class ThreadQueue:
+    def __init__(self):
+        self.items = deque()        # Filled by other threads, append and popleft are atomic
+        self.waiting = {}           # Getters waiting for data, only touched by the loop
+        self._closed = False
+        self._released = False      # The loop has run _on_close and given up its waker use
+        self._scheduled = False     # A transfer to the loop is already on its way
+        self.sched = io_scheduler.sched     # Producer threads must wake the loop whose waker was taken
+        self.sched._use_waker()
+
+    # put(), put_many() and close() are called from producer threads, not from coroutines
+
+    def put(self, item):
+        if self._closed:
+            raise QueueClosed()
+        self.items.append(item)
+        self._notify()
+
+    def put_many(self, items):
+        if self._closed:
+            raise QueueClosed()
+        self.items.extend(items)
+        self._notify()
+
+    def close(self):
+        if self._closed:
+            return      # A second close would release the waker once more
+        self._closed = True
+        self.sched.call_soon_threadsafe(self._on_close)
+
+    def _notify(self):
+        # Only the first put after the loop took the items hands a callback over,
+        # the rest are picked up by that same callback
+        if not self._scheduled:
+            self._scheduled = True
+            self.sched.call_soon_threadsafe(self._wake_getters)
+
+    def _wake_getters(self):
+        self._scheduled = False     # Reset before looking at items, a put racing with us schedules again
+        for _ in range(min(len(self.items), len(self.waiting))):
+            task = next(iter(self.waiting))
+            del self.waiting[task]
+            self.sched.ready.append(task)
+
+    def _on_close(self):
+        if self._released:
+            return      # Two threads closed at once and both got past the check in close()
+        self._released = True
+        self.sched.ready.extend(self.waiting)    # Getters drain what is left, then see QueueClosed
+        self.waiting.clear()
+        self.sched._release_waker()
+
+    async def get(self):
+        while not self.items:
+            if self._closed:
+                raise QueueClosed()
+            task = self.sched.current
+            self.waiting[task] = True
+            self.sched._park(partial(self.waiting.pop, task, False))
+            try:
+                await switch()
+            except CancelledError:
+                if self.items:
+                    self._wake_getters()
+                raise
+        return self.items.popleft()
+
+
+if __name__ == '__main__':
+    sched = io_scheduler.sched
+    q = AsyncQueue()
+
+    async def producer(count):
+        for n in range(count):
+            await q.put(n)
+            await sched.sleep(0.1)
+
+    async def consumer(name):
+        while True:
+            item = await q.get()
+            print(name, 'consuming', item)
+
+    async def main():
+        consumers = [sched.new_task(consumer(f'consumer {n}')) for n in range(3)]
+        await producer(10)
+        for task in consumers:
+            task.cancel()       # Parked in q.get(), removed from q.waiting
+
+        try:
+            async with sched.timeout(0.5):
+                await q.get()   # Nothing will ever come
+        except TimeoutError:
+            print('get() timed out, waiting getters left:', len(q.waiting))
+
+    sched.new_task(main())
+    sched.run()
+
+    # Threads produce, coroutines consume
+    tq = ThreadQueue()
+
+    def thread_producer(name, count):
+        for n in range(count):
+            tq.put((name, n))
+
+    async def thread_consumer(name, received):
+        try:
+            while True:
+                received.append(await tq.get())
+        except QueueClosed:
+            print(name, 'done')
+
+    async def thread_main():
+        received = []
+        consumers = [sched.new_task(thread_consumer(f'consumer {n}', received)) for n in range(4)]
+        producers = [threading.Thread(target=thread_producer, args=(f'producer {n}', 10000)) for n in range(4)]
+        for thread in producers:
+            thread.start()
+        await sched.run_in_executor(lambda: [thread.join() for thread in producers])
+        tq.close()
+        tq.close()      # Does nothing, the waker is released once
+        await gather(*consumers)
+        print(len(received), 'items from threads, loop woken', sched.stats['threadsafe_wakeups'], 'times')
+
+    sched.new_task(thread_main())
+    sched.run()
+    assert sched._waker_users == 0, sched._waker_users
+
+    # A function from a thread nobody registered as a waker user still wakes a sleeping loop
+    called = []
+    threading.Timer(0.1, lambda: sched.call_soon_threadsafe(lambda: called.append(time.monotonic()))).start()
+    sched.new_task(sched.sleep(2))
+    start = time.monotonic()
+    sched.run()
+    assert called and called[0] - start < 0.5, called
+    print(f'call_soon_threadsafe from a timer thread ran after {called[0] - start:.2f}s')
+
+
+"""
+    AsyncQueue для планировщика из io_scheduler.py. То же самое, что и в async_await/async_queue.py, только
+    ожидающие геттеры лежат не в deque, а в словаре. Словарь так же хранит порядок добавления, но в отличии от deque
+    позволяет убрать из середины любую задачу за O(1). Это нужно для отмены задачи, которая ждет данных в get():
+    task.cancel() вызывает функцию, сохраненную при парковке задачи(sched._park), и она убирает задачу из
+    self.waiting.
+
+    Если геттер уже был разбужен методом put(), но был отменен до того, как успел забрать элемент, то он передает
+    пробуждение следующему ожидающему геттеру, иначе элемент остался бы лежать в очереди, хотя его ждут.
+
+    ThreadQueue - Очередь от потоков к корутинам. Потоки-производители(как в callbacks/producer_consumer.py) кладут
+    элементы через put() или put_many(), а корутины забирают их через await get(). Трогать sched.ready из другого
+    потока нельзя, поэтому производитель передает циклу функцию _wake_getters через sched.call_soon_threadsafe().
+
+    Пробуждения объединяются: флаг _scheduled говорит, что _wake_getters уже передана циклу, поэтому следующие put()
+    только кладут элемент в deque. Когда цикл выполнит _wake_getters, она разбудит столько геттеров, сколько элементов
+    накопилось. Так тысячи put() из потоков между двумя итерациями цикла стоят одной записи в Waker(eventfd) и одного
+    пробуждения цикла. Флаг сбрасывается до того, как _wake_getters смотрит на элементы, поэтому элемент,
+    положенный в этот момент, не потеряется: производитель увидит сброшенный флаг и передаст функцию снова.
+
+    Пока очередь открыта, цикл слушает Waker(sched._use_waker()), даже если других дел у него нет. close() из потока
+    закрывает очередь: цикл будит всех ожидающих геттеров одним вызовом, они разбирают оставшиеся элементы, а затем
+    получают QueueClosed. После этого очередь больше не держит Waker и run() может завершиться. Повторный close()
+    ничего не делает, иначе счетчик пользователей Waker(_waker_users) уменьшился бы дважды.
+
+    Планировщик берется как io_scheduler.sched в момент вызова, а не импортируется по имени: бенчмарки и воркеры
+    sharded_server.py заменяют его новым, и имя, импортированное до замены, указывало бы на старый. ThreadQueue
+    запоминает планировщик при создании: потоки должны будить тот цикл, у которого очередь взяла Waker.
+"""
@@ -0,0 +1,284 @@
+import re
+import uuid
+
+from http_parser import HTTPError
+from http_server import Response
+
+
+def _int(segment):
+    if not (segment.isascii() and segment.isdigit()):      # int() would also take '+1', ' 1' and '1_0'
+        raise ValueError(segment)
+    return int(segment)
+
+
+_SLUG = re.compile(r'[-a-zA-Z0-9_]+')
+
+
+def _slug(segment):
+    if _SLUG.fullmatch(segment) is None:
+        raise ValueError(segment)
+    return segment
+
+
+# Converters of typed parameters, in the order they are tried when several fit the same place in a path
+CONVERTERS = {'int': _int, 'uuid': uuid.UUID, 'slug': _slug, 'str': str}
+_PARAMETER = re.compile(r'{(\w+)(?::(\w+))?}')
+
+
+def action(methods=('get',), detail=False, url_path=None):
+    # Extra route of a viewset, like @action in DRF/6_actions.py
+    def decorator(func):
+        func.mapping = [method.upper() for method in methods]
+        func.detail = detail
+        func.url_path = url_path or func.__name__
+        return func
+    return decorator
+
+
+class ViewSet:
+    # Actions are async methods taking the request and the path parameters. Router.register() creates one instance
+    # for all requests, so request state must not be kept on self
+    lookup = 'pk:int'
+
+    list_routes = {'GET': 'list', 'POST': 'create'}
+    detail_routes = {'GET': 'retrieve', 'PUT': 'update', 'PATCH': 'partial_update', 'DELETE': 'destroy'}
+
+
+class Node:
+    __slots__ = ('prefix', 'children', 'params', 'handlers', 'allow')
+
+    def __init__(self, prefix=''):
+        self.prefix = prefix
+        self.children = {}      # First character of the child's prefix -> child
+        self.params = []        # (name, converter name, converter, child) in the order of CONVERTERS
+        self.handlers = {}      # Method -> handler, routes ending at this node
+        self.allow = ''         # Value of the Allow header
+
+
+class Router:
+    def __init__(self, prefix='', trailing_slash=True):
+        self.prefix = prefix.strip('/')
+        self.trailing_slash = '/' if trailing_slash else ''
+        self.root = Node()
+        self.names = {}     # Route name -> path, e.g. 'user-detail' -> '/api/v1/users/{pk:int}/'
+
+    def add(self, path, methods, handler, name=None):
+        node = self.root
+        pos = 0
+        for match in _PARAMETER.finditer(path):
+            node = self._insert_static(node, path[pos:match.start()])
+            node = self._insert_param(node, match.group(1), match.group(2) or 'str')
+            pos = match.end()
+        node = self._insert_static(node, path[pos:])
+
+        for method in [methods] if isinstance(methods, str) else methods:
+            method = method.upper()
+            if method in node.handlers:
+                raise ValueError(f'{method} {path} is already routed')
+            node.handlers[method] = handler
+        allowed = set(node.handlers)
+        if 'GET' in allowed:
+            allowed.add('HEAD')     # The server answers HEAD with the GET response without the body
+        allowed.add('OPTIONS')
+        node.allow = ', '.join(sorted(allowed))
+        if name is not None:
+            self.names[name] = path
+
+    def _insert_static(self, node, text):
+        # Radix tree: children share no common prefix, so the next character decides the only child to follow
+        while text:
+            child = node.children.get(text[0])
+            if child is None:
+                child = node.children[text[0]] = Node(text)
+                return child
+            common = 0
+            limit = min(len(text), len(child.prefix))
+            while common < limit and text[common] == child.prefix[common]:
+                common += 1
+            if common < len(child.prefix):
+                # Split the edge: the common part becomes a new node above the child
+                middle = Node(child.prefix[:common])
+                child.prefix = child.prefix[common:]
+                middle.children[child.prefix[0]] = child
+                node.children[text[0]] = middle
+                child = middle
+            node = child
+            text = text[common:]
+        return node
+
+    def _insert_param(self, node, name, kind):
+        if kind not in CONVERTERS:
+            raise ValueError(f'Unknown parameter type {kind!r}')
+        for param_name, param_kind, _, child in node.params:
+            if param_kind == kind:
+                if param_name != name:
+                    raise ValueError(f'{{{name}:{kind}}} conflicts with {{{param_name}:{kind}}} at the same place')
+                return child
+        child = Node()
+        node.params.append((name, kind, CONVERTERS[kind], child))
+        order = list(CONVERTERS)
+        node.params.sort(key=lambda param: order.index(param[1]))
+        return child
+
+    def register(self, prefix, viewset, basename=None):
+        # The routes SimpleRouter from DRF/5_routers.py generates for a viewset
+        basename = basename or prefix.strip('/').replace('/', '-')
+        instance = viewset() if isinstance(viewset, type) else viewset
+        base = '/' + '/'.join(part for part in (self.prefix, prefix.strip('/')) if part)
+        lookup = '{%s}' % instance.lookup
+        slash = self.trailing_slash
+
+        for routes, path, suffix in [(instance.list_routes, base + slash, 'list'),
+                                     (instance.detail_routes, f'{base}/{lookup}{slash}', 'detail')]:
+            for method, name in routes.items():
+                handler = getattr(instance, name, None)
+                if handler is not None:
+                    self.add(path, method, handler, f'{basename}-{suffix}')
+
+        for name in dir(type(instance)):
+            func = getattr(type(instance), name)
+            if callable(func) and hasattr(func, 'mapping'):
+                path = f'{base}/{lookup}/{func.url_path}{slash}' if func.detail else f'{base}/{func.url_path}{slash}'
+                self.add(path, func.mapping, getattr(instance, name), f'{basename}-{func.url_path.replace("_", "-")}')
+
+    def resolve(self, method, path):
+        params = {}
+        node = self._match(self.root, path, 0, params)
+        if node is None:
+            raise HTTPError(404)
+        handler = node.handlers.get(method)
+        if handler is None:
+            if method == 'HEAD':
+                handler = node.handlers.get('GET')
+            if handler is None:
+                if method == 'OPTIONS':
+                    return self._options, {'allow': node.allow}
+                raise HTTPError(405, headers={'Allow': node.allow})
+        return handler, params
+
+    def _match(self, node, path, pos, params):
+        # Static children first, then typed parameters. Each character of the path is looked at once unless
+        # a branch fails further on and the next one is tried
+        if pos == len(path):
+            return node if node.handlers else None
+        child = node.children.get(path[pos])
+        if child is not None and path.startswith(child.prefix, pos):
+            found = self._match(child, path, pos + len(child.prefix), params)
+            if found is not None:
+                return found
+        if node.params:
+            end = path.find('/', pos)
+            if end < 0:
+                end = len(path)
+            if end > pos:
+                segment = path[pos:end]
+                for name, _, convert, child in node.params:
+                    try:
+                        value = convert(segment)
+                    except ValueError:
+                        continue
+                    found = self._match(child, path, end, params)
+                    if found is not None:
+                        params[name] = value
+                        return found
+        return None
+
+    async def _options(self, request, allow):
+        return Response(b'', 204, {'Allow': allow}, content_type=None)
+
+    async def __call__(self, request):
+        # The router itself is the handler of HTTPServer
+        handler, params = self.resolve(request.method, request.path)
+        return await handler(request, **params)
+
+
+if __name__ == '__main__':
+    import json
+    import sys
+
+    import io_scheduler
+    from http_server import HTTPServer
+
+    class UserViewSet(ViewSet):
+        def __init__(self):
+            self.users = {1: {'id': 1, 'first_name': 'Ivan'}, 2: {'id': 2, 'first_name': 'Petr'}}
+
+        def user(self, pk):
+            if pk not in self.users:
+                raise HTTPError(404, f'No user {pk}')
+            return self.users[pk]
+
+        async def list(self, request):
+            return Response(json.dumps(list(self.users.values())), content_type='application/json')
+
+        async def create(self, request):
+            user = json.loads(request.body)
+            user['id'] = max(self.users, default=0) + 1
+            self.users[user['id']] = user
+            return Response(json.dumps(user), 201, content_type='application/json')
+
+        async def retrieve(self, request, pk):
+            return Response(json.dumps(self.user(pk)), content_type='application/json')
+
+        async def destroy(self, request, pk):
+            self.user(pk)
+            del self.users[pk]
+            return Response(b'', 204, content_type=None)
+
+        @action(detail=False)
+        async def first_names(self, request):
+            names = [user['first_name'] for user in self.users.values()]
+            return Response(json.dumps({'first_names': names}), content_type='application/json')
+
+        @action(detail=True)
+        async def first_name(self, request, pk):
+            return Response(json.dumps({'first_name': self.user(pk)['first_name']}), content_type='application/json')
+
+    router = Router('api/v1')
+    router.register('users', UserViewSet)
+    for name, path in router.names.items():
+        print(f'{name:>24} {path}')
+
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8080
+    io_scheduler.sched.new_task(HTTPServer(router).serve(('', port)))
+    io_scheduler.sched.run()
+
+
+"""
+    Маршрутизатор для HTTP сервера из http_server.py.
+
+    Роутер в DRF(DRF/5_routers.py) превращает каждый маршрут в регулярное выражение и при запросе проверяет их по
+    порядку, пока одно не совпадет. Время поиска растет с количеством маршрутов, а 404 на несуществующий путь
+    проверяет все выражения. Здесь маршруты собираются в префиксное дерево(radix tree), и путь проходится по дереву
+    один раз, сколько бы маршрутов ни было.
+
+    Radix tree - У каждого узла есть кусок пути(prefix). Общие начала путей хранятся один раз: '/api/v1/users/' и
+    '/api/v1/groups/' - это узел '/api/v1/' с детьми 'users/' и 'groups/'. Префиксы детей одного узла начинаются с
+    разных символов, поэтому следующий символ пути сразу указывает единственного ребенка(children[path[pos]]), а
+    path.startswith(prefix, pos) проверяет весь кусок за раз. При добавлении пути, который расходится с префиксом
+    посередине, узел делится на два(_insert_static).
+
+    Параметры - {pk:int}, {name}(то же, что {name:str}), {slug:slug}, {id:uuid}. Параметр занимает часть пути до
+    следующего '/', она проверяется и преобразуется конвертером из CONVERTERS, и обработчик получает уже int или UUID.
+    Если в одном месте пути возможны и статический кусок, и параметры(users/me/ и users/{pk:int}/), то сначала
+    проверяется статический, затем параметры в порядке CONVERTERS, от более строгих к менее строгим. Если ветка не
+    подошла дальше по пути, проверяется следующая.
+
+    405 и Allow - Маршрут заканчивается в узле, у которого есть словарь handlers: метод -> обработчик. Если путь
+    найден, а метода в словаре нет, то ответ 405 с заголовком Allow, в котором перечислены методы этого узла. Строка
+    Allow готовится при добавлении маршрута. На OPTIONS, если он не задан явно, отвечается 204 с тем же Allow. HEAD
+    обрабатывается обработчиком GET, сервер отправляет ответ без тела.
+
+    Router(prefix) - prefix добавляется ко всем маршрутам register(), например 'api/v1'.
+    add(path, methods, handler, name) - Добавляет маршрут. handler - корутина handler(request, **параметры).
+    register(prefix, viewset, basename) - Маршруты вьюсета, как у SimpleRouter в DRF:
+    {prefix}/ - list(GET), create(POST) с именем basename-list
+    {prefix}/{lookup}/ - retrieve(GET), update(PUT), partial_update(PATCH), destroy(DELETE) с именем basename-detail
+    Методы с @action(detail=False) - {prefix}/{url_path}/, с detail=True - {prefix}/{lookup}/{url_path}/.
+    Маршрут добавляется только для тех экшенов, которые есть во вьюсете. lookup - параметр объекта, по умолчанию
+    pk:int. Вьюсет создается один раз на роутер, а не на каждый запрос, поэтому данные запроса нельзя хранить в self.
+    resolve(method, path) - Возвращает обработчик и параметры или выбрасывает HTTPError 404 или 405.
+    Сам роутер - это корутина router(request), поэтому его можно передать в HTTPServer(router).
+
+    Пример: python router.py 8080, затем curl localhost:8080/api/v1/users/1/first_name/
+"""
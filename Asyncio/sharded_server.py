@@ -0,0 +1,255 @@
+import json
+import os
+import selectors
+import signal
+import socket
+import sys
+import time
+
+import io_scheduler
+from io_scheduler import Scheduler, echo_handler, accept_queue
+
+
+def reuseport_socket(addr, backlog):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)   # Every worker binds the same port
+    sock.bind(addr)
+    sock.listen(backlog)
+    sock.setblocking(False)
+    return sock
+
+
+class Worker:
+    def __init__(self, addr, handler, stats_fd, backlog=1024, grace=5.0, report_interval=1.0, accept_batch=64):
+        # The scheduler created at import time belongs to the parent, its epoll
+        # instance is shared with every forked child, so each worker needs its own
+        io_scheduler.sched.poller.close()
+        self.sched = io_scheduler.sched = Scheduler()
+
+        self.sock = reuseport_socket(addr, backlog)
+        self.handler = handler
+        self.stats_fd = stats_fd
+        self.grace = grace
+        self.report_interval = report_interval
+        self.accept_batch = accept_batch
+        self.stopping = False
+        self.active = 0
+        self.max_accept_queue = 0
+
+    async def serve(self):
+        while not self.stopping:
+            queue = accept_queue(self.sock)
+            if queue is not None and queue[0] > self.max_accept_queue:
+                self.max_accept_queue = queue[0]
+            for client, addr in await self.sched.accept_many(self.sock, self.accept_batch):
+                self.sched.new_task(self.handle(client))
+
+    async def handle(self, client):
+        self.active += 1
+        try:
+            await self.handler(client)
+        finally:
+            self.active -= 1
+
+    async def watch_signals(self):
+        rsock, wsock = socket.socketpair()
+        wsock.setblocking(False)
+        signal.set_wakeup_fd(wsock.fileno())    # A byte is written here on every signal
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda *args: None)
+
+        await self.sched.recv(rsock, 64)
+        await self.shutdown()
+
+    async def shutdown(self):
+        # Stop accepting, let the open connections finish within the grace period
+        self.stopping = True
+        self.sched.poller.discard(self.sock)
+        self.sock.close()
+
+        deadline = time.monotonic() + self.grace
+        while self.active and time.monotonic() < deadline:
+            await self.sched.sleep(0.05)
+        self.report()
+        raise SystemExit(0)
+
+    async def reporter(self):
+        while not self.stopping:
+            self.report()
+            await self.sched.sleep(self.report_interval)
+
+    def report(self):
+        stats = dict(self.sched.stats, pid=os.getpid(), active=self.active, max_accept_queue=self.max_accept_queue)
+        os.write(self.stats_fd, json.dumps(stats).encode() + b'\n')
+
+    def run(self):
+        self.sched.new_task(self.watch_signals())
+        self.sched.new_task(self.reporter())
+        self.sched.new_task(self.serve())
+        self.sched.run()
+
+
+class Launcher:
+    def __init__(self, addr, handler=echo_handler, workers=None, backlog=1024, grace=5.0, report_interval=5.0):
+        self.addr = addr
+        self.handler = handler
+        self.workers = workers or os.cpu_count()
+        self.backlog = backlog
+        self.grace = grace
+        self.report_interval = report_interval
+        self.selector = selectors.DefaultSelector()
+        self.children = {}      # pid -> worker slot
+        self.started = {}       # worker slot -> start time
+        self.pipes = {}         # stats pipe -> pid
+        self.buffers = {}       # stats pipe -> unfinished line
+        self.stats = {}         # pid -> last stats of the worker
+        self.stopping = False
+
+    def spawn(self, slot):
+        r, w = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                os.close(r)
+                for fd in self.pipes:
+                    os.close(fd)
+                Worker(self.addr, self.handler, w, self.backlog, self.grace, self.report_interval).run()
+            except SystemExit as e:
+                code = e.code or 0
+            finally:
+                os._exit(code)
+
+        os.close(w)
+        self.children[pid] = slot
+        self.started[slot] = time.monotonic()
+        self.pipes[r] = pid
+        self.buffers[r] = b''
+        self.selector.register(r, selectors.EVENT_READ)
+
+    def read_stats(self, fd):
+        data = os.read(fd, 65536)
+        if not data:
+            self.selector.unregister(fd)
+            os.close(fd)
+            del self.pipes[fd], self.buffers[fd]
+            return
+
+        *lines, self.buffers[fd] = (self.buffers[fd] + data).split(b'\n')
+        for line in lines:
+            stats = json.loads(line)
+            self.stats[stats['pid']] = stats
+
+    def reap(self):
+        while self.children:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                break
+            slot = self.children.pop(pid)
+            if not self.stopping:
+                self.stats.pop(pid, None)
+                print(f'Worker {pid} died with status {status}, respawning')
+                # Do not fork in a tight loop if a worker keeps crashing on start
+                delay = self.started[slot] + 1.0 - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                self.spawn(slot)
+
+    def aggregate(self):
+        total = {'workers': len(self.stats)}
+        for stats in self.stats.values():
+            for name, value in stats.items():
+                if name == 'pid':
+                    continue
+                if name.startswith('max_'):
+                    total[name] = max(total.get(name, 0), value)
+                else:
+                    total[name] = total.get(name, 0) + value
+        return total
+
+    def stop(self, signum, frame):
+        self.stopping = True
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for slot in range(self.workers):
+            self.spawn(slot)
+        print(f'Started {self.workers} workers on {self.addr}')
+
+        next_report = time.monotonic() + self.report_interval
+        while not self.stopping:
+            for key, _ in self.selector.select(0.5):
+                self.read_stats(key.fd)
+            self.reap()
+            if time.monotonic() >= next_report:
+                print('Stats', self.aggregate())
+                next_report += self.report_interval
+
+        self.shutdown()
+
+    def shutdown(self):
+        for pid in self.children:
+            os.kill(pid, signal.SIGTERM)
+
+        deadline = time.monotonic() + self.grace + 1.0
+        while self.children and time.monotonic() < deadline:
+            for key, _ in self.selector.select(0.1):
+                self.read_stats(key.fd)
+            self.reap()
+        for pid in self.children:
+            os.kill(pid, signal.SIGKILL)    # Did not finish within the grace period
+        while self.children:
+            self.children.pop(os.waitpid(-1, 0)[0], None)
+        print('Final stats', self.aggregate())
+
+
+if __name__ == '__main__':
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else 30000
+    Launcher(('', port), workers=workers).run()
+
+
+"""
+    Планировщик из io_scheduler.py работает в одном процессе, а значит на одном ядре процессора. Чтобы сервер
+    использовал все ядра, запускается несколько процессов(воркеров), в каждом из которых работает свой планировщик.
+
+    Launcher - Родительский процесс. Сам соединения не принимает, а только следит за воркерами.
+
+    spawn - Создает канал(pipe) для статистики и порождает воркер через os.fork(). Дочерний процесс получает копию
+    родительского процесса и начинает работу с места вызова fork(). В дочернем процессе fork() возвращает 0, в
+    родительском - pid дочернего. Дочерний процесс запускает Worker и по окончании работы завершается через os._exit(),
+    чтобы не вернуться в код родителя.
+
+    run - Цикл родителя. Читает статистику воркеров из каналов, раз в report_interval печатает общую статистику и
+    проверяет, не умер ли кто то из воркеров(reap). Умерший воркер перезапускается в том же слоте, но не чаще раза в
+    секунду, чтобы воркер, который падает сразу при запуске, не порождал процессы в бесконечном цикле.
+
+    shutdown - При SIGTERM или SIGINT(Ctrl+C) родитель отправляет SIGTERM всем воркерам и ждет их завершения. Тех, кто
+    не успел завершиться за grace секунд, убивает через SIGKILL.
+
+    aggregate - Складывает счетчики всех воркеров, а для max_ счетчиков берет максимум.
+
+    Worker - Дочерний процесс. Создает свой слушающий сокет с опцией SO_REUSEPORT. Эта опция разрешает нескольким
+    сокетам слушать один и тот же порт, а ядро само распределяет входящие соединения между ними. Поэтому воркерам не
+    нужно делить один общий слушающий сокет и соревноваться за accept().
+
+    Планировщик, созданный в io_scheduler.py при импорте, принадлежит родителю. Дескриптор его epoll после fork()
+    оказался бы общим у всех воркеров и события одного воркера приходили бы другому. Поэтому каждый воркер закрывает
+    его и создает свой планировщик.
+
+    watch_signals - Сигналы приходят асинхронно, поэтому воркер использует signal.set_wakeup_fd(): при получении сигнала
+    в сокет записывается байт, а корутина, ожидающая чтения из парного сокета, просыпается как от обычного ввода/вывода.
+
+    shutdown - Плавное завершение. Воркер перестает принимать новые соединения, закрывает слушающий сокет и ждет,
+    пока открытые соединения закончат работу, но не дольше grace секунд. Затем отправляет последнюю статистику и
+    завершается.
+
+    reporter - Раз в report_interval отправляет родителю свою статистику одной строкой JSON: счетчики планировщика
+    (sched.stats, в том числе количество принятых соединений accepted), количество открытых сейчас соединений и
+    наибольшую замеченную глубину очереди подключений(max_accept_queue).
+
+    serve - Принимает соединения пачками через sched.accept_many(), до accept_batch за одно пробуждение. Перед этим
+    смотрит глубину очереди подключений(accept_queue()): сколько соединений ядро уже приняло, а воркер еще нет.
+"""
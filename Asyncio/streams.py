@@ -0,0 +1,281 @@
+import os
+import socket
+from collections import deque
+from functools import partial
+from itertools import islice
+
+import io_scheduler
+from io_scheduler import switch
+
+
+try:
+    IOV_MAX = os.sysconf('SC_IOV_MAX')      # Max buffers for one sendmsg()
+except (AttributeError, ValueError, OSError):
+    IOV_MAX = 1024
+
+
+class IncompleteReadError(EOFError):
+    def __init__(self, partial, expected):
+        super().__init__(f'{len(partial)} bytes read on a total of {expected} expected bytes')
+        self.partial = partial
+        self.expected = expected
+
+
+class LimitOverrunError(Exception):
+    pass
+
+
+class StreamReader:
+    def __init__(self, sock, limit=65536, chunk=65536):
+        self.sched = io_scheduler.sched     # Looked up now, a worker process may have replaced it
+        self.sock = sock
+        self.limit = limit      # Max bytes readuntil() buffers while looking for the separator
+        self.chunk = chunk      # Bytes asked for in one recv()
+        self._buffer = bytearray()
+        self._eof = False
+        sock.setblocking(False)
+
+    def at_eof(self):
+        return self._eof and not self._buffer
+
+    async def _fill(self):
+        data = await self.sched.recv(self.sock, self.chunk)
+        if data:
+            self._buffer += data
+        else:
+            self._eof = True
+
+    async def read(self, n=-1):
+        # Up to n bytes, whatever is buffered or arrives with the next recv()
+        if not self._buffer and not self._eof:
+            await self._fill()
+        if n < 0 or n >= len(self._buffer):
+            data = bytes(self._buffer)
+            self._buffer.clear()
+        else:
+            data = bytes(self._buffer[:n])
+            del self._buffer[:n]
+        return data
+
+    async def readexactly(self, n):
+        while len(self._buffer) < n:
+            if self._eof:
+                data = bytes(self._buffer)
+                self._buffer.clear()
+                raise IncompleteReadError(data, n)
+            await self._fill()
+        data = bytes(self._buffer[:n])
+        del self._buffer[:n]
+        return data
+
+    async def readuntil(self, separator=b'\n'):
+        start = 0
+        while True:
+            end = self._buffer.find(separator, start)
+            if end >= 0:
+                end += len(separator)
+                break
+            if len(self._buffer) > self.limit:
+                raise LimitOverrunError(f'Separator is not found in the first {self.limit} bytes')
+            if self._eof:
+                data = bytes(self._buffer)
+                self._buffer.clear()
+                raise IncompleteReadError(data, None)
+            # Do not search the part already looked at again
+            start = max(0, len(self._buffer) - len(separator) + 1)
+            await self._fill()
+
+        data = bytes(self._buffer[:end])
+        del self._buffer[:end]
+        return data
+
+    async def readline(self):
+        try:
+            return await self.readuntil(b'\n')
+        except IncompleteReadError as e:
+            return e.partial    # The last line without b'\n'
+
+
+class StreamWriter:
+    def __init__(self, sock, high=65536, low=16384):
+        self.sched = io_scheduler.sched
+        self.sock = sock
+        self.high = high        # drain() blocks when more than high bytes are queued
+        self.low = low          # and lets the writer go once they fall to low
+        self._chunks = deque()  # Queued output, the first one may be a partly sent memoryview
+        self._size = 0
+        self._writing = False   # Waiting for the socket to become writeable
+        self._drain_waiting = {}
+        self._closing = False
+        self._error = None
+        sock.setblocking(False)
+
+    def get_write_buffer_size(self):
+        return self._size
+
+    def write(self, data):
+        if self._closing:
+            raise ConnectionError('Writer is closed')
+        if self._error is not None:
+            raise self._error
+        if data:
+            self._chunks.append(data)
+            self._size += len(data)
+            self._start_writing()
+
+    def writelines(self, lines):
+        # All of them go out with one sendmsg(), e.g. responses to pipelined requests
+        if self._closing:
+            raise ConnectionError('Writer is closed')
+        if self._error is not None:
+            raise self._error
+        for data in lines:
+            if data:
+                self._chunks.append(data)
+                self._size += len(data)
+        self._start_writing()
+
+    def _start_writing(self):
+        if self._chunks and not self._writing:
+            self._flush()       # Try right away, most of the time the socket buffer has room
+            if self._chunks:
+                self._writing = True
+                self.sched.write_wait(self.sock, self._on_writable)
+
+    def _flush(self):
+        # One sendmsg() for all queued chunks instead of one send() per write()
+        while self._chunks:
+            try:
+                sent = self.sock.sendmsg(list(islice(self._chunks, IOV_MAX)))
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                self._error = e
+                self._chunks.clear()
+                self._size = 0
+                return
+            self._size -= sent
+            while sent:
+                chunk = self._chunks[0]
+                if sent >= len(chunk):
+                    sent -= len(chunk)
+                    self._chunks.popleft()
+                else:
+                    self._chunks[0] = memoryview(chunk)[sent:]
+                    sent = 0
+
+    def _on_writable(self):
+        self._flush()
+        if self._chunks:
+            self.sched.write_wait(self.sock, self._on_writable)
+            return
+        self._writing = False
+        if self._size <= self.low:
+            self._wake_drainers()
+        if self._closing:
+            self._close_socket()
+
+    def _wake_drainers(self):
+        self.sched.ready.extend(self._drain_waiting)
+        self._drain_waiting.clear()
+
+    async def drain(self):
+        if self._error is not None:
+            raise self._error
+        if self._size <= self.high:
+            return
+        while self._size > self.low and self._error is None:
+            task = self.sched.current
+            self._drain_waiting[task] = True
+            self.sched._park(partial(self._drain_waiting.pop, task, False))
+            await switch()
+        if self._error is not None:
+            raise self._error
+
+    def close(self):
+        # The socket is closed once everything queued has been sent
+        self._closing = True
+        if not self._writing:
+            self._close_socket()
+
+    def _close_socket(self):
+        poller = self.sched.poller
+        if not poller.has_reader(self.sock):
+            poller.discard(self.sock)       # Nobody waits on it, the registration goes before the descriptor
+            self.sock.close()
+            return
+        # A StreamReader of another task still waits on this socket. Dropping its waiter would leave it asleep
+        # forever, so the socket is shut down instead: the next poll wakes the reader and its recv() returns EOF.
+        # Expired timers run after the tasks that poll woke, so the descriptor is closed only after the read
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass        # Already reset by the peer, the reader gets the error
+        self.sched.call_later(0, self.sock.close)
+
+
+def open_streams(sock, **kwargs):
+    return StreamReader(sock), StreamWriter(sock, **kwargs)
+
+
+async def echo_lines(sock):
+    reader, writer = open_streams(sock)
+    while True:
+        line = await reader.readline()
+        if not line:
+            break
+        writer.write(b'Got:' + line)
+        await writer.drain()
+    writer.close()
+
+
+if __name__ == '__main__':
+    from socket import socket, AF_INET, SOCK_STREAM
+
+    async def tcp_server(addr):
+        sock = socket(AF_INET, SOCK_STREAM)
+        sock.bind(addr)
+        sock.listen(100)
+        while True:
+            client, addr = await io_scheduler.sched.accept(sock)
+            print('Connection from', addr)
+            io_scheduler.sched.new_task(echo_lines(client))
+
+    io_scheduler.sched.new_task(tcp_server(('', 30001)))
+    io_scheduler.sched.run()
+
+
+"""
+    Потоки(streams) поверх sched.recv() и sched.send(). sched.recv() читает столько байт, сколько успело прийти за
+    один вызов recv(), а sched.send() отправляет столько, сколько поместилось в буфер сокета, и возвращает это
+    количество. Поэтому сообщение может прийти по частям, а длинный ответ - отправиться не полностью, если результат
+    send() не проверять.
+
+    StreamReader - Копит принятые данные во внутреннем буфере bytearray и отдает их нужными кусками:
+    read(n) - До n байт из буфера, если буфер пуст, то ждет следующую порцию данных
+    readexactly(n) - Ровно n байт. Если соединение закрылось раньше, выбрасывает IncompleteReadError, в partial
+    которого лежит то, что успело прийти
+    readuntil(separator) - Данные до разделителя включительно. Поиск разделителя продолжается с того места, где
+    остановился в прошлый раз, а не с начала буфера. Если разделитель не найден в первых limit байтах, выбрасывается
+    LimitOverrunError, чтобы клиент не мог заставить сервер копить данные бесконечно
+    readline() - readuntil(b'\\n'), но последнюю строку без перевода строки отдает, а не выбрасывает ошибку
+
+    StreamWriter - write() не отправляет данные сам по себе, а кладет их в очередь и сразу пробует отправить. То, что не
+    поместилось в буфер сокета, отправляется, когда сокет снова станет доступен для записи(_on_writable).
+    Все накопленные куски отправляются одним вызовом sendmsg()(scatter-gather), без склеивания в один bytes. Если
+    кусок отправлен частично, то в очереди остается memoryview на неотправленную часть, а не копия.
+
+    drain() - Обратное давление(backpressure). Если клиент читает медленнее, чем сервер пишет, то очередь записи растет.
+    Когда в ней больше high байт, drain() усыпляет корутину до тех пор, пока очередь не уменьшится до low. Два порога
+    нужны, чтобы корутина не просыпалась и не засыпала снова на каждом отправленном куске. Пока очередь меньше high,
+    drain() возвращается сразу, не отдавая управление.
+
+    close() - Закрывает сокет, когда вся очередь записи будет отправлена. Снимается только регистрация самого писателя:
+    если из этого же сокета в другой задаче еще читает StreamReader, то сокет сначала закрывается на запись и чтение
+    через shutdown(). Читатель просыпается на следующем poll(), его recv() возвращает b''(EOF) или ошибку, а сам
+    дескриптор закрывается после этого через call_later(0). Раньше close() снимал с сокета всех ожидающих(discard), и
+    читатель больше не просыпался никогда.
+
+    Сокет переводится в неблокирующий режим: ожидание готовности все равно делает планировщик, а sendmsg() с большими
+    данными на блокирующем сокете остановил бы весь цикл.
+"""
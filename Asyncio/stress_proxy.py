@@ -0,0 +1,153 @@
+import socket
+import struct
+import sys
+import time
+
+import io_scheduler
+from io_scheduler import Scheduler, relay, gather
+from pollers import SelectorPoller, ConcurrentWaitError
+
+
+CLIENTS = 200
+WRITERS = 2         # Tasks writing into the same client socket at once
+FRAMES = 300        # Per writer
+FRAME = struct.Struct('!HI10x')     # Writer number, sequence number, padding to 16 bytes
+
+
+def listener():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    sock.listen(1024)
+    return sock
+
+
+async def upstream_server(sched, sock):
+    while True:
+        client, _ = await sched.accept(sock)
+        sched.new_task(pipe(client, client))      # Echo: everything read is written back
+
+
+async def proxy_server(sched, sock, upstream):
+    while True:
+        client, _ = await sched.accept(sock)
+        sched.new_task(proxy(sched, client, upstream))
+
+
+async def proxy(sched, client, upstream):
+    server = await sched.connect(upstream)
+    # Full duplex: one task reads the client and writes the server, the other one goes the other way,
+    # so each socket has a reader and a writer waiting at the same time
+    await gather(pipe(client, server), pipe(server, client))
+    client.close()
+    server.close()
+
+
+async def pipe(src, dst):
+    await relay(src, dst)
+    dst.shutdown(socket.SHUT_WR)    # Pass the end of data on
+
+
+async def writer(sched, sock, number):
+    for seq in range(FRAMES):
+        data = memoryview(FRAME.pack(number, seq))
+        while data:
+            data = data[await sched.send(sock, data):]
+
+
+async def reader(sched, sock):
+    received = bytearray()
+    while True:
+        data = await sched.recv(sock, 65536)
+        if not data:
+            return received
+        received += data
+
+
+async def client(sched, addr):
+    sock = await sched.connect(addr)
+    read = sched.new_task(reader(sched, sock))
+    # Several writers and a reader on one socket: both directions have waiters at once,
+    # and the write direction has more than one
+    await gather(*[writer(sched, sock, number) for number in range(WRITERS)])
+    sock.shutdown(socket.SHUT_WR)
+    received = await read
+    sock.close()
+
+    seqs = [[] for _ in range(WRITERS)]
+    for number, seq in FRAME.iter_unpack(received):
+        seqs[number].append(seq)
+    assert all(s == list(range(FRAMES)) for s in seqs), 'frames lost, duplicated or out of order'
+
+
+def run():
+    sched = io_scheduler.sched = Scheduler()
+    upstream, front = listener(), listener()
+    servers = [sched.new_task(upstream_server(sched, upstream)),
+               sched.new_task(proxy_server(sched, front, upstream.getsockname()))]
+
+    async def main():
+        try:
+            await gather(*[client(sched, front.getsockname()) for _ in range(CLIENTS)])
+        finally:
+            for task in servers:
+                task.cancel()
+
+    task = sched.new_task(main())
+    start = time.perf_counter()
+    sched.run()
+    elapsed = time.perf_counter() - start
+    upstream.close()
+    front.close()
+    return task, elapsed
+
+
+def main():
+    limit = CLIENTS * 4 + 64
+    if sys.platform != 'win32':
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft < limit:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (min(limit, hard), hard))
+
+    task, elapsed = run()
+    task.result()
+    total = CLIENTS * WRITERS * FRAMES * FRAME.size * 2     # Through the proxy and back
+    print(f'{CLIENTS} clients x {WRITERS} writers x {FRAMES} frames through the proxy and back: '
+          f'{elapsed:.2f}s, {total / elapsed / 2 ** 20:.1f} MB/s, all frames in order')
+
+    # Strict mode refuses a second waiter in the same direction, a reader and a writer are fine
+    poller = SelectorPoller(strict=True)
+    a, b = socket.socketpair()
+    poller.read_wait(a, 'reader')
+    poller.write_wait(a, 'writer')
+    try:
+        poller.write_wait(a, 'second writer')
+    except ConcurrentWaitError as e:
+        print('strict mode:', e)
+    else:
+        raise AssertionError('strict mode let two writers wait on one socket')
+    finally:
+        poller.close()
+        a.close()
+        b.close()
+
+
+if __name__ == '__main__':
+    main()
+
+
+"""
+    Нагрузочная проверка полнодуплексного прокси и нескольких ожидающих на одном сокете.
+
+    upstream_server - Эхо сервер: все прочитанное отправляет обратно(relay из сокета в него же).
+    proxy - На каждое соединение клиента открывает соединение к upstream и запускает две задачи relay: из клиента в
+    сервер и из сервера в клиента. Каждый сокет одновременно ждут читатель и писатель.
+
+    client - CLIENTS клиентов, у каждого WRITERS задач пишут кадры в один и тот же сокет, а одна задача читает ответ.
+    Несколько писателей на одном сокете означает несколько ожидающих записи в одном направлении. Раньше второй
+    ожидающий затирал первого и тот не просыпался никогда. Каждый кадр несет номер писателя и порядковый номер, поэтому
+    проверяется, что от каждого писателя пришли все кадры по порядку, без потерь и повторов.
+
+    Затем проверяется, что SelectorPoller(strict=True) разрешает читателя и писателя на одном сокете, а второй
+    писатель вызывает ConcurrentWaitError.
+"""
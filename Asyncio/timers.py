@@ -0,0 +1,306 @@
+import time
+import heapq
+
+
+class Timer:
+    __slots__ = ('deadline', 'func', '_store', '_slot', '_level')
+
+    def __init__(self, deadline, func, store):
+        self.deadline = deadline
+        self.func = func
+        self._store = store
+        self._slot = None
+        self._level = None
+
+    def cancel(self):
+        return self._store.cancel(self)
+
+    def cancelled(self):
+        return self.func is None
+
+
+class TimerHeap:
+    def __init__(self, compact_ratio=0.5, compact_min=64):
+        self._heap = []
+        self._sequence = 0       # Used to break ties in priority queue
+        self._cancelled = 0      # Tombstones still sitting in the heap
+        self.compact_ratio = compact_ratio
+        self.compact_min = compact_min
+
+    def __len__(self):
+        return len(self._heap) - self._cancelled
+
+    def push(self, deadline, func):
+        timer = Timer(deadline, func, self)
+        self._sequence += 1
+        heapq.heappush(self._heap, (deadline, self._sequence, timer))
+        timer._slot = self._heap
+        return timer
+
+    def cancel(self, timer):
+        if timer._slot is not None:
+            timer._slot = None
+            timer.func = None    # Left in the heap, skipped when popped
+            self._cancelled += 1
+            if self._cancelled >= self.compact_min and self._cancelled > len(self._heap) * self.compact_ratio:
+                self._compact()
+            return True
+        return False
+
+    def _compact(self):
+        # Rebuild the heap without tombstones: O(n), but only once per many cancels
+        self._heap[:] = [entry for entry in self._heap if entry[2].func is not None]
+        heapq.heapify(self._heap)
+        self._cancelled = 0
+
+    def next_deadline(self):
+        self._drop_cancelled()
+        return self._heap[0][0] if self._heap else None
+
+    def pop_expired(self, now):
+        expired = []
+        while self._heap and self._heap[0][0] <= now:
+            timer = heapq.heappop(self._heap)[2]
+            if timer.func is None:
+                self._cancelled -= 1
+            else:
+                timer._slot = None
+                expired.append(timer)
+        return expired
+
+    def _drop_cancelled(self):
+        while self._heap and self._heap[0][2].func is None:
+            heapq.heappop(self._heap)
+            self._cancelled -= 1
+
+
+class TimerWheel:
+    def __init__(self, resolution=0.001, bits=8, levels=4, origin=None):
+        self.resolution = resolution
+        self.origin = time.monotonic() if origin is None else origin
+        self._bits = bits
+        self._mask = (1 << bits) - 1
+        self._levels = levels
+        self._wheel = [[{} for _ in range(1 << bits)] for _ in range(levels)]
+        self._occupied = [0] * levels           # Per level, bit n is set while slot n has timers
+        self._next = None                       # Cached _next_cascade(), valid while upper levels do not change
+        self._next_known = False
+        self._overflow = {}                     # Timers beyond the last level
+        self._due = {}                          # Expired timers, not handed out yet
+        self._tick = 0
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    def push(self, deadline, func):
+        timer = Timer(deadline, func, self)
+        tick = int(-((self.origin - deadline) // self.resolution))    # Rounded up to a whole tick
+        self._place(timer, tick)
+        self._len += 1
+        return timer
+
+    def cancel(self, timer):
+        slot = timer._slot
+        if slot is not None:
+            tick = slot.pop(timer)
+            timer._slot = None
+            timer.func = None
+            level = timer._level
+            if not slot and slot is not self._due:
+                if level < self._levels:
+                    self._occupied[level] &= ~(1 << ((tick >> (self._bits * level)) & self._mask))
+                if level:
+                    self._next_known = False
+            self._len -= 1
+            return True
+        return False
+
+    def _place(self, timer, tick):
+        delta = tick - self._tick
+        if delta <= 0:
+            slot = self._due
+        else:
+            level = (delta.bit_length() - 1) // self._bits
+            if level < self._levels:
+                index = (tick >> (self._bits * level)) & self._mask
+                slot = self._wheel[level][index]
+                self._occupied[level] |= 1 << index
+            else:
+                level = self._levels
+                slot = self._overflow
+            if level:
+                self._next_known = False
+            timer._level = level
+        slot[timer] = tick
+        timer._slot = slot
+
+    def _next_slot(self, level):
+        # Tick at which the nearest occupied slot of this level comes up: the bitmap is searched
+        # from the current position onwards, then from its start, without looking at empty slots
+        shift = self._bits * level
+        block = self._tick >> shift
+        position = block & self._mask
+        occupied = self._occupied[level]
+        later = occupied >> (position + 1)
+        if later:
+            distance = (later & -later).bit_length()
+        else:
+            distance = (occupied & -occupied).bit_length() + self._mask - position
+        return (block + distance) << shift
+
+    def _next_cascade(self):
+        # Nearest tick at which an upper level slot moves its timers down
+        if self._next_known:
+            return self._next
+        nearest = None
+        for level in range(1, self._levels):
+            if self._occupied[level]:
+                tick = self._next_slot(level)
+                if nearest is None or tick < nearest:
+                    nearest = tick
+        if self._overflow:
+            step = 1 << (self._bits * self._levels)
+            tick = (self._tick // step + 1) * step
+            if nearest is None or tick < nearest:
+                nearest = tick
+        self._next = nearest
+        self._next_known = True
+        return nearest
+
+    def _cascade(self, tick):
+        bits, mask, wheel, occupied, due = self._bits, self._mask, self._wheel, self._occupied, self._due
+        for n in range(1, self._levels + 1):
+            if tick & ((1 << (bits * n)) - 1):
+                break
+            if n == self._levels:
+                slot = self._overflow
+            else:
+                index = (tick >> (bits * n)) & mask
+                slot = wheel[n][index]
+                occupied[n] &= ~(1 << index)
+            if not slot:
+                continue
+            self._next_known = False
+            timers = list(slot.items())
+            slot.clear()
+            # _place() inlined: every timer that lives long enough passes through here once per level
+            for timer, timer_tick in timers:
+                delta = timer_tick - tick
+                if delta <= 0:
+                    due[timer] = timer_tick
+                    timer._slot = due
+                    continue
+                level = (delta.bit_length() - 1) // bits
+                if level < self._levels:
+                    index = (timer_tick >> (bits * level)) & mask
+                    lower = wheel[level][index]
+                    occupied[level] |= 1 << index
+                else:
+                    lower = self._overflow
+                lower[timer] = timer_tick
+                timer._slot = lower
+                timer._level = level
+
+    def _advance(self, target):
+        mask = self._mask
+        wheel, occupied, due = self._wheel[0], self._occupied, self._due
+        while self._tick < target:
+            # Up to the next cascade only level 0 changes, its occupied slots are fired one after another
+            cascade = self._next_cascade()
+            limit = target if cascade is None or cascade > target else cascade
+            tick = self._tick
+            while occupied[0]:
+                position = tick & mask
+                later = occupied[0] >> (position + 1)
+                if later:
+                    tick += (later & -later).bit_length()
+                else:
+                    tick += (occupied[0] & -occupied[0]).bit_length() + mask - position
+                if tick > limit:
+                    break
+                index = tick & mask
+                slot = wheel[index]
+                for timer in slot:
+                    timer._slot = due
+                due.update(slot)
+                slot.clear()
+                occupied[0] &= ~(1 << index)
+            self._tick = limit
+            if limit == cascade:
+                self._cascade(limit)
+
+    def next_deadline(self):
+        if self._due:
+            return self.origin + self._tick * self.resolution
+        if not self._len:
+            return None
+
+        # Nearest tick at which a slot fires or cascades into lower levels
+        nearest = self._next_cascade()
+        if self._occupied[0]:
+            tick = self._next_slot(0)
+            if nearest is None or tick < nearest:
+                nearest = tick
+        return self.origin + nearest * self.resolution
+
+    def pop_expired(self, now):
+        self._advance(int((now - self.origin) // self.resolution))
+        if not self._due:
+            return []
+        expired = list(self._due)
+        self._due.clear()
+        for timer in expired:
+            timer._slot = None
+        self._len -= len(expired)
+        return expired
+
+
+"""
+    Хранилища таймеров для планировщика. Планировщик кладет в них функции, которые нужно вызвать в определенное
+    время(call_later, sleep), и забирает те, время которых наступило. Оба хранилища имеют одинаковый интерфейс,
+    поэтому одно можно подменить другим: Scheduler(timers=TimerWheel()).
+
+    push(deadline, func) - Кладет функцию с временем вызова и возвращает объект Timer
+    cancel(timer) - Отменяет таймер, то же самое делает timer.cancel(). Возвращает False, если таймер уже сработал
+    next_deadline() - Время ближайшего таймера, нужно для вычисления timeout у poll()
+    pop_expired(now) - Достает все таймеры, время которых наступило
+
+    Время везде берется из time.monotonic(). В отличии от time.time() эти часы никогда не идут назад. Если системное
+    время переведут назад(например синхронизация NTP), то таймеры на time.time() сработают позже, чем нужно, а если
+    вперед - то раньше.
+
+    TimerHeap - Куча(heapq), как и раньше была в планировщике. Вставка и извлечение стоят O(log n). Отмененный таймер
+    не удаляется из кучи, так как поиск в куче стоит O(n), а только помечается(func = None) и пропускается при извлечении.
+    Такие помеченные записи называются надгробиями(tombstones). Если таймеры в основном отменяются, то надгробия
+    копятся в куче и занимают память. Поэтому, когда их становится больше compact_ratio от размера кучи(и не меньше
+    compact_min), куча перестраивается без них(_compact) за O(n). Так как перестройка происходит только после
+    большого количества отмен, то в среднем на одну отмену она стоит O(1).
+
+    TimerWheel - Иерархическое колесо таймеров. Время делится на тики(resolution, по умолчанию 1 мс). Колесо состоит из
+    нескольких уровней(levels) по 2 ** bits слотов(по умолчанию 4 уровня по 256 слотов). Слот нулевого уровня - это
+    один тик, слот первого уровня - 256 тиков, второго - 256 * 256 тиков и т.д. Таймер кладется на тот уровень, в диапазон
+    которого попадает оставшееся до него время, в слот, вычисленный по номеру его тика. Таймеры дальше последнего
+    уровня(больше 49 дней при 1 мс) лежат в _overflow.
+
+    Слот - это словарь, поэтому вставка и отмена таймера стоят O(1): нужно лишь вычислить номер слота и добавить или
+    удалить ключ. Таймер помнит свой слот, поэтому при отмене его не нужно искать.
+
+    _advance - Двигает колесо до нужного тика. Срабатывают все таймеры из слотов нулевого уровня, которые оказались
+    на пути. Когда тик доходит до границы верхнего уровня(например каждые 256 тиков для первого уровня), таймеры из
+    соответствующего слота верхнего уровня перекладываются(cascade) на нижние уровни, так как до них осталось меньше
+    времени.
+    Пустые слоты не просматриваются: у каждого уровня есть битовая карта занятых слотов(_occupied, одно число int на
+    уровень, бит n установлен, пока в слоте n есть таймеры). Следующий занятый слот после текущего находится
+    сдвигом и выделением младшего бита(x & -x), поэтому колесо прыгает от одного занятого слота к другому, а не идет
+    по одному тику, и next_deadline() не перебирает до levels * 256 слотов. Ближайший тик перекладывания верхних
+    уровней(_next_cascade) запоминается и вычисляется заново, только когда на верхних уровнях что то изменилось.
+
+    Колесо не срабатывает раньше времени: тик таймера округляется вверх, поэтому таймер может опоздать не больше чем
+    на один тик(resolution).
+
+    Колесо задумано для случая, когда таймеров очень много и большая часть из них отменяется, не дожив до
+    срабатывания(таймауты соединений). Но в CPython куча(heapq) написана на C, а колесо на Python, и по замерам
+    bench_timers.py колесо кучу не обгоняет: извлечение примерно наравне, вставка медленнее, отмена чуть быстрее.
+    Поэтому по умолчанию планировщик использует TimerHeap.
+"""